@@ -8,20 +8,12 @@ CLASS: CPSC 326
 
 import argparse
 import sys
-import io
-import subprocess
 
 from mypl_iowrapper import FileWrapper, StdInWrapper
 from mypl_error import MyPLError
-from mypl_lexer import Lexer
-from mypl_token import TokenType, Token
-from mypl_simple_parser import SimpleParser
-from mypl_ast_parser import ASTParser
-from mypl_printer import PrintVisitor
-from mypl_semantic_checker import SemanticChecker
-from mypl_code_gen import CodeGenerator
-from mypl_vm import VM
-from mypl_translator import Translator
+
+# each mode imports the stages it uses (when it runs), so that a run
+# only pays for loading the modules it needs
 
 
 def run_lex_mode(in_stream):
@@ -32,6 +24,8 @@ def run_lex_mode(in_stream):
         in_stream -- A wrapped input stream containing a mypl program.
 
     """
+    from mypl_lexer import Lexer
+    from mypl_token import TokenType
     try: 
         lexer = Lexer(in_stream)
         t = lexer.next_token()
@@ -54,6 +48,8 @@ def run_parse_mode(in_stream):
         in_stream -- A wrapped input stream containing a mypl program.
 
     """
+    from mypl_lexer import Lexer
+    from mypl_simple_parser import SimpleParser
     try: 
         lexer = Lexer(in_stream)
         parser = SimpleParser(lexer)
@@ -72,6 +68,9 @@ def run_print_mode(in_stream):
         in_stream -- A wrapped input stream containing a mypl program.
 
     """
+    from mypl_lexer import Lexer
+    from mypl_ast_parser import ASTParser
+    from mypl_printer import PrintVisitor
     try: 
         lexer = Lexer(in_stream)
         parser = ASTParser(lexer)
@@ -84,18 +83,26 @@ def run_print_mode(in_stream):
 
         
     
-def run_check_mode(in_stream):
+def run_check_mode(in_stream, jobs=1):
     """Runs the semantic checker on the given mypl program any prints any
     semantic errors it finds. If no errors, the mypl program is
     considered semantically well formed.
 
     Args: 
         in_stream -- A wrapped input stream containing a mypl program.
+        jobs -- The number of processes to lex and parse the program in
+                (see mypl_parallel; one per CPU if 0).
 
     """
+    from mypl_lexer import Lexer
+    from mypl_ast_parser import ASTParser
+    from mypl_semantic_checker import SemanticChecker
     try: 
-        lexer = Lexer(in_stream)
-        parser = ASTParser(lexer)
+        if jobs == 1:
+            parser = ASTParser(Lexer(in_stream))
+        else:
+            from mypl_parallel import ParallelParser
+            parser = ParallelParser(in_stream, jobs)
         ast = parser.parse()
         visitor = SemanticChecker()
         ast.accept(visitor)
@@ -104,27 +111,102 @@ def run_check_mode(in_stream):
         exit(1)
 
 
+def run_watch_mode(filename, interval=0.5):
+    """Runs the semantic checker on the given mypl program file, as in
+    check mode, and again each time the file changes (until
+    interrupted), printing any error or "ok". Each check only re-lexes
+    and re-parses the definitions that changed (see mypl_incremental).
 
-    
-def run_ir_mode(in_stream):
+    Args:
+        filename -- The name of the mypl program file.
+        interval -- The seconds between checks for changes to the file.
+
+    """
+    import os
+    import time
+    from mypl_incremental import IncrementalParser, text_edit
+    from mypl_semantic_checker import SemanticChecker
+    parser = None
+    modified = None
+    try:
+        while True:
+            try:
+                source = None
+                mtime = os.stat(filename).st_mtime_ns
+                if mtime != modified:
+                    with open(filename, 'r', encoding='utf-8') as program_file:
+                        source = program_file.read()
+                    modified = mtime
+            except OSError:
+                # (e.g., while an editor replaces the file)
+                source = None
+            if source is not None:
+                if parser is None:
+                    parser = IncrementalParser(source)
+                else:
+                    parser.edit(*text_edit(parser.source, source))
+                try:
+                    ast = parser.parse()
+                    ast.accept(SemanticChecker())
+                    print('ok', flush=True)
+                except MyPLError as ex:
+                    print(ex, flush=True)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+
+
+def run_ir_mode(in_stream, fast=False, registers=False, optimize=False, jobs=1):
     """Generates the intermediate representation (VM instructions) for the
     given mypl program and prints to standard output the resulting
     instructions.
 
     Args: 
         in_stream -- A wrapped input stream containing a mypl program.
+        fast -- If true, prints the python code of the fast mode instead.
+        registers -- If true, prints the register IR instead of the stack IR.
+        optimize -- If true, prints the instructions after constant folding
+                    and the peephole optimizer, along with the instruction
+                    counts before the peephole optimizer and after.
+        jobs -- The number of processes to lex and parse the program in
+                (see mypl_parallel; one per CPU if 0).
 
     """
+    from mypl_lexer import Lexer
+    from mypl_ast_parser import ASTParser
+    from mypl_semantic_checker import SemanticChecker
+    from mypl_const_folder import ConstantFolder
+    from mypl_code_gen import CodeGenerator
+    from mypl_optimizer import PeepholeOptimizer
+    from mypl_compiler import FrameCompiler
+    from mypl_vm import VM
     try: 
-        lexer = Lexer(in_stream)
-        parser = ASTParser(lexer)
+        if jobs == 1:
+            parser = ASTParser(Lexer(in_stream))
+        else:
+            from mypl_parallel import ParallelParser
+            parser = ParallelParser(in_stream, jobs)
         ast = parser.parse()
         visitor = SemanticChecker()
         ast.accept(visitor)
+        if optimize:
+            ast.accept(ConstantFolder())
         vm = VM()
-        codegen = CodeGenerator(vm)
+        # the fast mode compiles the stack IR
+        codegen = CodeGenerator(vm, registers and not fast)
         ast.accept(codegen)
-        print(vm)
+        if optimize:
+            before, after = PeepholeOptimizer().optimize(vm)
+        if fast:
+            compiler = FrameCompiler(vm)
+            compiler.compile()
+            print(compiler.source)
+        else:
+            print(vm)
+        if optimize:
+            print(f'Instructions: {before} -> {after}')
     except MyPLError as ex:
         print(ex)
         exit(1)
@@ -138,6 +220,10 @@ def run_translate(in_stream):
         in_stream -- A wrapped input stream containing a mypl program.
         
     """
+    from mypl_lexer import Lexer
+    from mypl_ast_parser import ASTParser
+    from mypl_semantic_checker import SemanticChecker
+    from mypl_translator import Translator
     try:
         lexer = Lexer(in_stream)
         parser = ASTParser(lexer)
@@ -150,24 +236,115 @@ def run_translate(in_stream):
         print(ex)
         exit(1)
     
-def run_normal_mode(in_stream):
+def run_normal_mode(in_stream, fast=False, registers=False, optimize=False,
+                    gc_threshold=10000, gc_stats=False, memo=False,
+                    memo_stats=False, profile=False, profile_json=None,
+                    sample=None, sample_interval=None, sample_instructions=False,
+                    sample_pcs=False, trace=None, cache_file=None, jobs=1):
     """Executes the given mypl program. Any output produced by the program
     is printed to standard output. 
 
     Args: 
         in_stream -- A wrapped input stream containing a mypl program.
+        fast -- If true, runs the program compiled to python functions
+                instead of on the VM.
+        registers -- If true, runs the register IR on the VM.
+        optimize -- If true, runs constant folding and the peephole
+                    optimizer before running.
+        gc_threshold -- The (minimum) number of allocations between
+                        garbage collections (0 to never collect).
+        gc_stats -- If true, prints garbage collector statistics (to
+                    standard error) after the program runs.
+        memo -- If true, caches the results of pure functions.
+        memo_stats -- If true, prints the cache hits and misses of each
+                      memoized function (to standard error) after the
+                      program runs.
+        profile -- If true, profiles the program on the VM and prints
+                   the report (to standard error) after it runs.
+        profile_json -- The name of a file to write the profile report
+                        to as JSON (profiling the program), if any.
+        sample -- The name of a file to write the VM call stacks sampled
+                  while the program runs to (as collapsed stacks), if any.
+        sample_interval -- The seconds (of CPU time), or instructions,
+                           between samples.
+        sample_instructions -- If true, samples by instruction count
+                               instead of by time.
+        sample_pcs -- If true, includes the pcs in the sampled stacks.
+        trace -- The name of a file to write a binary trace of the
+                 executed instructions to (see mypl_trace), if any.
+        cache_file -- The name of the program file, to load the compiled
+                      program from (or store it in) its cache (see
+                      mypl_cache), if any.
+        jobs -- The number of processes to lex and parse the program in
+                (see mypl_parallel; one per CPU if 0).
 
     """
+    from mypl_vm import VM
+    from mypl_cache import CodeCache
     try: 
-        lexer = Lexer(in_stream)
-        parser = ASTParser(lexer)
-        ast = parser.parse()
-        visitor = SemanticChecker()
-        ast.accept(visitor)
-        vm = VM()
-        codegen = CodeGenerator(vm)
-        ast.accept(codegen)
-        vm.run()
+        vm = VM(gc_threshold)
+        # the fast mode compiles the stack IR
+        registers = registers and not fast
+        cache = CodeCache(cache_file, registers, optimize) if cache_file else None
+        pure = cache.load(vm) if cache else None
+        if pure is None:
+            from mypl_lexer import Lexer
+            from mypl_ast_parser import ASTParser
+            from mypl_semantic_checker import SemanticChecker
+            from mypl_const_folder import ConstantFolder
+            from mypl_code_gen import CodeGenerator
+            from mypl_optimizer import PeepholeOptimizer
+            from mypl_memo import pure_functions
+            if jobs == 1:
+                parser = ASTParser(Lexer(in_stream))
+            else:
+                from mypl_parallel import ParallelParser
+                parser = ParallelParser(in_stream, jobs)
+            ast = parser.parse()
+            visitor = SemanticChecker()
+            ast.accept(visitor)
+            if optimize:
+                ast.accept(ConstantFolder())
+            codegen = CodeGenerator(vm, registers)
+            ast.accept(codegen)
+            if optimize:
+                PeepholeOptimizer().optimize(vm)
+            pure = pure_functions(ast)
+            if cache:
+                cache.store(vm, pure)
+        caches = []
+        if memo:
+            from mypl_memo import memoize_functions
+            caches = memoize_functions(vm, pure)
+        if fast:
+            from mypl_compiler import FrameCompiler
+            FrameCompiler(vm).run()
+        elif trace:
+            from mypl_trace import TraceRecorder
+            with open(trace, 'wb') as trace_file:
+                TraceRecorder(vm, trace_file).run()
+        elif sample:
+            from mypl_profile import SamplingProfiler
+            sampler = SamplingProfiler(vm, sample_interval, sample_instructions, sample_pcs)
+            sampler.run()
+            with open(sample, 'w') as sample_file:
+                sampler.write_collapsed(sample_file)
+        elif profile or profile_json:
+            from mypl_profile import Profiler
+            profiler = Profiler(vm)
+            profiler.run()
+            if profile_json:
+                with open(profile_json, 'w') as json_file:
+                    profiler.write_json(json_file)
+            else:
+                profiler.print_report(sys.stderr)
+        else:
+            vm.run()
+        if gc_stats and not fast:
+            print(vm.gc.stats, file=sys.stderr)
+        if memo_stats:
+            for cache in caches:
+                print(f'memo {cache}', file=sys.stderr)
     except MyPLError as ex:
         print(ex)
         exit(1)
@@ -194,6 +371,40 @@ if __name__ == '__main__':
     group.add_argument('--ir', action='store_true', help=help_msg)
     help_msg = 'creates a rust file equivalent to the input mypl file'
     group.add_argument('--rust', action='store_true', help=help_msg)    
+    help_msg = 'runs (or with --ir, displays) the program compiled to python'
+    argparser.add_argument('--fast', action='store_true', help=help_msg)
+    help_msg = 'runs (or with --ir, displays) the register-based IR'
+    argparser.add_argument('--reg', action='store_true', help=help_msg)
+    help_msg = 'runs (or with --ir, displays) the optimized instructions'
+    argparser.add_argument('--opt', action='store_true', help=help_msg)
+    help_msg = 'minimum allocations between garbage collections (0 disables)'
+    argparser.add_argument('--gc-threshold', type=int, default=10000, help=help_msg)
+    help_msg = 'prints garbage collector statistics after running'
+    argparser.add_argument('--gc-stats', action='store_true', help=help_msg)
+    help_msg = 'caches the results of pure functions'
+    argparser.add_argument('--memo', action='store_true', help=help_msg)
+    help_msg = 'prints the cache hits and misses of memoized functions (implies --memo)'
+    argparser.add_argument('--memo-stats', action='store_true', help=help_msg)
+    help_msg = 'prints a profile of the functions and opcodes run (ignored with --fast)'
+    argparser.add_argument('--profile', action='store_true', help=help_msg)
+    help_msg = 'writes the profile to the file as JSON (ignored with --fast)'
+    argparser.add_argument('--profile-json', metavar='FILE', help=help_msg)
+    help_msg = 'writes sampled call stacks to the file for flame graphs (ignored with --fast)'
+    argparser.add_argument('--sample', metavar='FILE', help=help_msg)
+    help_msg = 'seconds of CPU time (or instructions) between samples'
+    argparser.add_argument('--sample-interval', type=float, metavar='N', help=help_msg)
+    help_msg = 'samples every --sample-interval instructions instead of by time'
+    argparser.add_argument('--sample-instructions', action='store_true', help=help_msg)
+    help_msg = 'labels the sampled functions with their pcs'
+    argparser.add_argument('--sample-pcs', action='store_true', help=help_msg)
+    help_msg = 'writes a binary trace of the instructions run (see mypl_trace.py)'
+    argparser.add_argument('--trace', metavar='FILE', help=help_msg)
+    help_msg = 'always compiles the program (without reading or writing its cache)'
+    argparser.add_argument('--no-cache', action='store_true', help=help_msg)
+    help_msg = 'lexes and parses large programs in N processes (0 for one per CPU)'
+    argparser.add_argument('--jobs', type=int, default=1, metavar='N', help=help_msg)
+    help_msg = 'with --check, checks the file again each time it changes'
+    argparser.add_argument('--watch', action='store_true', help=help_msg)
     help_msg = 'mypl program file (optional)'
     argparser.add_argument('filename', nargs='?', help=help_msg)
     args = argparser.parse_args()
@@ -212,14 +423,22 @@ if __name__ == '__main__':
         run_parse_mode(in_stream)
     elif args.print:
         run_print_mode(in_stream)
+    elif args.check and args.watch and args.filename:
+        run_watch_mode(args.filename)
     elif args.check:
-        run_check_mode(in_stream)
+        run_check_mode(in_stream, args.jobs)
     elif args.ir:
-        run_ir_mode(in_stream)
+        run_ir_mode(in_stream, args.fast, args.reg, args.opt, args.jobs)
     elif args.rust:
         run_translate(in_stream)
     else:
-        run_normal_mode(in_stream)
+        run_normal_mode(in_stream, args.fast, args.reg, args.opt,
+                        args.gc_threshold, args.gc_stats,
+                        args.memo or args.memo_stats, args.memo_stats,
+                        args.profile, args.profile_json, args.sample,
+                        args.sample_interval, args.sample_instructions,
+                        args.sample_pcs, args.trace,
+                        None if args.no_cache else args.filename, args.jobs)
     # close the (wrapped) input stream
     in_stream.close()
 
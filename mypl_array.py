@@ -0,0 +1,98 @@
+"""Compact storage for MyPL int, double, and bool arrays.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+Arrays of structs and strings are plain Python lists. Arrays of ints,
+doubles, and bools are TypedArrays, which keep their values unboxed in
+an array.array along with a bitmap (one byte per element) marking the
+null elements. A TypedArray holding a value that does not fit its
+storage (e.g., an int beyond 64 bits) switches to a Python list, so
+indexing behaves exactly like a list of the stored values.
+
+"""
+
+from array import array
+
+
+# element type name -> (array typecode, python type of the elements)
+TYPED_ELEMENTS = {
+    'int': ('q', int),
+    'double': ('d', float),
+    'bool': ('B', bool),
+}
+
+
+class TypedArray:
+
+    __slots__ = ('values', 'nulls', 'kind')
+
+    def __init__(self, typecode, kind, size):
+        """Creates an array of the given size with all elements null.
+
+        Args:
+            typecode -- The array.array typecode of the storage.
+            kind -- The python type of the elements.
+            size -- The number of elements.
+
+        """
+        self.values = array(typecode, [0]) * size
+        self.nulls = bytearray(b'\x01') * size
+        self.kind = kind
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+    def __getitem__(self, index):
+        if self.nulls is None:
+            return self.values[index]
+        if self.nulls[index]:
+            return None
+        if self.kind is bool:
+            return self.values[index] == 1
+        return self.values[index]
+
+
+    def __setitem__(self, index, value):
+        if self.nulls is None:
+            self.values[index] = value
+        elif value is None:
+            self.nulls[index] = 1
+        elif type(value) is self.kind:
+            try:
+                self.values[index] = value
+                self.nulls[index] = 0
+            except OverflowError:
+                self.generalize()
+                self.values[index] = value
+        else:
+            self.generalize()
+            self.values[index] = value
+
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+    def generalize(self):
+        """Switches the storage to a python list of the element values."""
+        self.values = list(self)
+        self.nulls = None
+
+
+
+def new_array(element_type, size):
+    """Returns a new array (all null) for the given element type.
+
+    Args:
+        element_type -- The element type name (None for struct arrays).
+        size -- The number of elements.
+
+    """
+    if element_type in TYPED_ELEMENTS:
+        typecode, kind = TYPED_ELEMENTS[element_type]
+        return TypedArray(typecode, kind, size)
+    return [None] * size
@@ -0,0 +1,210 @@
+"""Benchmark driver for timing the MyPL VM over a set of programs.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+With --startup, each program is instead run by mypl.py in a new python
+process, timing the cold start: from launching the process to the VM
+running the first instruction, and to the process exiting.
+
+"""
+
+import argparse
+import glob
+import io
+import os
+import subprocess
+import sys
+import time
+
+from mypl_iowrapper import FileWrapper
+from mypl_error import MyPLError
+from mypl_lexer import Lexer
+from mypl_ast_parser import ASTParser
+from mypl_semantic_checker import SemanticChecker
+from mypl_code_gen import CodeGenerator
+from mypl_vm import VM
+from mypl_compiler import FrameCompiler
+from mypl_const_folder import ConstantFolder
+from mypl_optimizer import PeepholeOptimizer
+
+
+def compile_program(filename, registers=False, optimize=False):
+    """Runs the front end and code generator over the given mypl file,
+    returning the resulting frame templates.
+
+    Args:
+        filename -- The mypl program file to compile.
+        registers -- If true, generates the register IR.
+        optimize -- If true, applies the --opt optimizations.
+
+    """
+    in_stream = FileWrapper(open(filename, 'r', encoding='utf-8'))
+    try:
+        ast = ASTParser(Lexer(in_stream)).parse()
+        ast.accept(SemanticChecker())
+        if optimize:
+            ast.accept(ConstantFolder())
+        vm = VM()
+        ast.accept(CodeGenerator(vm, registers))
+        if optimize:
+            PeepholeOptimizer().optimize(vm)
+    finally:
+        in_stream.close()
+    return vm.frame_templates
+
+
+def time_run(templates, repeat, fast=False):
+    """Returns the best wall time (in seconds) of running the given
+    frame templates on a fresh VM, discarding the program output.
+
+    Args:
+        templates -- The frame templates to run.
+        repeat -- The number of runs to take the best time of.
+        fast -- If true, times the compiled (fast mode) functions
+                instead of the VM (compile time is excluded).
+
+    """
+    best = None
+    for _ in range(repeat):
+        vm = VM(output=io.StringIO())
+        vm.frame_templates = templates
+        runner = vm
+        if fast:
+            runner = FrameCompiler(vm)
+            runner.compile()
+        start = time.perf_counter()
+        runner.run()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+# run by each startup timing process (with the mypl.py arguments): runs
+# mypl.py, writing the (monotonic) time the VM starts running the program
+# to standard error
+STARTUP_PROBE = """
+import runpy, sys, time
+import mypl_vm
+run_loop = mypl_vm.VM.run_loop
+def first_instruction(vm, frame):
+    print(f'@first {time.monotonic()}', file=sys.stderr, flush=True)
+    return run_loop(vm, frame)
+mypl_vm.VM.run_loop = first_instruction
+sys.argv = ['mypl.py'] + sys.argv[1:]
+runpy.run_path('mypl.py', run_name='__main__')
+"""
+
+
+def time_startup(args, repeat):
+    """Returns the best times (in seconds) from launching a process
+    running mypl.py with the given arguments to its first VM instruction
+    (None if it did not run one) and to its exit.
+
+    Args:
+        args -- The mypl.py arguments.
+        repeat -- The number of runs to take the best times of.
+
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    best_first = best_total = None
+    for _ in range(repeat):
+        start = time.monotonic()
+        result = subprocess.run([sys.executable, '-c', STARTUP_PROBE] + args, cwd=directory,
+                                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, text=True)
+        total = time.monotonic() - start
+        for line in result.stderr.splitlines():
+            if line.startswith('@first '):
+                first = float(line.split()[1]) - start
+                if best_first is None or first < best_first:
+                    best_first = first
+        if best_total is None or total < best_total:
+            best_total = total
+    return best_first, best_total
+
+
+def run_startup_benchmarks(filenames, repeat):
+    """Times the cold start of each program (with its compiled program
+    cache, and without) and prints a table of the results, after the
+    start time of the python interpreter itself.
+
+    Args:
+        filenames -- The mypl program files to benchmark.
+        repeat -- The number of runs per program.
+
+    """
+    print(f'{"program":<40}{"first instr":>14}{"total":>10}')
+    best = None
+    for _ in range(repeat):
+        start = time.monotonic()
+        subprocess.run([sys.executable, '-c', 'pass'])
+        elapsed = time.monotonic() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    print(f'{"(python interpreter)":<40}{"":>14}{best:>10.4f}')
+    for filename in filenames:
+        path = os.path.abspath(filename)
+        # (the first run stores the program in its cache)
+        for label, args in [('', [path]), (' --no-cache', ['--no-cache', path])]:
+            first, total = time_startup(args, repeat)
+            first = f'{first:>14.4f}' if first is not None else f'{"-":>14}'
+            print(f'{filename + label:<40}{first}{total:>10.4f}')
+
+
+def run_benchmarks(filenames, repeat, fast=False, registers=False, optimize=False):
+    """Times each program and prints a table of the results (one column
+    per mode timed).
+
+    Args:
+        filenames -- The mypl program files to benchmark.
+        repeat -- The number of runs per program.
+        fast -- If true, times the fast (compiled) mode instead of the
+                stack IR on the VM.
+        registers -- If true, also times the register IR on the VM.
+        optimize -- If true, times the optimized (--opt) programs.
+
+    """
+    modes = [('fast', False, True) if fast else ('stack', False, False)]
+    if registers:
+        modes.append(('register', True, False))
+    totals = [0.0] * len(modes)
+    print(f'{"program":<40}' + ''.join(f'{name:>12}' for name, _, _ in modes))
+    for filename in filenames:
+        row = f'{filename:<40}'
+        try:
+            for i, (_, regs, compiled) in enumerate(modes):
+                templates = compile_program(filename, regs, optimize)
+                elapsed = time_run(templates, repeat, compiled)
+                totals[i] += elapsed
+                row += f'{elapsed:>12.4f}'
+        except MyPLError as ex:
+            row += f'{"error":>12}  {ex}'
+        print(row)
+    print(f'{"total":<40}' + ''.join(f'{total:>12.4f}' for total in totals))
+
+
+if __name__ == '__main__':
+    about = 'Time the mypl VM over a set of programs (default: test_files/).'
+    argparser = argparse.ArgumentParser(prog='mypl_bench', description=about)
+    help_msg = 'number of runs per program (best time is reported)'
+    argparser.add_argument('-r', '--repeat', type=int, default=3, help=help_msg)
+    help_msg = 'time the fast (compiled to python) mode instead of the VM'
+    argparser.add_argument('--fast', action='store_true', help=help_msg)
+    help_msg = 'also time the register IR (to compare with the stack IR)'
+    argparser.add_argument('--reg', action='store_true', help=help_msg)
+    help_msg = 'time the optimized (--opt) programs'
+    argparser.add_argument('--opt', action='store_true', help=help_msg)
+    help_msg = 'time the cold start of mypl.py (default: test_files/1-HelloWorld.mypl)'
+    argparser.add_argument('--startup', action='store_true', help=help_msg)
+    help_msg = 'mypl program files to time'
+    argparser.add_argument('filenames', nargs='*', help=help_msg)
+    args = argparser.parse_args()
+    if args.startup:
+        filenames = args.filenames or ['test_files/1-HelloWorld.mypl']
+        run_startup_benchmarks(filenames, args.repeat)
+    else:
+        filenames = args.filenames or sorted(glob.glob('test_files/*.mypl'))
+        run_benchmarks(filenames, args.repeat, args.fast, args.reg, args.opt)
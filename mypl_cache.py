@@ -0,0 +1,128 @@
+"""Cache of compiled MyPL programs.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+Running a program file stores its compiled frame templates (and the
+names of its pure functions, for --memo) in a .myplc file in a
+__myplcache__ directory next to it. Later runs of the same file load
+the templates instead of lexing, parsing, checking, and generating code
+again. Each cache file holds the key it was compiled under: a hash of
+the program source, the options that change the generated code (--reg
+and --opt), and the source of the compiler modules themselves. A cache
+file is only used if its key matches, so changing any of these
+recompiles the program (and replaces the cache file). A cache file
+that cannot be read, or written, is ignored.
+
+"""
+
+import hashlib
+import marshal
+import os
+
+from mypl_opcode import OpCode
+from mypl_frame import VMFrameTemplate, VMInstr
+
+
+# identifies a cache file (and its format)
+CACHE_MAGIC = b'MYPLC1\n'
+
+# directory (next to the program file) holding the cache files
+CACHE_DIR = '__myplcache__'
+
+# modules whose code determines the compiled frame templates
+COMPILER_MODULES = ['mypl_ast.py', 'mypl_ast_parser.py', 'mypl_cache.py',
+                    'mypl_code_gen.py', 'mypl_const_folder.py', 'mypl_frame.py',
+                    'mypl_lexer.py', 'mypl_memo.py', 'mypl_opcode.py',
+                    'mypl_optimizer.py', 'mypl_register.py',
+                    'mypl_semantic_checker.py', 'mypl_symbol_table.py',
+                    'mypl_token.py', 'mypl_var_table.py']
+
+# hash of the compiler modules (computed on first use)
+compiler_hash = None
+
+
+def compiler_version():
+    """Returns a hash of the source of the compiler modules."""
+    global compiler_hash
+    if compiler_hash is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for module in COMPILER_MODULES:
+            with open(os.path.join(directory, module), 'rb') as module_file:
+                digest.update(module_file.read())
+        compiler_hash = digest.hexdigest()
+    return compiler_hash
+
+
+class CodeCache:
+
+    def __init__(self, filename, registers=False, optimize=False):
+        """Creates the cache of a program file.
+
+        Args:
+            filename -- The name of the program file.
+            registers -- If true, the program is compiled to register IR.
+            optimize -- If true, the program is optimized.
+
+        """
+        options = ('reg.' if registers else '') + ('opt.' if optimize else '')
+        with open(filename, 'rb') as program_file:
+            source = program_file.read()
+        digest = hashlib.sha256(compiler_version().encode('ascii'))
+        digest.update(options.encode('ascii') + b'\0' + source)
+        self.key = digest.hexdigest()
+        directory, name = os.path.split(filename)
+        self.directory = os.path.join(directory, CACHE_DIR)
+        stem = name[:-len('.mypl')] if name.endswith('.mypl') else name
+        self.path = os.path.join(self.directory, f'{stem}.{options}myplc')
+
+
+    def load(self, vm):
+        """Adds the cached frame templates to the VM and returns the
+        names of the pure functions, or returns None (leaving the VM
+        unchanged) if there is no valid cache file for the program.
+
+        """
+        try:
+            with open(self.path, 'rb') as cache_file:
+                data = cache_file.read()
+            if not data.startswith(CACHE_MAGIC):
+                return None
+            key, functions, pure_functions = marshal.loads(data[len(CACHE_MAGIC):])
+            if key != self.key:
+                return None
+            templates = []
+            for name, arg_count, var_count, instructions in functions:
+                template = VMFrameTemplate(name, arg_count, var_count=var_count)
+                template.instructions = [VMInstr(OpCode(opcode), operand, comment)
+                                         for opcode, operand, comment in instructions]
+                templates.append(template)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        for template in templates:
+            vm.add_frame_template(template)
+        return list(pure_functions)
+
+
+    def store(self, vm, pure_functions):
+        """Writes the VM's frame templates and the names of the pure
+        functions to the cache file.
+
+        """
+        functions = [(template.function_name, template.arg_count, template.var_count,
+                      [(int(instr.opcode), instr.operand, instr.comment)
+                       for instr in template.instructions])
+                     for template in vm.frame_templates.values()]
+        try:
+            data = marshal.dumps((self.key, functions, list(pure_functions)))
+            os.makedirs(self.directory, exist_ok=True)
+            # (replaced in one step, so a concurrent run never reads a
+            # partly written file)
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as cache_file:
+                cache_file.write(CACHE_MAGIC + data)
+            os.replace(temp_path, self.path)
+        except (OSError, ValueError):
+            pass
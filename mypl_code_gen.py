@@ -12,18 +12,24 @@ from mypl_var_table import *
 from mypl_frame import *
 from mypl_opcode import *
 from mypl_vm import *
+from mypl_register import lower_to_registers
+from mypl_semantic_checker import BUILT_INS
 
 
 class CodeGenerator (Visitor):
 
-    def __init__(self, vm):
+    def __init__(self, vm, registers=False):
         """Creates a new Code Generator given a VM. 
         
         Args:
             vm -- The target vm.
+            registers -- If true, generates the register IR (see
+                         mypl_register) instead of the stack IR.
         """
         # the vm to add frames to
         self.vm = vm
+        # whether to lower each frame template to the register IR
+        self.registers = registers
         # the current frame template being generated
         self.curr_template = None
         # for var -> index mappings wrt to environments
@@ -36,6 +42,34 @@ class CodeGenerator (Visitor):
         """Helper function to add an instruction to the current template."""
         self.curr_template.instructions.append(instr)
 
+
+    def tail_call(self, expr):
+        """Returns the call expression if the (returned) expression is
+        only a call to a user-defined function, and None otherwise.
+
+        Args:
+            expr -- The return statement expression.
+        """
+        if expr.op != None or expr.not_op or not isinstance(expr.first, SimpleTerm):
+            return None
+        rvalue = expr.first.rvalue
+        if isinstance(rvalue, CallExpr) and rvalue.fun_name.lexeme not in BUILT_INS:
+            return rvalue
+        return None
+
+
+    def field_ref(self, data_type, field_name):
+        """Returns the offset and type of a field of the given struct type.
+
+        Args:
+            data_type -- The (struct) type of the object.
+            field_name -- The field name.
+        """
+        struct_def = self.struct_defs[data_type.type_name.lexeme]
+        for offset, field in enumerate(struct_def.fields):
+            if field.var_name.lexeme == field_name:
+                return offset, field.data_type
+
         
     def visit_program(self, program):
         for struct_def in program.struct_defs:
@@ -51,12 +85,13 @@ class CodeGenerator (Visitor):
     def visit_fun_def(self, fun_def):
         # TODO
         
-        self.curr_template = VMFrameTemplate(fun_def.fun_name.lexeme, len(fun_def.params))
+        arg_count = len(fun_def.params)
+        self.curr_template = VMFrameTemplate(fun_def.fun_name.lexeme, arg_count,
+                                             var_count=arg_count)
         self.var_table.push_environment()
+        # the call copies the arguments into the first variable slots
         for var in fun_def.params:
-            self.var_table.add(var.var_name.lexeme)
-            idx = self.var_table.get(var.var_name.lexeme)
-            self.add_instr(STORE(idx))
+            self.var_table.add(var.var_name.lexeme, var.data_type)
         for stmt in fun_def.stmts:
             stmt.accept(self)
         
@@ -64,19 +99,30 @@ class CodeGenerator (Visitor):
             self.add_instr(PUSH(None))
             self.add_instr(RET())
         
+        if self.registers:
+            lower_to_registers(self.curr_template)
         self.vm.add_frame_template(self.curr_template)
         self.var_table.pop_environment()
 
     def visit_return_stmt(self, return_stmt):
         # TODO
+        call_expr = self.tail_call(return_stmt.expr)
+        if call_expr != None:
+            # the callee returns directly to this function's caller
+            for arg in call_expr.args:
+                arg.accept(self)
+            self.add_instr(TAILCALL(call_expr.fun_name.lexeme))
+            return
         return_stmt.expr.accept(self)
         self.add_instr(RET())
     
     def visit_var_decl(self, var_decl):
         # TODO
         var_name = var_decl.var_def.var_name.lexeme
-        self.var_table.add(var_name)
+        self.var_table.add(var_name, var_decl.var_def.data_type)
         idx = self.var_table.get(var_name)
+        template = self.curr_template
+        template.var_count = max(template.var_count, idx + 1)
         if not var_decl.expr == None:
             var_decl.expr.accept(self)
             self.add_instr(STORE(idx))
@@ -99,27 +145,30 @@ class CodeGenerator (Visitor):
                 self.add_instr(STORE(idx)) #store into the var
         else:
             idx = self.var_table.get(assign_stmt.lvalue[0].var_name.lexeme) #retrieve the storage idx
+            curr_type = self.var_table.get_type(assign_stmt.lvalue[0].var_name.lexeme)
             self.add_instr(LOAD(idx)) #laod the struct oid
             if not assign_stmt.lvalue[0].array_expr == None:
                 assign_stmt.lvalue[0].array_expr.accept(self) #push the idx
                 self.add_instr(GETI()) #retrieve oid[idx] which is most likely another oid
             for i in range(1, len(assign_stmt.lvalue)):
+                field_name = assign_stmt.lvalue[i].var_name.lexeme
+                offset, curr_type = self.field_ref(curr_type, field_name)
                 if i == len(assign_stmt.lvalue)-1:
                     if not assign_stmt.lvalue[i].array_expr == None:
-                        self.add_instr(GETF(assign_stmt.lvalue[i].var_name.lexeme)) #get the oid of the ending array
+                        self.add_instr(GETF(offset, field_name)) #get the oid of the ending array
                         assign_stmt.lvalue[i].array_expr.accept(self) #get the idx
                         assign_stmt.expr.accept(self)
                         self.add_instr(SETI())
                     else:
                         assign_stmt.expr.accept(self) #push the value on the stack
-                        self.add_instr(SETF(assign_stmt.lvalue[i].var_name.lexeme)) #set oid[field] = value
+                        self.add_instr(SETF(offset, field_name)) #set oid[field] = value
                 else:
                     if not assign_stmt.lvalue[i].array_expr == None:
-                        self.add_instr(GETF(assign_stmt.lvalue[i].var_name.lexeme)) #get the oid of the ending array
+                        self.add_instr(GETF(offset, field_name)) #get the oid of the ending array
                         assign_stmt.lvalue[i].array_expr.accept(self) #get the idx
                         self.add_instr(GETI())
                     else:
-                        self.add_instr(GETF(assign_stmt.lvalue[i].var_name.lexeme)) #the the next oid for the appropriate path
+                        self.add_instr(GETF(offset, field_name)) #the the next oid for the appropriate path
            
 
     def visit_while_stmt(self, while_stmt):
@@ -216,6 +265,10 @@ class CodeGenerator (Visitor):
             self.add_instr(WRITE())
         elif fun_name == 'input':
             self.add_instr(READ())
+        elif fun_name == 'readint':
+            self.add_instr(READINT())
+        elif fun_name == 'readdouble':
+            self.add_instr(READDBL())
         elif fun_name == 'itos':
             for arg in call_expr.args:
                 arg.accept(self)
@@ -353,15 +406,15 @@ class CodeGenerator (Visitor):
                 fields = []
                 for field in struct.fields:
                     fields.append(field.var_name.lexeme)
-                self.add_instr(ALLOCS()) #puts oid on stack
+                self.add_instr(ALLOCS(len(fields), struct.struct_name.lexeme)) #puts oid on stack
                 for i in range(len(new_rvalue.struct_params)):
                     field = new_rvalue.struct_params[i]
                     self.add_instr(DUP()) #dup the oid
                     field.accept(self) #put the value on the stack
-                    self.add_instr(SETF(fields[i])) #set the according field
+                    self.add_instr(SETF(i, fields[i])) #set the according field
         else:
             new_rvalue.array_expr.accept(self) #push the size on the stack
-            self.add_instr(ALLOCA()) #create and push oid onto the stack
+            self.add_instr(ALLOCA(new_rvalue.type_name.lexeme)) #create and push oid onto the stack
             
     def visit_var_rvalue(self, var_rvalue):
         # TODO
@@ -376,15 +429,18 @@ class CodeGenerator (Visitor):
         else:
             
             idx = self.var_table.get(var_rvalue.path[0].var_name.lexeme)
+            curr_type = self.var_table.get_type(var_rvalue.path[0].var_name.lexeme)
             self.add_instr(LOAD(idx)) #load the oid
             if not var_rvalue.path[0].array_expr == None:
                 var_rvalue.path[0].array_expr.accept(self) #push the idx
                 self.add_instr(GETI()) #retrieve oid[idx] which is most likely another oid
             for i in range(1, len(var_rvalue.path)):
+                field_name = var_rvalue.path[i].var_name.lexeme
+                offset, curr_type = self.field_ref(curr_type, field_name)
                 if not var_rvalue.path[i].array_expr == None:
-                    self.add_instr(GETF(var_rvalue.path[i].var_name.lexeme)) #retrieve the oid/value
+                    self.add_instr(GETF(offset, field_name)) #retrieve the oid/value
                     var_rvalue.path[i].array_expr.accept(self) #push the idx
                     self.add_instr(GETI()) #get the oid[idx] value
                 else:
-                    self.add_instr(GETF(var_rvalue.path[i].var_name.lexeme)) #retrieve the oid/value
+                    self.add_instr(GETF(offset, field_name)) #retrieve the oid/value
             
\ No newline at end of file
@@ -0,0 +1,777 @@
+"""Compiler from MyPL VM frame templates to Python functions (the
+"fast" execution mode).
+
+Each frame template is translated into the source of a Python function
+which is then compiled with compile(). Within straight-line code the
+operand stack is simulated at compile time, so a run of PUSH, LOAD,
+arithmetic, and STORE instructions becomes a single Python assignment.
+Branches produced by the code generator (JMPF/JMP pairs for if
+statements, and backward JMPs for loops) are turned back into Python
+if/else and while statements. Any function whose jumps cannot be
+structured this way falls back to a block-at-a-time dispatch loop.
+
+The compiled functions keep their variables in Python locals, which the
+VM's garbage collector cannot see, so the fast mode never collects.
+
+The VM (VM.run) remains the reference implementation. Runtime errors are
+still reported as VM errors, but errors caught by Python itself (e.g.,
+arithmetic on null values) use a more general message.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import sys
+from dataclasses import dataclass, field
+
+from mypl_error import *
+from mypl_opcode import *
+from mypl_frame import *
+from mypl_optimizer import expand_superinstructions
+from mypl_array import new_array
+from mypl_memo import memoized
+from mypl_output import to_text
+
+
+@dataclass
+class StackValue:
+    """A value on the simulated operand stack.
+
+    The code is a Python expression computing the value. Constants and
+    temporaries are atoms (safe to evaluate at any time and more than
+    once). Plain variable reads are marked as such. Other
+    values record the variables they read (by index) and whether they
+    read the heap, which determines when they must be evaluated into a
+    temporary.
+
+    """
+    code: str
+    atom: bool = False
+    var: bool = False
+    reads: frozenset = frozenset()
+    heap: bool = False
+    is_bool: bool = False
+
+
+class Unstructured(Exception):
+    """Raised when a frame's jumps cannot be mapped to if/while."""
+    pass
+
+
+# python operators for the binary opcodes that map directly to them
+BINARY_OPS = {
+    OpCode.ADD: '+',
+    OpCode.SUB: '-',
+    OpCode.MUL: '*',
+    OpCode.CMPLT: '<',
+    OpCode.CMPLE: '<=',
+    OpCode.CMPEQ: '==',
+    OpCode.CMPNE: '!=',
+}
+
+# binary and unary opcodes implemented by runtime helper functions
+BINARY_HELPERS = {
+    OpCode.DIV: '_div',
+    OpCode.AND: '_and',
+    OpCode.OR: '_or',
+}
+
+UNARY_HELPERS = {
+    OpCode.NOT: '_not',
+    OpCode.LEN: '_len',
+    OpCode.TOINT: '_toint',
+    OpCode.TODBL: '_todbl',
+    OpCode.TOSTR: '_tostr',
+}
+
+
+class FrameCompiler:
+    """Compiles the frame templates of a VM into Python functions."""
+
+    def __init__(self, vm):
+        """Creates a compiler for the frame templates of the given VM.
+
+        Args:
+            vm -- The VM whose templates and heap the compiled code uses.
+
+        """
+        self.vm = vm
+        self.names = {}          # function name -> python function name
+        self.functions = {}      # function name -> compiled function
+        self.source = ''         # the generated python source
+        # per-template state
+        self.instructions = []
+        self.lines = []
+        self.indent = 0
+        self.stack = []
+        self.temp_count = 0
+        self.uses_stack = False
+
+
+    #----------------------------------------------------------------------
+    # Top-level compile and run
+    #----------------------------------------------------------------------
+
+    def compile(self):
+        """Generates and compiles the python source for every frame
+        template, returning a dictionary of function name to compiled
+        function.
+
+        """
+        for i, name in enumerate(self.vm.frame_templates):
+            self.names[name] = f'f{i}_{name}'
+        sources = []
+        for template in self.vm.frame_templates.values():
+            sources.append(self.compile_template(template))
+        self.source = '\n\n'.join(sources) + '\n'
+        namespace = self.runtime_namespace()
+        code = compile(self.source, '<mypl>', 'exec')
+        exec(code, namespace)
+        for name, py_name in self.names.items():
+            memo = self.vm.frame_templates[name].memo
+            if memo is not None:
+                # calls (including recursive ones) go through the cache
+                namespace[py_name] = memoized(namespace[py_name], memo)
+            self.functions[name] = namespace[py_name]
+        return self.functions
+
+
+    def run(self):
+        """Compiles (if needed) and runs the program's main function."""
+        if not 'main' in self.vm.frame_templates:
+            self.vm.error('No "main" functrion')
+        if not self.functions:
+            self.compile()
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, 100000))
+        try:
+            self.functions['main']()
+        except Halt:
+            pass
+        except RecursionError:
+            raise VMError('Maximum call depth exceeded')
+        except ZeroDivisionError:
+            raise VMError('Invalid division by zero')
+        except (TypeError, NameError, AttributeError):
+            raise VMError('Invalid operation on a null-type value')
+        finally:
+            sys.setrecursionlimit(limit)
+            self.vm.output.flush()
+
+
+    def runtime_namespace(self):
+        """Returns the global namespace of the generated code, containing
+        the runtime helper functions (bound to the VM's heap).
+
+        """
+        vm = self.vm
+        struct_heap = vm.struct_heap
+        array_heap = vm.array_heap
+
+        def _div(y, x):
+            if x == None or y == None:
+                vm.error(f'Invalid division between a null-type and non-null type')
+            if x == 0:
+                vm.error(f'Invalid division by zero')
+            if isinstance(x, int):
+                return y // x
+            return y / x
+
+        def _and(y, x):
+            if x == None or y == None:
+                vm.error(f'Invalid comparison between a null-type and non-null type')
+            return y and x
+
+        def _or(y, x):
+            if x == None or y == None:
+                vm.error(f'Invalid comparison between a null-type and non-null type')
+            return y or x
+
+        def _not(x):
+            if x == None:
+                vm.error(f'Invalid comparison between a null-type and non-null type')
+            return not x
+
+        output = vm.output
+
+        def _write(x):
+            output.write(to_text(x))
+
+        read_line = vm.input.readline
+
+        def _read():
+            output.flush()
+            return read_line()
+
+        def _readint():
+            output.flush()
+            line = read_line()
+            try:
+                return None if line == None else int(line)
+            except ValueError:
+                vm.error(f'Item must be a valid number')
+
+        def _readdbl():
+            output.flush()
+            line = read_line()
+            try:
+                return None if line == None else float(line)
+            except ValueError:
+                vm.error(f'Item must be a valid number')
+
+        def _len(x):
+            if x == None:
+                vm.error(f'Null value')
+            if isinstance(x, str):
+                return len(x)
+            return len(array_heap[x])
+
+        def _getc(x, y):
+            if x == None:
+                vm.error(f'Must be a valid string')
+            if y == None:
+                vm.error(f'Index must be of type int')
+            if y >= len(x) or y < 0:
+                vm.error(f'Invalid index for string')
+            return x[y]
+
+        def _toint(x):
+            if x == None:
+                vm.error(f'NoneType cannot be converted to int type')
+            if type(x) == str and not x.isnumeric():
+                vm.error(f'Item must be a valid number')
+            return int(x)
+
+        def _todbl(x):
+            if x == None:
+                vm.error(f'NoneType cannot be converted to double type')
+            if type(x) == str:
+                for ch in x:
+                    if ch.isalpha():
+                        vm.error(f'Must be a valid number')
+            if type(x) == int:
+                return x / 1.0
+            return float(x)
+
+        def _tostr(x):
+            if x == None:
+                vm.error(f'NoneType cannot be converted to string type')
+            return str(x)
+
+        def _allocs(field_count):
+            oid = vm.next_obj_id
+            vm.next_obj_id += 1
+            struct_heap[oid] = [None] * field_count
+            return oid
+
+        def _setf(y, offset, x):
+            if not y in struct_heap:
+                vm.error(f'Object not found')
+            struct_heap[y][offset] = x
+
+        def _getf(x, offset):
+            if not x in struct_heap:
+                vm.error(f'Object not found')
+            return struct_heap[x][offset]
+
+        def _alloca(x, element_type):
+            oid = vm.next_obj_id
+            vm.next_obj_id += 1
+            if x == None:
+                vm.error(f'Size of array must be of int-type')
+            if x < 0:
+                vm.error(f'Size of array must be zero or greater')
+            array_heap[oid] = new_array(element_type, x)
+            return oid
+
+        def _seti(z, y, x):
+            if not z in array_heap:
+                vm.error(f'Array object not found')
+            if y == None:
+                vm.error(f'Array index must be of int-type')
+            if y < 0 or y >= len(array_heap[z]):
+                vm.error(f'Cannot reach index {y}')
+            array_heap[z][y] = x
+
+        def _geti(y, x):
+            if not y in array_heap:
+                vm.error(f'Array object not found')
+            if x == None:
+                vm.error(f'Array index must be of int-type')
+            if x < 0 or x >= len(array_heap[y]):
+                vm.error(f'Cannot reach index {x}')
+            return array_heap[y][x]
+
+        def _missing(name):
+            raise KeyError(name)
+
+        namespace = dict(locals())
+        del namespace['vm']
+        namespace['Halt'] = Halt
+        return namespace
+
+
+    #----------------------------------------------------------------------
+    # Per-template code generation
+    #----------------------------------------------------------------------
+
+    def compile_template(self, template):
+        """Returns the python source of the function for the template.
+
+        Args:
+            template -- The VMFrameTemplate to translate.
+
+        """
+        # the arguments are the first variables
+        params = [f'v{i}' for i in range(template.arg_count)]
+        header = f'def {self.names[template.function_name]}({", ".join(params)}):'
+        try:
+            body = self.structured_body(template)
+        except Unstructured:
+            body = self.dispatch_body(template)
+        return '\n'.join([header] + body)
+
+
+    def reset(self, template):
+        """Resets the per-template state for a new translation."""
+        self.instructions = expand_superinstructions(template.instructions)
+        self.function_name = template.function_name
+        self.lines = []
+        self.indent = 1
+        self.stack = []
+        self.temp_count = 0
+        self.uses_stack = False
+
+
+    def structured_body(self, template):
+        """Translates the template using python if and while statements
+        for its jumps. Raises Unstructured if that is not possible.
+
+        """
+        self.reset(template)
+        self.check_jumps()
+        self.region(0, len(self.instructions), None)
+        self.flush()
+        self.emit('raise Halt()')
+        return self.body_lines()
+
+
+    def dispatch_body(self, template):
+        """Translates the template as a loop over its basic blocks, used
+        for jumps that do not form if or while statements.
+
+        """
+        self.reset(template)
+        self.flush()
+        leaders = {0, len(self.instructions)}
+        for i, instr in enumerate(self.instructions):
+            if instr.opcode in (OpCode.JMP, OpCode.JMPF):
+                leaders.add(instr.operand)
+                leaders.add(i + 1)
+            elif instr.opcode in (OpCode.RET, OpCode.TAILCALL):
+                leaders.add(i + 1)
+        leaders = sorted(l for l in leaders if 0 <= l <= len(self.instructions))
+        self.emit('pc = 0')
+        self.emit('while True:')
+        self.indent += 1
+        for start, end in zip(leaders, leaders[1:]):
+            self.emit(f'if pc == {start}:')
+            self.indent += 1
+            i = start
+            while i < end:
+                instr = self.instructions[i]
+                if instr.opcode == OpCode.JMP:
+                    self.flush()
+                    self.emit(f'pc = {instr.operand}')
+                    self.emit('continue')
+                elif instr.opcode == OpCode.JMPF:
+                    cond = self.pop()
+                    self.flush()
+                    self.emit(f'if {self.false_test(cond)}:')
+                    self.emit(f'    pc = {instr.operand}')
+                    self.emit('    continue')
+                elif instr.opcode == OpCode.TAILCALL and instr.operand == self.function_name:
+                    self.recursive_tail_call()
+                else:
+                    self.straight_line(i)
+                i += 1
+            self.flush()
+            self.emit(f'pc = {end}')
+            self.emit('continue')
+            self.indent -= 1
+        self.emit('raise Halt()')
+        return self.body_lines()
+
+
+    def body_lines(self):
+        """Returns the generated body, with the runtime stack set up
+        first if the body uses it.
+
+        """
+        if self.uses_stack:
+            return ['    stk = []'] + self.lines
+        return self.lines
+
+
+    def check_jumps(self):
+        """Raises Unstructured if any jump target is out of range, or if
+        the function makes recursive tail calls (which are jumps back to
+        the start of the dispatch loop).
+
+        """
+        for instr in self.instructions:
+            if instr.opcode in (OpCode.JMP, OpCode.JMPF):
+                target = instr.operand
+                if not isinstance(target, int) or target < 0 or target > len(self.instructions):
+                    raise Unstructured()
+            elif instr.opcode == OpCode.TAILCALL and instr.operand == self.function_name:
+                raise Unstructured()
+
+
+    def jumps_into(self, start, end):
+        """True if an instruction outside [start, end) jumps strictly
+        inside of it (past its first instruction).
+
+        """
+        for i, instr in enumerate(self.instructions):
+            if instr.opcode in (OpCode.JMP, OpCode.JMPF) and not start <= i < end:
+                if start < instr.operand < end:
+                    return True
+        return False
+
+
+    def loop_end(self, head, end):
+        """Returns the index of the last backward jump to head within
+        [head, end), or None if head is not a loop head.
+
+        """
+        last = None
+        for i in range(head, end):
+            instr = self.instructions[i]
+            if instr.opcode == OpCode.JMP and instr.operand == head:
+                last = i
+        return last
+
+
+    def region(self, start, end, loop):
+        """Translates the instructions in [start, end).
+
+        Args:
+            start -- The first instruction index.
+            end -- One past the last instruction index.
+            loop -- A (head, exit) pair for the enclosing loop, or None.
+
+        """
+        i = start
+        while i < end:
+            instr = self.instructions[i]
+            back = self.loop_end(i, end)
+            if back is not None and (loop is None or i != loop[0]):
+                # loop: body is [i, back), the backward jump is at back
+                if self.jumps_into(i, back + 1):
+                    raise Unstructured()
+                self.flush()
+                self.emit('while True:')
+                self.indent += 1
+                self.region_body(i, back, (i, back + 1))
+                self.indent -= 1
+                i = back + 1
+            elif instr.opcode == OpCode.JMPF:
+                i = self.branch(i, end, loop)
+            elif instr.opcode == OpCode.JMP:
+                self.flush()
+                self.jump(instr.operand, end, loop)
+                i += 1
+            else:
+                self.straight_line(i)
+                i += 1
+
+
+    def region_body(self, start, end, loop):
+        """Translates a nested region (if, else, or loop body), making
+        sure the resulting python block is not empty.
+
+        """
+        count = len(self.lines)
+        self.region(start, end, loop)
+        self.flush()
+        if len(self.lines) == count:
+            self.emit('pass')
+
+
+    def jump(self, target, end, loop):
+        """Translates an unconditional jump within a region."""
+        if loop is not None and target == loop[0]:
+            self.emit('continue')
+        elif loop is not None and target == loop[1]:
+            self.emit('break')
+        elif target == end:
+            pass
+        else:
+            raise Unstructured()
+
+
+    def branch(self, i, end, loop):
+        """Translates the conditional jump at i, returning the index of
+        the next instruction to translate.
+
+        """
+        target = self.instructions[i].operand
+        cond = self.pop()
+        self.flush()
+        if loop is not None and target == loop[1]:
+            self.emit(f'if {self.false_test(cond)}:')
+            self.emit('    break')
+            return i + 1
+        if target <= i or target > end:
+            raise Unstructured()
+        # if-else when the then part ends by jumping forward past the
+        # else part (within this region)
+        last = self.instructions[target - 1] if target - 1 > i else None
+        else_end = None
+        if last is not None and last.opcode == OpCode.JMP:
+            if target < last.operand <= end:
+                else_end = last.operand
+        if else_end is None:
+            if self.jumps_into(i + 1, target):
+                raise Unstructured()
+            self.emit(f'if {self.true_test(cond)}:')
+            self.indent += 1
+            self.region_body(i + 1, target, loop)
+            self.indent -= 1
+            return target
+        if self.jumps_into(i + 1, target - 1) or self.jumps_into(target, else_end):
+            raise Unstructured()
+        self.emit(f'if {self.true_test(cond)}:')
+        self.indent += 1
+        self.region_body(i + 1, target - 1, loop)
+        self.indent -= 1
+        self.emit('else:')
+        self.indent += 1
+        self.region_body(target, else_end, loop)
+        self.indent -= 1
+        return else_end
+
+
+    #----------------------------------------------------------------------
+    # Straight-line instructions
+    #----------------------------------------------------------------------
+
+    def straight_line(self, i):
+        """Translates a single non-jump instruction."""
+        instr = self.instructions[i]
+        opcode = instr.opcode
+        operand = instr.operand
+        if opcode == OpCode.PUSH:
+            self.push(StackValue(repr(operand), atom=True,
+                                 is_bool=isinstance(operand, bool)))
+        elif opcode == OpCode.POP:
+            x = self.pop()
+            if not x.atom:
+                self.emit(x.code)
+        elif opcode == OpCode.LOAD:
+            self.push(StackValue(f'v{operand}', var=True, reads=frozenset([operand])))
+        elif opcode == OpCode.STORE:
+            x = self.pop()
+            self.materialize(lambda v: operand in v.reads)
+            self.emit(f'v{operand} = {x.code}')
+        elif opcode in BINARY_OPS:
+            x = self.pop()
+            y = self.pop()
+            is_bool = opcode not in (OpCode.ADD, OpCode.SUB, OpCode.MUL)
+            self.push(StackValue(f'({y.code} {BINARY_OPS[opcode]} {x.code})',
+                                 reads=x.reads | y.reads, heap=x.heap or y.heap,
+                                 is_bool=is_bool))
+        elif opcode in BINARY_HELPERS:
+            x = self.pop()
+            y = self.pop()
+            self.push(StackValue(f'{BINARY_HELPERS[opcode]}({y.code}, {x.code})',
+                                 reads=x.reads | y.reads, heap=x.heap or y.heap,
+                                 is_bool=opcode != OpCode.DIV))
+        elif opcode in UNARY_HELPERS:
+            x = self.pop()
+            self.push(StackValue(f'{UNARY_HELPERS[opcode]}({x.code})', reads=x.reads,
+                                 heap=x.heap or opcode == OpCode.LEN,
+                                 is_bool=opcode == OpCode.NOT))
+        elif opcode == OpCode.GETC:
+            x = self.pop()
+            y = self.pop()
+            self.push(StackValue(f'_getc({x.code}, {y.code})',
+                                 reads=x.reads | y.reads, heap=x.heap or y.heap))
+        elif opcode == OpCode.GETF:
+            x = self.pop()
+            self.push(StackValue(f'_getf({x.code}, {operand!r})', reads=x.reads, heap=True))
+        elif opcode == OpCode.GETI:
+            x = self.pop()
+            y = self.pop()
+            self.push(StackValue(f'_geti({y.code}, {x.code})',
+                                 reads=x.reads | y.reads, heap=True))
+        elif opcode == OpCode.DUP:
+            x = self.pop()
+            if not x.atom:
+                x = self.to_temp(x)
+            self.push(x)
+            self.push(x)
+        elif opcode == OpCode.NOP:
+            pass
+        elif opcode == OpCode.CALL:
+            self.call(operand)
+        elif opcode == OpCode.TAILCALL:
+            # python has no tail calls, so this is a call and return
+            self.call(operand)
+            x = self.pop()
+            self.materialize()
+            self.stack = []
+            self.emit(f'return {x.code}')
+        elif opcode == OpCode.RET:
+            x = self.pop()
+            self.materialize()
+            self.stack = []
+            self.emit(f'return {x.code}')
+        elif opcode == OpCode.WRITE:
+            x = self.pop()
+            self.materialize()
+            self.emit(f'_write({x.code})')
+        elif opcode == OpCode.READ:
+            self.side_effect('_read()')
+        elif opcode == OpCode.READINT:
+            self.side_effect('_readint()')
+        elif opcode == OpCode.READDBL:
+            self.side_effect('_readdbl()')
+        elif opcode == OpCode.ALLOCS:
+            self.side_effect(f'_allocs({operand!r})')
+        elif opcode == OpCode.ALLOCA:
+            x = self.pop()
+            self.side_effect(f'_alloca({x.code}, {operand!r})')
+        elif opcode == OpCode.SETF:
+            x = self.pop()
+            y = self.pop()
+            self.materialize()
+            self.emit(f'_setf({y.code}, {operand!r}, {x.code})')
+        elif opcode == OpCode.SETI:
+            x = self.pop()
+            y = self.pop()
+            z = self.pop()
+            self.materialize()
+            self.emit(f'_seti({z.code}, {y.code}, {x.code})')
+        else:
+            raise Unstructured()
+
+
+    def call(self, fun_name):
+        """Translates a call to the given function."""
+        template = self.vm.frame_templates.get(fun_name)
+        if template is None:
+            self.side_effect(f'_missing({fun_name!r})')
+            return
+        args = [self.pop() for _ in range(template.arg_count)]
+        args.reverse()
+        self.materialize()
+        arg_code = ', '.join(arg.code for arg in args)
+        self.side_effect(f'{self.names[fun_name]}({arg_code})')
+
+
+    def recursive_tail_call(self):
+        """Translates a tail call of the function to itself (within the
+        dispatch loop) into setting the parameters and restarting.
+
+        """
+        arg_count = self.vm.frame_templates[self.function_name].arg_count
+        args = [self.pop() for _ in range(arg_count)]
+        args.reverse()
+        self.materialize()
+        self.stack = []
+        if args:
+            params = ', '.join(f'v{i}' for i in range(arg_count))
+            self.emit(f'{params} = {", ".join(arg.code for arg in args)}')
+        self.emit('pc = 0')
+        self.emit('continue')
+
+
+    def side_effect(self, code):
+        """Evaluates the given expression (after any pending values) into
+        a temporary that is pushed onto the stack.
+
+        """
+        self.materialize()
+        self.push(self.to_temp(StackValue(code)))
+
+
+    #----------------------------------------------------------------------
+    # Simulated operand stack helpers
+    #----------------------------------------------------------------------
+
+    def emit(self, line):
+        """Adds a line of code at the current indentation."""
+        self.lines.append('    ' * self.indent + line)
+
+
+    def push(self, value):
+        self.stack.append(value)
+
+
+    def pop(self):
+        """Pops the simulated stack, reading from the runtime stack when
+        the simulated stack is empty.
+
+        """
+        if self.stack:
+            return self.stack.pop()
+        self.uses_stack = True
+        return self.to_temp(StackValue('stk.pop()'))
+
+
+    def to_temp(self, value):
+        """Evaluates the value into a new temporary, returned as an atom."""
+        name = f't{self.temp_count}'
+        self.temp_count += 1
+        self.emit(f'{name} = {value.code}')
+        return StackValue(name, atom=True, is_bool=value.is_bool)
+
+
+    def materialize(self, affected=None):
+        """Evaluates pending values into temporaries, in stack order.
+
+        Args:
+            affected -- Predicate selecting the values to evaluate. By
+                default, every value other than a plain variable read
+                (i.e., those that may fail or that read the heap).
+
+        """
+        if affected is None:
+            affected = lambda value: not value.var
+        for i, value in enumerate(self.stack):
+            if not value.atom and affected(value):
+                self.stack[i] = self.to_temp(value)
+
+
+    def flush(self):
+        """Moves every simulated stack value onto the runtime stack."""
+        for value in self.stack:
+            self.uses_stack = True
+            self.emit(f'stk.append({value.code})')
+        self.stack = []
+
+
+    def true_test(self, cond):
+        """Returns a python test that holds when JMPF does not jump."""
+        if cond.is_bool:
+            return cond.code
+        return f'not ({cond.code} == False)'
+
+
+    def false_test(self, cond):
+        """Returns a python test that holds when JMPF jumps."""
+        if cond.is_bool:
+            return f'not {cond.code}'
+        return f'{cond.code} == False'
+
+
+class Halt(Exception):
+    """Raised by a compiled function that runs past its last instruction
+    (which stops the program, as in the VM).
+
+    """
+    pass
@@ -0,0 +1,347 @@
+"""Constant folding and propagation over the MyPL AST.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+The folder runs after semantic checking and before code generation. It
+rewrites the AST in place:
+
+  * binary and not operations over literals are replaced by their value
+    (e.g., 2 * 60 * 60 becomes 7200), except for null values and
+    division by zero, which are left to fail at run time;
+
+  * locals declared once with a literal value and never assigned are
+    replaced by the literal (and their declarations removed);
+
+  * if statement parts with a constant condition are removed (false) or
+    become the else part (true), and while loops with a false condition
+    are removed.
+
+"""
+
+from mypl_token import *
+from mypl_ast import *
+
+
+class ConstantFolder (Visitor):
+
+    def __init__(self):
+        """Creates a constant folder."""
+        # local name -> literal token for the locals being propagated
+        self.constants = {}
+
+
+    #----------------------------------------------------------------------
+    # Helper functions
+    #----------------------------------------------------------------------
+
+    def literal(self, term):
+        """Returns the (non-null) literal token of a simple term, or None
+        if the term is not a literal.
+
+        """
+        if isinstance(term, SimpleTerm) and isinstance(term.rvalue, SimpleRValue):
+            if term.rvalue.value.token_type != TokenType.NULL_VAL:
+                return term.rvalue.value
+        return None
+
+
+    def expr_literal(self, expr):
+        """Returns the literal token an expression consists of, or None."""
+        if expr.op == None and not expr.not_op:
+            return self.literal(expr.first)
+        return None
+
+
+    def value(self, token):
+        """Returns the value of a literal token. Strings keep their escape
+        sequences (as in the lexeme).
+
+        """
+        if token.token_type == TokenType.INT_VAL:
+            return int(token.lexeme)
+        elif token.token_type == TokenType.DOUBLE_VAL:
+            return float(token.lexeme)
+        elif token.token_type == TokenType.BOOL_VAL:
+            return token.lexeme == 'true'
+        return token.lexeme
+
+
+    def token(self, value, at):
+        """Returns a literal token for the value, positioned at the given
+        token.
+
+        """
+        if isinstance(value, bool):
+            return Token(TokenType.BOOL_VAL, 'true' if value else 'false', at.line, at.column)
+        elif isinstance(value, int):
+            return Token(TokenType.INT_VAL, str(value), at.line, at.column)
+        elif isinstance(value, float):
+            return Token(TokenType.DOUBLE_VAL, repr(value), at.line, at.column)
+        return Token(TokenType.STRING_VAL, value, at.line, at.column)
+
+
+    def evaluate(self, op, lhs, rhs):
+        """Returns the literal token of lhs op rhs (using the VM's
+        semantics), or None if it is left to be computed at run time.
+
+        """
+        y = self.value(lhs)
+        x = self.value(rhs)
+        if isinstance(x, str) and isinstance(y, str) and op != '+':
+            # compare the strings the VM sees (escapes replaced)
+            x = x.replace('\\n', '\n').replace('\\t', '\t')
+            y = y.replace('\\n', '\n').replace('\\t', '\t')
+        try:
+            if op == '+':
+                if isinstance(y, str) and y.endswith('\\'):
+                    return None
+                result = y + x
+            elif op == '-':
+                result = y - x
+            elif op == '*':
+                result = y * x
+            elif op == '/':
+                if x == 0:
+                    return None
+                result = y // x if isinstance(x, int) else y / x
+            elif op == '<':
+                result = y < x
+            elif op == '<=':
+                result = y <= x
+            elif op == '>':
+                result = x < y
+            elif op == '>=':
+                result = x <= y
+            elif op == '==':
+                result = y == x
+            elif op == '!=':
+                result = y != x
+            elif op == 'and':
+                result = y and x
+            elif op == 'or':
+                result = y or x
+            else:
+                return None
+        except TypeError:
+            return None
+        return self.token(result, lhs)
+
+
+    def literal_expr(self, token):
+        """Returns an expression consisting of the literal token."""
+        return Expr(False, SimpleTerm(SimpleRValue(token)), None, None)
+
+
+    def block(self, stmts):
+        """Returns statements running the given statements as a block. The
+        statements are returned as is unless they declare variables, in
+        which case they stay within an (always taken) if statement to
+        keep their environment.
+
+        """
+        if any(isinstance(stmt, VarDecl) for stmt in stmts):
+            token = Token(TokenType.BOOL_VAL, 'true', 0, 0)
+            return [IfStmt(BasicIf(self.literal_expr(token), stmts), [], [])]
+        return list(stmts)
+
+
+    def fold_stmts(self, stmts):
+        """Returns the folded statements of a statement list."""
+        folded = []
+        for stmt in stmts:
+            if isinstance(stmt, VarDecl) and stmt.var_def.var_name.lexeme in self.constants:
+                continue
+            stmt.accept(self)
+            if isinstance(stmt, IfStmt):
+                folded += self.fold_if(stmt)
+            elif isinstance(stmt, WhileStmt):
+                condition = self.expr_literal(stmt.condition)
+                if condition == None or self.value(condition) != False:
+                    folded.append(stmt)
+            else:
+                folded.append(stmt)
+        return folded
+
+
+    def fold_if(self, if_stmt):
+        """Returns the statements replacing an if statement after removing
+        its parts with constant conditions.
+
+        """
+        parts = []
+        else_parts = if_stmt.else_stmts
+        for part in [if_stmt.if_part] + if_stmt.else_ifs:
+            condition = self.expr_literal(part.condition)
+            if condition == None:
+                parts.append(part)
+            elif self.value(condition) == True:
+                # always taken when reached
+                else_parts = [part]
+                break
+        if parts:
+            return [IfStmt(parts[0], parts[1:], else_parts)]
+        stmts = []
+        for part in else_parts:
+            stmts += self.block(part.stmts)
+        return stmts
+
+
+    def find_constants(self, fun_def):
+        """Returns the locals of the function that are declared once with
+        a literal value and never assigned, mapped to their literals.
+
+        """
+        decls = {}
+        assigned = {param.var_name.lexeme for param in fun_def.params}
+        self.find_decls(fun_def.stmts, decls, assigned)
+        constants = {}
+        for name, decl in decls.items():
+            if decl != None and decl.expr != None and name not in assigned:
+                token = self.expr_literal(decl.expr)
+                if token != None:
+                    constants[name] = token
+        return constants
+
+
+    def find_decls(self, stmts, decls, assigned):
+        """Records the variable declarations (None if declared more than
+        once) and assigned variable names of the statements.
+
+        """
+        for stmt in stmts:
+            if isinstance(stmt, VarDecl):
+                name = stmt.var_def.var_name.lexeme
+                if name in decls and decls[name] is not stmt:
+                    decls[name] = None
+                else:
+                    decls[name] = stmt
+            elif isinstance(stmt, AssignStmt):
+                assigned.add(stmt.lvalue[0].var_name.lexeme)
+            elif isinstance(stmt, WhileStmt):
+                self.find_decls(stmt.stmts, decls, assigned)
+            elif isinstance(stmt, ForStmt):
+                self.find_decls([stmt.var_decl, stmt.assign_stmt], decls, assigned)
+                assigned.add(stmt.var_decl.var_def.var_name.lexeme)
+                self.find_decls(stmt.stmts, decls, assigned)
+            elif isinstance(stmt, IfStmt):
+                parts = [stmt.if_part] + stmt.else_ifs + stmt.else_stmts
+                for part in parts:
+                    self.find_decls(part.stmts, decls, assigned)
+
+
+    #----------------------------------------------------------------------
+    # Visitor functions
+    #----------------------------------------------------------------------
+
+    def visit_program(self, program):
+        for fun_def in program.fun_defs:
+            fun_def.accept(self)
+
+
+    def visit_fun_def(self, fun_def):
+        self.constants = {}
+        fun_def.stmts = self.fold_stmts(fun_def.stmts)
+        # propagate until no new constant locals are found
+        constants = self.find_constants(fun_def)
+        while constants:
+            self.constants.update(constants)
+            fun_def.stmts = self.fold_stmts(fun_def.stmts)
+            constants = self.find_constants(fun_def)
+
+
+    def visit_return_stmt(self, return_stmt):
+        return_stmt.expr.accept(self)
+
+
+    def visit_var_decl(self, var_decl):
+        if var_decl.expr != None:
+            var_decl.expr.accept(self)
+
+
+    def visit_assign_stmt(self, assign_stmt):
+        for var_ref in assign_stmt.lvalue:
+            if var_ref.array_expr != None:
+                var_ref.array_expr.accept(self)
+        assign_stmt.expr.accept(self)
+
+
+    def visit_while_stmt(self, while_stmt):
+        while_stmt.condition.accept(self)
+        while_stmt.stmts = self.fold_stmts(while_stmt.stmts)
+
+
+    def visit_for_stmt(self, for_stmt):
+        for_stmt.var_decl.accept(self)
+        for_stmt.condition.accept(self)
+        for_stmt.assign_stmt.accept(self)
+        for_stmt.stmts = self.fold_stmts(for_stmt.stmts)
+
+
+    def visit_if_stmt(self, if_stmt):
+        # the parser repeats else if and else parts, so fold each once
+        visited = set()
+        for part in [if_stmt.if_part] + if_stmt.else_ifs + if_stmt.else_stmts:
+            if id(part) in visited:
+                continue
+            visited.add(id(part))
+            if part.condition != None:
+                part.condition.accept(self)
+            part.stmts = self.fold_stmts(part.stmts)
+
+
+    def visit_call_expr(self, call_expr):
+        for arg in call_expr.args:
+            arg.accept(self)
+
+
+    def visit_expr(self, expr):
+        expr.first.accept(self)
+        if isinstance(expr.first, ComplexTerm):
+            inner = expr.first.expr
+            if self.expr_literal(inner) != None:
+                expr.first = inner.first
+        if expr.op != None:
+            expr.rest.accept(self)
+            lhs = self.literal(expr.first)
+            rhs = self.expr_literal(expr.rest)
+            if lhs != None and rhs != None:
+                token = self.evaluate(expr.op.lexeme, lhs, rhs)
+                if token != None:
+                    expr.first = SimpleTerm(SimpleRValue(token))
+                    expr.op = None
+                    expr.rest = None
+        if expr.not_op and expr.op == None:
+            token = self.literal(expr.first)
+            if token != None and token.token_type == TokenType.BOOL_VAL:
+                expr.first = SimpleTerm(SimpleRValue(self.token(token.lexeme != 'true', token)))
+                expr.not_op = False
+
+
+    def visit_simple_term(self, simple_term):
+        rvalue = simple_term.rvalue
+        if isinstance(rvalue, VarRValue) and len(rvalue.path) == 1 \
+           and rvalue.path[0].array_expr == None:
+            name = rvalue.path[0].var_name.lexeme
+            if name in self.constants:
+                simple_term.rvalue = SimpleRValue(self.constants[name])
+                return
+        rvalue.accept(self)
+
+
+    def visit_complex_term(self, complex_term):
+        complex_term.expr.accept(self)
+
+
+    def visit_new_rvalue(self, new_rvalue):
+        if new_rvalue.array_expr != None:
+            new_rvalue.array_expr.accept(self)
+        for param in new_rvalue.struct_params or []:
+            param.accept(self)
+
+
+    def visit_var_rvalue(self, var_rvalue):
+        for var_ref in var_rvalue.path:
+            if var_ref.array_expr != None:
+                var_ref.array_expr.accept(self)
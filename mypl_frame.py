@@ -8,11 +8,20 @@ CLASS: CPSC 326
 """
 
 
+from array import array
 from dataclasses import dataclass, field
-from typing import Any
 from mypl_opcode import OpCode
 
 
+# opcode value reserved for the end-of-code marker that finalize()
+# appends to the packed form (OpCode values start at 1)
+END_OF_CODE = 0
+
+# returned by a memo cache (see mypl_memo) for arguments without a
+# cached result
+MISSING = object()
+
+
 @dataclass
 class VMFrameTemplate:
 
@@ -20,27 +29,56 @@ class VMFrameTemplate:
     function_name: str
     arg_count: int
     instructions: list['VMInstr'] = field(default_factory=list) 
+    # number of variable slots to preallocate in each frame (0 if the
+    # variables are added as they are first stored), the first
+    # arg_count of which hold the arguments
+    var_count: int = 0
+    # packed form built by finalize(): parallel opcode and operand tables
+    opcodes: array = field(default=None, repr=False)
+    operands: list[object] = field(default=None, repr=False)
+    # initial values of the (non-argument) variable slots
+    local_slots: list[object] = field(default=None, repr=False)
+    # result cache (see mypl_memo) if the function is memoized
+    memo: object = field(default=None, repr=False)
+
+    def finalize(self):
+        """Lowers the instructions into the packed form executed by the
+        VM: a byte array of opcodes and a parallel operand table, each
+        ending with an end-of-code marker. Must be called again if the
+        instructions change.
+
+        """
+        self.opcodes = array('B', [instr.opcode for instr in self.instructions])
+        self.opcodes.append(END_OF_CODE)
+        self.operands = [instr.operand for instr in self.instructions]
+        self.operands.append(None)
+        self.local_slots = [None] * max(0, self.var_count - self.arg_count)
 
     
-@dataclass
+@dataclass(slots=True)
 class VMFrame:
     """A VM function-call frame."""
     template: VMFrameTemplate
     pc: int = 0
-    variables: list[Any] = field(default_factory=list) 
-    operand_stack: list[Any] = field(default_factory=list) 
+    variables: list[object] = field(default_factory=list) 
+    operand_stack: list[object] = field(default_factory=list) 
+    # (cache, argument tuple) to store the result under on return
+    memo: object = None
 
 
 @dataclass
 class VMInstr:
     """A VM instruction."""
     opcode: OpCode
-    operand: Any = None
+    operand: object = None
     comment: str = ''
 
     def __repr__(self):
-        s = f'{self.opcode}('
-        s += f'{str(self.operand)}' if self.operand != None else ''
+        s = f'OpCode.{self.opcode.name}('
+        if isinstance(self.operand, tuple):
+            s += ', '.join(repr(x) if isinstance(x, str) else str(x) for x in self.operand)
+        elif self.operand != None:
+            s += f'{str(self.operand)}'
         s += ')'
         s += f'  // {self.comment}' if self.comment else ''
         return s
@@ -101,6 +139,9 @@ def JMPF(offset):
 def CALL(fun_name):
     return VMInstr(OpCode.CALL, fun_name)
 
+def TAILCALL(fun_name):
+    return VMInstr(OpCode.TAILCALL, fun_name)
+
 def RET():
     return VMInstr(OpCode.RET)    
 
@@ -110,6 +151,12 @@ def WRITE():
 def READ():
     return VMInstr(OpCode.READ)
 
+def READINT():
+    return VMInstr(OpCode.READINT)
+
+def READDBL():
+    return VMInstr(OpCode.READDBL)
+
 def LEN():
     return VMInstr(OpCode.LEN)
 
@@ -125,17 +172,17 @@ def TODBL():
 def TOSTR():
     return VMInstr(OpCode.TOSTR)
 
-def ALLOCS():
-    return VMInstr(OpCode.ALLOCS)
+def ALLOCS(field_count, struct_name=''):
+    return VMInstr(OpCode.ALLOCS, field_count, struct_name)
 
-def SETF(field_name):
-    return VMInstr(OpCode.SETF, field_name)
+def SETF(offset, field_name=''):
+    return VMInstr(OpCode.SETF, offset, field_name)
 
-def GETF(field_name):
-    return VMInstr(OpCode.GETF, field_name)
+def GETF(offset, field_name=''):
+    return VMInstr(OpCode.GETF, offset, field_name)
 
-def ALLOCA():
-    return VMInstr(OpCode.ALLOCA)
+def ALLOCA(element_type=None):
+    return VMInstr(OpCode.ALLOCA, element_type)
 
 def SETI():
     return VMInstr(OpCode.SETI)
@@ -149,6 +196,30 @@ def DUP():
 def NOP():
     return VMInstr(OpCode.NOP)
 
+def MOV(dst, src):
+    return VMInstr(OpCode.MOV, (dst, src))
+
+def MOVI(dst, value):
+    return VMInstr(OpCode.MOVI, (dst, value))
+
+def JMPFR(src, offset):
+    return VMInstr(OpCode.JMPFR, (src, offset))
+
+def INCR(index, value):
+    return VMInstr(OpCode.INCR, (index, value))
+
+def LOAD_GETI(array_index, index):
+    return VMInstr(OpCode.LOAD_GETI, (array_index, index))
+
+def LOADLOAD(first_index, second_index):
+    return VMInstr(OpCode.LOADLOAD, (first_index, second_index))
+
+def CMPLT_JMPF(offset):
+    return VMInstr(OpCode.CMPLT_JMPF, offset)
+
+def CMPLE_JMPF(offset):
+    return VMInstr(OpCode.CMPLE_JMPF, offset)
+
 
 
     
@@ -0,0 +1,125 @@
+"""Mark-and-sweep garbage collector for the MyPL VM heaps.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+Object ids are plain ints, so the collector is conservative: any int in
+a frame (variable or operand stack value), struct field, or array slot
+that is the id of a live object keeps that object alive. Object ids are
+never reused, so an int that is not actually a reference can at worst
+keep garbage alive a little longer.
+
+A collection runs (from ALLOCS and ALLOCA) once the number of objects
+allocated since the last collection reaches the threshold. To keep the
+cost of collecting proportional to the work done by the program, the
+next collection waits for at least as many allocations as there were
+live objects after the last one.
+
+"""
+
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class GCStats:
+    """Garbage collector statistics."""
+    collections: int = 0         # number of collections
+    allocated: int = 0           # objects allocated (total)
+    freed: int = 0               # objects freed (total)
+    live: int = 0                # objects live after the last collection
+    pause: float = 0.0           # time (in seconds) of the last collection
+    total_pause: float = 0.0     # time (in seconds) of all collections
+
+    def __str__(self):
+        return (f'GC: {self.collections} collections, {self.allocated} allocated, '
+                f'{self.freed} freed, {self.live} live, '
+                f'{self.total_pause * 1000:.2f}ms total pause, '
+                f'{self.pause * 1000:.2f}ms last pause')
+
+
+class GarbageCollector:
+
+    def __init__(self, vm, threshold=10000):
+        """Creates a collector for the given VM's heaps.
+
+        Args:
+            vm -- The VM whose heaps to collect.
+            threshold -- The (minimum) number of allocations between
+                         collections, or 0 to never collect.
+
+        """
+        self.vm = vm
+        self.threshold = threshold
+        # allocations left until the next collection
+        self.countdown = threshold
+        self.stats = GCStats()
+
+
+    def allocated(self):
+        """Records an allocation, collecting first if the threshold is
+        reached.
+
+        """
+        self.stats.allocated += 1
+        self.countdown -= 1
+        if self.countdown <= 0 and self.threshold > 0:
+            self.collect()
+
+
+    def roots(self):
+        """Returns the values held by the frames on the call stack."""
+        values = []
+        for frame in self.vm.call_stack:
+            values += frame.variables
+            values += frame.operand_stack
+        return values
+
+
+    def mark(self):
+        """Returns the set of ids of the objects reachable from the roots."""
+        struct_heap = self.vm.struct_heap
+        array_heap = self.vm.array_heap
+        marked = set()
+        pending = self.roots()
+        while pending:
+            value = pending.pop()
+            if type(value) != int or value in marked:
+                continue
+            if value in struct_heap:
+                marked.add(value)
+                pending.extend(struct_heap[value])
+            elif value in array_heap:
+                marked.add(value)
+                # (typed arrays only hold ints, doubles, and bools)
+                if type(array_heap[value]) == list:
+                    pending.extend(array_heap[value])
+        return marked
+
+
+    def sweep(self, marked):
+        """Removes the unmarked objects from the heaps, returning the
+        number of objects removed.
+
+        """
+        freed = 0
+        for heap in (self.vm.struct_heap, self.vm.array_heap):
+            for oid in [oid for oid in heap if oid not in marked]:
+                del heap[oid]
+                freed += 1
+        return freed
+
+
+    def collect(self):
+        """Runs a full collection."""
+        start = time.perf_counter()
+        marked = self.mark()
+        freed = self.sweep(marked)
+        pause = time.perf_counter() - start
+        self.stats.collections += 1
+        self.stats.freed += freed
+        self.stats.live = len(marked)
+        self.stats.pause = pause
+        self.stats.total_pause += pause
+        self.countdown = max(self.threshold, len(marked))
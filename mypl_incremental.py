@@ -0,0 +1,324 @@
+"""Incremental lexing and parsing of edited MyPL programs.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+An IncrementalParser keeps a program cut into its top-level definitions
+(as found by the pre-scan of mypl_parallel), along with the tokens and
+AST nodes of each one. After a text edit, only the definitions the edit
+touches are lexed and parsed again: the pre-scan restarts at the first
+definition touched and stops at the first definition end after the edit
+that was also a definition end before it, since the rest of the program
+is then cut (and parsed) as before. The definitions after the edit are
+reused, with their offsets shifted, and the lines and columns of their
+tokens shifted if the edit added or removed lines (or moved text on the
+line they start on). A one-line edit within a definition is thus parsed
+in time proportional to that definition, not the program (an edit that
+unbalances the braces re-parses the rest of the program, as its
+definitions all change).
+
+The Program returned is the same as a sequential parse of the edited
+program gives (the changes the semantic checker makes to the reused
+nodes are undone), and an error is reported exactly as a sequential
+parse reports it.
+
+"""
+
+from bisect import bisect_right
+
+from mypl_error import *
+from mypl_iowrapper import StringWrapper
+from mypl_lexer import Lexer
+from mypl_token import *
+from mypl_ast_parser import ASTParser
+from mypl_ast import *
+from mypl_parallel import definition_ends
+
+
+# number of characters compared at a time when diffing two sources
+DIFF_BLOCK_SIZE = 4096
+
+
+def text_edit(old, new):
+    """Returns the start and end offsets of the text in the old source
+    and the text replacing it that give the new source (the smallest
+    such edit that keeps the common prefix and suffix).
+
+    Args:
+        old -- The old program text.
+        new -- The new program text.
+
+    """
+    limit = min(len(old), len(new))
+    start = 0
+    while (start + DIFF_BLOCK_SIZE <= limit and
+           old[start:start + DIFF_BLOCK_SIZE] == new[start:start + DIFF_BLOCK_SIZE]):
+        start += DIFF_BLOCK_SIZE
+    while start < limit and old[start] == new[start]:
+        start += 1
+    size = 0
+    while (size + DIFF_BLOCK_SIZE <= limit - start and
+           old[len(old) - size - DIFF_BLOCK_SIZE:len(old) - size] ==
+           new[len(new) - size - DIFF_BLOCK_SIZE:len(new) - size]):
+        size += DIFF_BLOCK_SIZE
+    while size < limit - start and old[len(old) - size - 1] == new[len(new) - size - 1]:
+        size += 1
+    return start, len(old) - size, new[start:len(new) - size]
+
+
+def find_data_types(program_node):
+    """Returns the DataType nodes of a Program AST node (the types of its
+    fields, functions, parameters, and variables).
+
+    """
+    data_types = [field.data_type for struct in program_node.struct_defs
+                  for field in struct.fields]
+    nodes = []
+    for fun in program_node.fun_defs:
+        data_types.append(fun.return_type)
+        data_types += [param.data_type for param in fun.params]
+        nodes += fun.stmts
+    # (an else_ifs or else_stmts list holds each BasicIf once per
+    # statement in it)
+    seen = set()
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, VarDecl):
+            data_types.append(node.var_def.data_type)
+        elif isinstance(node, IfStmt):
+            nodes.append(node.if_part)
+            nodes += node.else_ifs
+            nodes += node.else_stmts
+        elif isinstance(node, (WhileStmt, ForStmt, BasicIf)) and id(node) not in seen:
+            seen.add(id(node))
+            if isinstance(node, ForStmt):
+                nodes.append(node.var_decl)
+            nodes += node.stmts
+    return [data_type for data_type in data_types if isinstance(data_type, DataType)]
+
+
+
+class TokenRecorder:
+    """Lexer wrapper that keeps the tokens it returns."""
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.tokens = []
+
+    def next_token(self):
+        """Returns (and keeps) the next token of the lexer."""
+        token = self.lexer.next_token()
+        self.tokens.append(token)
+        return token
+
+
+
+class Definition:
+    """A top-level definition (with the text before it) of a program."""
+
+    def __init__(self, start, end, line, column):
+        """Creates an unparsed definition.
+
+        Args:
+            start -- The offset of the definition in the program.
+            end -- The offset just after the definition.
+            line -- The line the lexer is on at start.
+            column -- The column the lexer is at before start.
+
+        """
+        self.start = start
+        self.end = end
+        self.line = line
+        self.column = column
+        self.struct_defs = []
+        self.fun_defs = []
+        # the tokens (in the AST nodes), the DataType nodes with their
+        # parsed is_array values, and the type name tokens with their
+        # parsed lexemes and token types
+        self.tokens = []
+        self.data_types = []
+        self.type_names = []
+        # the error parsing the definition (if any), and whether it was
+        # found at its end (where the next definition could continue it)
+        self.error = None
+        self.error_at_end = False
+
+
+    def parse(self, source):
+        """Lexes and parses the definition.
+
+        Args:
+            source -- The program text.
+
+        """
+        lexer = Lexer(StringWrapper(source[self.start:self.end]))
+        lexer.line = self.line
+        lexer.column = self.column
+        recorder = TokenRecorder(lexer)
+        parser = ASTParser(recorder)
+        try:
+            program_node = parser.parse()
+        except MyPLError as ex:
+            self.struct_defs, self.fun_defs = [], []
+            self.tokens, self.data_types, self.type_names = [], [], []
+            self.error = ex
+            token = parser.curr_token
+            self.error_at_end = token is not None and token.token_type == TokenType.EOS
+            return
+        self.struct_defs = program_node.struct_defs
+        self.fun_defs = program_node.fun_defs
+        self.tokens = recorder.tokens
+        data_types = find_data_types(program_node)
+        self.data_types = [(data_type, data_type.is_array) for data_type in data_types]
+        # (the type names of the data types and of the new expressions,
+        # i.e., the tokens following new)
+        type_names = [data_type.type_name for data_type in data_types]
+        type_names += [self.tokens[i + 1] for i in range(len(self.tokens) - 1)
+                       if self.tokens[i].token_type == TokenType.NEW]
+        self.type_names = [(token, token.lexeme, token.token_type) for token in type_names]
+        self.error = None
+        self.error_at_end = False
+
+
+    def shift(self, offset, lines, columns, line):
+        """Moves the definition within the program.
+
+        Args:
+            offset -- The number of characters it moves by.
+            lines -- The number of lines it moves by.
+            columns -- The number of columns the tokens on the given line
+                       move by.
+            line -- The line whose tokens move by columns.
+
+        """
+        self.start += offset
+        self.end += offset
+        if self.line == line:
+            self.column += columns
+        self.line += lines
+        if lines or columns:
+            for token in self.tokens:
+                if token.line == line:
+                    token.column += columns
+                token.line += lines
+
+
+
+class IncrementalParser:
+
+    def __init__(self, source):
+        """Creates a parser of the program, lexing and parsing each of
+        its definitions.
+
+        Args:
+            source -- The program text.
+
+        """
+        self.source = source
+        self.definitions = self.scan(0, 1, 0)[0]
+        for definition in self.definitions:
+            definition.parse(source)
+
+
+    def scan(self, start, line, column, sync=None):
+        """Cuts the program into definitions from the given offset on,
+        returning the (unparsed) definitions, the index of the old
+        definition the scan stopped after (None if it reached the end of
+        the program), and the line and column the lexer is at there.
+
+        Args:
+            start -- The offset to scan from (between definitions).
+            line -- The line the lexer is on at start.
+            column -- The column the lexer is at before start.
+            sync -- The index of the first old definition, the offset
+                    change of the edit, and the offset of the end of the
+                    edited text in the new program (None to scan to the
+                    end of the program).
+
+        """
+        definitions = []
+        for end, end_line, line_start in definition_ends(self.source, start, line,
+                                                         start - column):
+            definitions.append(Definition(start, end, line, column))
+            start, line, column = end, end_line, end - line_start
+            if sync is not None:
+                index, offset, edit_end = sync
+                old = self.definitions
+                # (the last old definition runs to the end of the program)
+                while index < len(old) - 1 and old[index].end + offset < end:
+                    index += 1
+                sync = (index, offset, edit_end)
+                if end > edit_end and index < len(old) - 1 and old[index].end + offset == end:
+                    return definitions, index, line, column
+        definitions.append(Definition(start, len(self.source), line, column))
+        return definitions, None, line, column
+
+
+    def edit(self, start, end, text):
+        """Replaces the program text from start to end with the given
+        text, re-parsing the definitions it changes.
+
+        Args:
+            start -- The offset of the first character replaced.
+            end -- The offset just after the last character replaced.
+            text -- The text replacing them.
+
+        """
+        self.source = self.source[:start] + text + self.source[end:]
+        offset = len(text) - (end - start)
+        old = self.definitions
+        # the first definition the edit touches (the text of one that
+        # ends where the edit starts is unchanged)
+        first = min(bisect_right(old, start, key=lambda definition: definition.end),
+                    len(old) - 1)
+        first_definition = old[first]
+        sync = (first, offset, start + len(text))
+        definitions, last, line, column = self.scan(first_definition.start,
+                                                    first_definition.line,
+                                                    first_definition.column, sync)
+        for definition in definitions:
+            definition.parse(self.source)
+        if last is None:
+            self.definitions = old[:first] + definitions
+            return
+        # the definitions after the last one scanned are as before, but
+        # start where the scan stopped
+        reused = old[last + 1:]
+        lines = line - reused[0].line
+        columns = column - reused[0].column
+        line = reused[0].line
+        for definition in reused:
+            # (only the text on the line the scan stopped on moves across)
+            if definition.line != line:
+                columns = 0
+            definition.shift(offset, lines, columns, line)
+            if definition.error is not None and (lines or columns):
+                # (its error message has the old position)
+                definition.parse(self.source)
+        self.definitions = old[:first] + definitions + reused
+
+
+    def parse(self):
+        """Returns the Program AST node of the program, made of the parsed
+        definitions (so unchanged definitions keep their nodes).
+
+        """
+        program_node = Program([], [])
+        for definition in self.definitions:
+            if definition.error is not None:
+                if definition.error_at_end and definition is not self.definitions[-1]:
+                    # (a sequential parse would go on to the next
+                    # definition, so its error may differ)
+                    return ASTParser(Lexer(StringWrapper(self.source))).parse()
+                raise definition.error
+            program_node.struct_defs += definition.struct_defs
+            program_node.fun_defs += definition.fun_defs
+            # (the semantic checker changes is_array and the type names of
+            # the types it checks)
+            for data_type, is_array in definition.data_types:
+                data_type.is_array = is_array
+            for token, lexeme, token_type in definition.type_names:
+                token.lexeme = lexeme
+                token.token_type = token_type
+        return program_node
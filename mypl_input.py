@@ -0,0 +1,92 @@
+"""Buffered input for MyPL programs.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+The VM (and the fast mode) reads program input through an InputSource,
+which reads its stream in large chunks and splits off one line at a
+time as the program asks for it. For standard input, each chunk is
+whatever is available (up to the chunk size), so reading from a
+terminal still returns as soon as a line is entered.
+
+"""
+
+import codecs
+import sys
+
+
+# default (maximum) number of bytes or characters read at a time
+INPUT_CHUNK_SIZE = 65536
+
+
+class InputSource:
+
+    def __init__(self, stream=None, chunk_size=INPUT_CHUNK_SIZE):
+        """Creates a buffered input source.
+
+        Args:
+            stream -- The (text) stream to read from (standard input, as
+                      of the first read, if None).
+            chunk_size -- The (maximum) size of each read.
+
+        """
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.at_eof = False
+        self.read_chunk = None
+
+
+    def readline(self):
+        """Returns the next line (without its line ending), or None if
+        there is no more input.
+
+        """
+        end = self.buffer.find('\n', self.pos)
+        while end < 0 and not self.at_eof:
+            self.fill()
+            end = self.buffer.find('\n', self.pos)
+        if end < 0:
+            # the last line may not end with a newline
+            if self.pos >= len(self.buffer):
+                return None
+            end = len(self.buffer)
+        line = self.buffer[self.pos:end]
+        self.pos = end + 1
+        if line.endswith('\r'):
+            line = line[:-1]
+        return line
+
+
+    def fill(self):
+        """Reads the next chunk of the stream onto the unread input."""
+        if self.read_chunk is None:
+            self.read_chunk = self.chunk_reader()
+        chunk = self.read_chunk()
+        if not chunk:
+            self.at_eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+
+    def chunk_reader(self):
+        """Returns a function reading the next chunk of the stream (the
+        empty string at the end of the stream).
+
+        """
+        stream = self.stream if self.stream is not None else sys.stdin
+        raw = getattr(stream, 'buffer', None)
+        if raw is None or not hasattr(raw, 'read1'):
+            return lambda: stream.read(self.chunk_size)
+        # read the bytes available (blocking only if there are none)
+        decoder = codecs.getincrementaldecoder(stream.encoding or 'utf-8')()
+        def read():
+            while True:
+                data = raw.read1(self.chunk_size)
+                text = decoder.decode(data, final=not data)
+                # (a chunk may end within a multi-byte character)
+                if text or not data:
+                    return text
+        return read
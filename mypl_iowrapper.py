@@ -6,34 +6,66 @@ CLASS: CPSC 326
 
 """
 
+import codecs
+
+
+# default (maximum) number of bytes or characters read at a time
+SOURCE_CHUNK_SIZE = 65536
+
 
 class StdInWrapper:
     """Standard input wrapper for reading and peeking."""
 
-    def __init__(self, stream):
+    def __init__(self, stream, chunk_size=SOURCE_CHUNK_SIZE):
         self.stream = stream.buffer
-        
+        self.chunk_size = chunk_size
+        # (a chunk may end within a multi-byte character)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        # decoded characters not yet read, from pos on
+        self.text = ''
+        self.pos = 0
+
     def read_char(self):
         """Returns and removes a single character in stream."""
-        return self.stream.read(1).decode('utf-8')
+        ch = self.peek_char()
+        self.pos += len(ch)
+        return ch
 
     def peek_char(self):
         """Returns next character in stream to be read."""
-        if not self.stream.peek(1):
-            return ''
-        return self.stream.peek(1).decode('utf-8')[0]
+        if self.pos >= len(self.text):
+            self.text = self.read_chunk()
+            self.pos = 0
+        return self.text[self.pos:self.pos + 1]
+
+    def read_chunk(self):
+        """Returns and removes the next chunk of the stream (the empty
+        string at the end of the stream).
+
+        """
+        if self.pos < len(self.text):
+            chunk = self.text[self.pos:]
+            self.text = ''
+            self.pos = 0
+            return chunk
+        while True:
+            data = self.stream.read(self.chunk_size)
+            chunk = self.decoder.decode(data, final=not data)
+            if chunk or not data:
+                return chunk
 
     def close(self):
         """Closes the stream."""
         pass # nothing to do
 
 
-    
+
 class FileWrapper:
     """File input wrapper for reading and peeking."""
 
-    def __init__(self, stream):
+    def __init__(self, stream, chunk_size=SOURCE_CHUNK_SIZE):
         self.stream = stream
+        self.chunk_size = chunk_size
 
     def read_char(self):
         """Returns and removes a single character in stream."""
@@ -46,8 +78,42 @@ class FileWrapper:
         self.stream.seek(loc)
         return ch
 
+    def read_chunk(self):
+        """Returns and removes the next chunk of the stream (the empty
+        string at the end of the stream).
+
+        """
+        return self.stream.read(self.chunk_size)
+
     def close(self):
         """Closes the stream."""
         self.stream.close()
-        
 
+
+
+class StringWrapper:
+    """Wrapper for reading and peeking a program held in a string."""
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def read_char(self):
+        """Returns and removes a single character in stream."""
+        ch = self.text[self.pos:self.pos + 1]
+        self.pos += len(ch)
+        return ch
+
+    def peek_char(self):
+        """Returns next character in stream to be read."""
+        return self.text[self.pos:self.pos + 1]
+
+    def read_chunk(self):
+        """Returns and removes the rest of the string."""
+        chunk = self.text[self.pos:]
+        self.pos = len(self.text)
+        return chunk
+
+    def close(self):
+        """Closes the stream."""
+        pass # nothing to do
@@ -4,12 +4,69 @@ NAME: Connor Jones
 DATE: Spring 2024
 CLASS: CPSC 326
 
+The lexer reads the program in chunks into a window of text and
+matches the common tokens (ASCII identifiers and numbers, one-line
+strings, comments, and operators, along with any spaces before them)
+at the current position with a single compiled pattern. Anything else
+(errors, non-ASCII text, strings with line breaks, and tokens cut off
+by the end of the window) is scanned one character at a time by
+scan_token. The window only holds the unscanned text, so memory use
+does not grow with the size of the program.
+
 """
 
+import re
+
 from mypl_token import *
 from mypl_error import *
 
 
+# the common tokens (after any spaces or tabs), each in its own group,
+# most frequent first; identifiers and numbers followed by a character
+# that could continue them differently (i.e., a non-ASCII character, or
+# a '.' after a number) are left to scan_token, as are numbers with
+# leading zeros
+TOKEN_PATTERN = re.compile(r"""
+  [ \t\r]*
+  (?:
+    (?P<id>[A-Za-z][A-Za-z0-9_]*)(?![A-Za-z0-9_]|[^\x00-\x7f])
+  | (?P<symbol>[=!<>]=|[;()\[\]{}.,+\-*=<>]|/(?!/))
+  | (?P<int>0|[1-9][0-9]*)(?![0-9.]|[^\x00-\x7f])
+  | (?P<newline>\n)
+  | (?P<string>"[^"\n]*")
+  | (?P<double>(?:0|[1-9][0-9]*)\.[0-9]+)(?![0-9.]|[^\x00-\x7f])
+  | (?P<comment>//[^\n]*)
+  )
+""", re.VERBOSE)
+
+# the window is refilled before matching if fewer characters than this
+# are left in it (tokens that are longer are still scanned correctly)
+SCAN_MARGIN = 256
+
+# token types of the reserved words (other words are identifiers)
+RESERVED_WORDS = {
+    'struct': TokenType.STRUCT, 'array': TokenType.ARRAY, 'for': TokenType.FOR,
+    'while': TokenType.WHILE, 'if': TokenType.IF, 'elseif': TokenType.ELSEIF,
+    'else': TokenType.ELSE, 'new': TokenType.NEW, 'return': TokenType.RETURN,
+    'int': TokenType.INT_TYPE, 'double': TokenType.DOUBLE_TYPE,
+    'string': TokenType.STRING_TYPE, 'bool': TokenType.BOOL_TYPE,
+    'void': TokenType.VOID_TYPE, 'null': TokenType.NULL_VAL,
+    'true': TokenType.BOOL_VAL, 'false': TokenType.BOOL_VAL,
+    'and': TokenType.AND, 'or': TokenType.OR, 'not': TokenType.NOT,
+}
+
+# token types of the punctuation and operators
+SYMBOLS = {
+    ';': TokenType.SEMICOLON, '(': TokenType.LPAREN, ')': TokenType.RPAREN,
+    '[': TokenType.LBRACKET, ']': TokenType.RBRACKET, '{': TokenType.LBRACE,
+    '}': TokenType.RBRACE, '.': TokenType.DOT, ',': TokenType.COMMA,
+    '+': TokenType.PLUS, '-': TokenType.MINUS, '*': TokenType.TIMES,
+    '/': TokenType.DIVIDE, '=': TokenType.ASSIGN, '==': TokenType.EQUAL,
+    '!=': TokenType.NOT_EQUAL, '<': TokenType.LESS, '<=': TokenType.LESS_EQ,
+    '>': TokenType.GREATER, '>=': TokenType.GREATER_EQ,
+}
+
+
 class Lexer:
     """For obtaining a token stream from a program."""
 
@@ -23,17 +80,43 @@ class Lexer:
         self.in_stream = in_stream
         self.line = 1
         self.column = 0
+        # the window of program text, the position of the next character
+        # in it, and whether the rest of the program is in the window
+        self.text = ''
+        self.pos = 0
+        self.at_eof = False
+        # position of the window in the program
+        self.offset = 0
+
+
+    def fill(self):
+        """Reads the next chunk of the program into the window (dropping
+        the scanned text).
+
+        """
+        chunk = self.in_stream.read_chunk()
+        if not chunk:
+            self.at_eof = True
+        self.offset += self.pos
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
 
 
     def read(self):
         """Returns and removes one character from the input stream."""
         self.column += 1
-        return self.in_stream.read_char()
+        if self.pos >= len(self.text) and not self.at_eof:
+            self.fill()
+        ch = self.text[self.pos:self.pos + 1]
+        self.pos += len(ch)
+        return ch
 
     
     def peek(self):
         """Returns but doesn't remove one character from the input stream."""
-        return self.in_stream.peek_char()
+        if self.pos >= len(self.text) and not self.at_eof:
+            self.fill()
+        return self.text[self.pos:self.pos + 1]
 
     
     def eof(self, ch):
@@ -47,6 +130,52 @@ class Lexer:
     
     def next_token(self):
         """Return the next token in the lexer's input stream."""
+        if len(self.text) - self.pos < SCAN_MARGIN and not self.at_eof:
+            self.fill()
+        text = self.text
+        match = TOKEN_PATTERN.match(text, self.pos)
+        while match is not None:
+            end = match.end()
+            if end == len(text) and not self.at_eof:
+                # the token may continue in the next chunk
+                self.fill()
+                text = self.text
+                match = TOKEN_PATTERN.match(text, self.pos)
+                continue
+            kind = match.lastgroup
+            start = match.start(kind)
+            self.pos = end
+            if kind == 'newline':
+                self.line += 1
+                self.column = 0
+            else:
+                start_col = self.column + start - match.start() + 1
+                self.column = start_col + end - start - 1
+                if kind == 'id':
+                    lexeme = text[start:end]
+                    return Token(RESERVED_WORDS.get(lexeme, TokenType.ID), lexeme,
+                                 self.line, start_col)
+                elif kind == 'symbol':
+                    lexeme = text[start:end]
+                    return Token(SYMBOLS[lexeme], lexeme, self.line, start_col)
+                elif kind == 'int':
+                    return Token(TokenType.INT_VAL, text[start:end], self.line, start_col)
+                elif kind == 'string':
+                    return Token(TokenType.STRING_VAL, text[start + 1:end - 1],
+                                 self.line, start_col)
+                elif kind == 'double':
+                    return Token(TokenType.DOUBLE_VAL, text[start:end], self.line, start_col)
+                elif kind == 'comment':
+                    return Token(TokenType.COMMENT, text[start + 2:end], self.line, start_col)
+            if len(text) - end < SCAN_MARGIN and not self.at_eof:
+                self.fill()
+                text = self.text
+            match = TOKEN_PATTERN.match(text, self.pos)
+        return self.scan_token()
+
+
+    def scan_token(self):
+        """Return the next token, reading one character at a time."""
         # read initial character
         ch = self.read()
         
@@ -209,6 +338,8 @@ class Lexer:
             if string_lexeme == '"':
                 return Token(TokenType.STRING_VAL, '', self.line, start_col)
             while self.peek() != '"':
+                if self.eof(self.peek()):
+                    self.error("Reached end of file while reading string", self.line, self.column)
                 string_lexeme += self.read()
                 if self.peek() == '\n':
                     tmp = self.read()
@@ -0,0 +1,264 @@
+"""Automatic memoization of pure MyPL functions.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+A function is pure if its parameters and return value are all of base
+types (int, double, bool, or string), it only declares base-type
+variables, it never creates, reads, or writes struct or array objects,
+it never does input or output, and every function it calls is pure.
+Such a function always returns the same value for the same arguments,
+so once memoized, the VM returns cached results for repeated calls
+instead of running them. Each memoized function has its own bounded
+(least recently used) cache keyed by the argument tuple (with the sign
+of each zero double, since 0.0 and -0.0 are equal but print differently).
+
+"""
+
+import math
+from collections import OrderedDict
+
+from mypl_ast import *
+from mypl_frame import MISSING
+from mypl_semantic_checker import BASE_TYPES, BUILT_INS
+
+
+# default maximum number of cached results per function
+MEMO_SIZE = 10000
+
+# built-in functions with side effects
+IMPURE_BUILT_INS = ['print', 'input', 'readint', 'readdouble']
+
+
+class MemoCache:
+
+    def __init__(self, function_name, max_size=MEMO_SIZE):
+        """Creates an empty cache of a function's results.
+
+        Args:
+            function_name -- The name of the memoized function.
+            max_size -- The maximum number of results kept.
+
+        """
+        self.function_name = function_name
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __str__(self):
+        return (f'{self.function_name}: {self.hits} hits, {self.misses} misses, '
+                f'{len(self.entries)} cached')
+
+
+    def key(self, args):
+        """Returns the cache key for the arguments of a call.
+
+        Args:
+            args -- The argument values.
+
+        """
+        key = tuple(args)
+        if 0.0 in key:
+            # (-0.0 == 0.0, so zero doubles are keyed with their sign)
+            key = tuple((arg, math.copysign(1.0, arg)) if type(arg) is float else arg
+                        for arg in key)
+        return key
+
+
+    def lookup(self, key):
+        """Returns the cached result for the argument tuple, or MISSING."""
+        value = self.entries.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+
+    def store(self, key, value):
+        """Caches the result for the argument tuple, evicting the least
+        recently used result if the cache is full.
+
+        """
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+
+class PurityChecker (Visitor):
+
+    def __init__(self):
+        """Creates a purity checker. After visiting a program, the names
+        of its pure functions are in pure_functions.
+
+        """
+        self.pure_functions = set()
+        # function name -> names of the (non built-in) functions it calls
+        self.calls = {}
+        self.callees = set()
+        # whether the function being visited is pure (so far)
+        self.pure = True
+
+
+    def base_type(self, data_type):
+        """True if the data type is a (non-array) base type."""
+        return not data_type.is_array and data_type.type_name.lexeme in BASE_TYPES
+
+
+    def visit_program(self, program):
+        candidates = set()
+        for fun_def in program.fun_defs:
+            fun_def.accept(self)
+            if self.pure and fun_def.fun_name.lexeme != 'main':
+                candidates.add(fun_def.fun_name.lexeme)
+        # remove functions that call impure ones until none are left
+        changed = True
+        while changed:
+            changed = False
+            for name in list(candidates):
+                if not self.calls[name] <= candidates:
+                    candidates.remove(name)
+                    changed = True
+        self.pure_functions = candidates
+
+
+    def visit_fun_def(self, fun_def):
+        self.pure = self.base_type(fun_def.return_type)
+        self.calls[fun_def.fun_name.lexeme] = self.callees = set()
+        for param in fun_def.params:
+            if not self.base_type(param.data_type):
+                self.pure = False
+        for stmt in fun_def.stmts:
+            stmt.accept(self)
+
+
+    def visit_return_stmt(self, return_stmt):
+        return_stmt.expr.accept(self)
+
+
+    def visit_var_decl(self, var_decl):
+        if not self.base_type(var_decl.var_def.data_type):
+            self.pure = False
+        if var_decl.expr != None:
+            var_decl.expr.accept(self)
+
+
+    def visit_assign_stmt(self, assign_stmt):
+        if len(assign_stmt.lvalue) > 1 or assign_stmt.lvalue[0].array_expr != None:
+            self.pure = False
+        assign_stmt.expr.accept(self)
+
+
+    def visit_while_stmt(self, while_stmt):
+        while_stmt.condition.accept(self)
+        for stmt in while_stmt.stmts:
+            stmt.accept(self)
+
+
+    def visit_for_stmt(self, for_stmt):
+        for_stmt.var_decl.accept(self)
+        for_stmt.condition.accept(self)
+        for_stmt.assign_stmt.accept(self)
+        for stmt in for_stmt.stmts:
+            stmt.accept(self)
+
+
+    def visit_if_stmt(self, if_stmt):
+        for part in [if_stmt.if_part] + if_stmt.else_ifs + if_stmt.else_stmts:
+            if part.condition != None:
+                part.condition.accept(self)
+            for stmt in part.stmts:
+                stmt.accept(self)
+
+
+    def visit_call_expr(self, call_expr):
+        fun_name = call_expr.fun_name.lexeme
+        if fun_name in IMPURE_BUILT_INS:
+            self.pure = False
+        elif fun_name not in BUILT_INS:
+            self.callees.add(fun_name)
+        for arg in call_expr.args:
+            arg.accept(self)
+
+
+    def visit_expr(self, expr):
+        expr.first.accept(self)
+        if expr.op != None:
+            expr.rest.accept(self)
+
+
+    def visit_simple_term(self, simple_term):
+        simple_term.rvalue.accept(self)
+
+
+    def visit_complex_term(self, complex_term):
+        complex_term.expr.accept(self)
+
+
+    def visit_new_rvalue(self, new_rvalue):
+        self.pure = False
+
+
+    def visit_var_rvalue(self, var_rvalue):
+        if len(var_rvalue.path) > 1 or var_rvalue.path[0].array_expr != None:
+            self.pure = False
+
+
+
+def pure_functions(program):
+    """Returns the (sorted) names of the pure functions of the (checked)
+    program AST.
+
+    """
+    checker = PurityChecker()
+    program.accept(checker)
+    return sorted(checker.pure_functions)
+
+
+def memoize(vm, program, max_size=MEMO_SIZE):
+    """Memoizes the pure functions of the program, returning their caches.
+
+    Args:
+        vm -- The VM holding the program's frame templates.
+        program -- The (checked) program AST.
+        max_size -- The maximum number of results cached per function.
+
+    """
+    return memoize_functions(vm, pure_functions(program), max_size)
+
+
+def memoize_functions(vm, names, max_size=MEMO_SIZE):
+    """Memoizes the named (pure) functions, returning their caches.
+
+    Args:
+        vm -- The VM holding the program's frame templates.
+        names -- The names of the functions.
+        max_size -- The maximum number of results cached per function.
+
+    """
+    caches = []
+    for name in names:
+        template = vm.frame_templates[name]
+        template.memo = MemoCache(name, max_size)
+        caches.append(template.memo)
+    return caches
+
+
+def memoized(function, cache):
+    """Returns a python function caching the results of the given
+    (compiled) function.
+
+    """
+    def call(*args):
+        key = cache.key(args)
+        value = cache.lookup(key)
+        if value is MISSING:
+            value = function(*args)
+            cache.store(key, value)
+        return value
+    return call
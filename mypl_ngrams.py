@@ -0,0 +1,140 @@
+"""Instruction n-gram miner for choosing VM superinstructions.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+Counts the opcode sequences (n-grams) of the code generated for a set of
+mypl programs. Only sequences within a basic block are counted, i.e.,
+that contain no jump target after their first instruction and no jump,
+call, or return before their last instruction. These are the sequences
+that could be fused into a superinstruction. With --dynamic, each
+program is run and every sequence is weighted by the number of times
+its first instruction was executed.
+
+"""
+
+import argparse
+import collections
+import glob
+import io
+
+from mypl_error import MyPLError
+from mypl_opcode import OpCode
+from mypl_vm import VM
+from mypl_bench import compile_program
+
+
+# instructions that end a basic block
+BLOCK_ENDS = {OpCode.JMP, OpCode.JMPF, OpCode.JMPFR, OpCode.CMPLT_JMPF,
+              OpCode.CMPLE_JMPF, OpCode.CALL, OpCode.RET, OpCode.TAILCALL}
+
+
+def block_ngrams(template, n):
+    """Yields the (start offset, opcode names) of each n-gram of the
+    template's instructions that lies within a basic block.
+
+    Args:
+        template -- The frame template.
+        n -- The n-gram length.
+
+    """
+    instructions = template.instructions
+    targets = set()
+    for instr in instructions:
+        if instr.opcode in (OpCode.JMP, OpCode.JMPF, OpCode.CMPLT_JMPF, OpCode.CMPLE_JMPF):
+            targets.add(instr.operand)
+        elif instr.opcode == OpCode.JMPFR:
+            targets.add(instr.operand[-1])
+    for start in range(len(instructions) - n + 1):
+        window = instructions[start:start + n]
+        if any(start + i in targets for i in range(1, n)):
+            continue
+        if any(instr.opcode in BLOCK_ENDS for instr in window[:-1]):
+            continue
+        yield start, tuple(instr.opcode.name for instr in window)
+
+
+def execution_counts(templates):
+    """Runs the program and returns how many times each instruction was
+    executed, as a counter keyed by (function name, offset). The program
+    output is discarded.
+
+    Args:
+        templates -- The frame templates of the program.
+
+    """
+    counts = collections.Counter()
+
+    def counting(handler):
+        def run(frame, operand):
+            counts[(frame.template.function_name, frame.pc - 1)] += 1
+            return handler(frame, operand)
+        return run
+
+    vm = VM(output=io.StringIO())
+    vm.frame_templates = templates
+    vm.dispatch = [counting(handler) for handler in vm.dispatch]
+    vm.run()
+    return counts
+
+
+def mine(filenames, sizes, dynamic=False, optimize=False):
+    """Returns a counter of n-gram frequencies for each n-gram size over
+    the given programs.
+
+    Args:
+        filenames -- The mypl program files.
+        sizes -- The n-gram sizes to count.
+        dynamic -- If true, weights each n-gram by its execution count.
+        optimize -- If true, mines the optimized (--opt) code.
+
+    """
+    ngrams = {n: collections.Counter() for n in sizes}
+    for filename in filenames:
+        try:
+            templates = compile_program(filename, optimize=optimize)
+            counts = execution_counts(templates) if dynamic else None
+        except MyPLError as ex:
+            print(f'skipping {filename}: {ex}')
+            continue
+        for name, template in templates.items():
+            for n in sizes:
+                for start, ngram in block_ngrams(template, n):
+                    weight = counts[(name, start)] if dynamic else 1
+                    if weight:
+                        ngrams[n][ngram] += weight
+    return ngrams
+
+
+def print_ngrams(ngrams, top):
+    """Prints the most frequent n-grams of each size.
+
+    Args:
+        ngrams -- The n-gram counters (by size).
+        top -- The number of n-grams to print per size.
+
+    """
+    for n, counter in ngrams.items():
+        total = sum(counter.values()) or 1
+        print(f'{n}-grams')
+        for ngram, count in counter.most_common(top):
+            print(f'  {count:>12} {100 * count / total:>6.2f}%  {" ".join(ngram)}')
+
+
+if __name__ == '__main__':
+    about = 'Count VM instruction n-grams over mypl programs (default: test_files/).'
+    argparser = argparse.ArgumentParser(prog='mypl_ngrams', description=about)
+    help_msg = 'n-gram sizes to count (default: 2 3 4)'
+    argparser.add_argument('-n', type=int, nargs='+', default=[2, 3, 4], help=help_msg)
+    help_msg = 'number of n-grams to list per size'
+    argparser.add_argument('-t', '--top', type=int, default=10, help=help_msg)
+    help_msg = 'weight each n-gram by how often it runs (runs the programs)'
+    argparser.add_argument('--dynamic', action='store_true', help=help_msg)
+    help_msg = 'mine the optimized (--opt) instructions'
+    argparser.add_argument('--opt', action='store_true', help=help_msg)
+    help_msg = 'mypl program files to mine'
+    argparser.add_argument('filenames', nargs='*', help=help_msg)
+    args = argparser.parse_args()
+    filenames = args.filenames or sorted(glob.glob('test_files/*.mypl'))
+    print_ngrams(mine(filenames, args.n, args.dynamic, args.opt), args.top)
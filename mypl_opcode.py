@@ -5,12 +5,13 @@ DATE: Spring 2024
 CLASS: CPSC 326
 
 """
-from enum import Enum
+from enum import IntEnum
 
 # instruction opcodes where A is the operand (argument); push and pop
 # operations are applied to the operand stack, and x, y, and z are stack
-# values
-OpCode = Enum('OpCode', [
+# values. Opcodes are small ints (starting at 1) so the VM can index its
+# dispatch table with them directly.
+OpCode = IntEnum('OpCode', [
 
     # literals and variables
     'PUSH',    # push operand A
@@ -36,12 +37,16 @@ OpCode = Enum('OpCode', [
     'JMPF',    # pop x, if x is False jump to instruction offset A
 
     # functions
-    'CALL',    # call function A (pop and push arguments)
+    'CALL',    # call function A (pop arguments into its first variables)
     'RET',     # return from current function
+    'TAILCALL',  # call function A in place of the current function (whose
+                 # caller receives its return value)
 
     # built ins
     'WRITE',   # pop x, print x to standard output
-    'READ',    # read standard input, push result onto stack
+    'READ',    # read a line of standard input, push result onto stack
+    'READINT', # read a line of standard input, push it as an int
+    'READDBL', # read a line of standard input, push it as a double
     'LEN',     # pop string x, push len(x) if str, else push len(obj(x))
     'GETC',    # pop string x, pop int y, push x[y]
     'TOINT',   # pop x, push int(x)
@@ -49,14 +54,45 @@ OpCode = Enum('OpCode', [
     'TOSTR',   # pop x, push str(x)
 
     # heap
-    'ALLOCS',  # allocate struct object, push oid x
-    'SETF',    # pop value x, pop oid y, set obj(y)[A] = x
-    'GETF',    # pop oid x, push obj(x)[A] onto stack
+    'ALLOCS',  # allocate struct object with A fields, push oid x
+    'SETF',    # pop value x, pop oid y, set field A (offset) of obj(y) = x
+    'GETF',    # pop oid x, push field A (offset) of obj(x) onto stack
     'ALLOCA',  # pop int x, allocate array object with x None values, push oid
+               # (A is the element type name, None for arrays of structs)
     'SETI',    # pop value x, pop index y, pop oid z, set array obj(z)[y] = x
     'GETI',    # pop index x, pop oid y, push obj(y)[x] onto stack
 
     # special
     'DUP',     # pop x, push x, push x
-    'NOP'      # do nothing
+    'NOP',     # do nothing
+
+    # register (three-address) forms used by the register IR, where A is
+    # a tuple (d, a, b) of variable slots, except for the immediate (I)
+    # forms whose last element is a value; no stack values are used
+    'MOV',     # set slot d to slot a (A is (d, a))
+    'MOVI',    # set slot d to value a (A is (d, a))
+    'ADDRR',   # set slot d to (slot a + slot b)
+    'ADDRI',   # set slot d to (slot a + b)
+    'SUBRR',   # set slot d to (slot a - slot b)
+    'SUBRI',   # set slot d to (slot a - b)
+    'MULRR',   # set slot d to (slot a * slot b)
+    'MULRI',   # set slot d to (slot a * b)
+    'DIVRR',   # set slot d to (slot a // slot b) or (slot a / slot b)
+    'DIVRI',   # set slot d to (slot a // b) or (slot a / b)
+    'CMPLTRR', # set slot d to (slot a < slot b)
+    'CMPLTRI', # set slot d to (slot a < b)
+    'CMPLERR', # set slot d to (slot a <= slot b)
+    'CMPLERI', # set slot d to (slot a <= b)
+    'CMPEQRR', # set slot d to (slot a == slot b)
+    'CMPEQRI', # set slot d to (slot a == b)
+    'CMPNERR', # set slot d to (slot a != slot b)
+    'CMPNERI', # set slot d to (slot a != b)
+    'JMPFR',   # if slot a is False jump to instruction offset t (A is (a, t))
+
+    # superinstructions (fused sequences, see mypl_optimizer)
+    'INCR',       # LOAD a; PUSH v; ADD; STORE a (A is (a, v))
+    'LOAD_GETI',  # LOAD a; LOAD i; GETI (A is (a, i))
+    'LOADLOAD',   # LOAD a; LOAD b (A is (a, b))
+    'CMPLT_JMPF', # CMPLT; JMPF A
+    'CMPLE_JMPF', # CMPLE; JMPF A
 ])
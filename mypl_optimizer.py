@@ -0,0 +1,322 @@
+"""Peephole optimizer for MyPL VM instructions.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+The optimizer runs over each frame template after code generation (and
+before the VM runs). Each pass is a function that takes a PeepholeCode
+and returns True if it changed the code; the passes are repeated until
+none of them makes a change. While optimizing, jump operands refer to
+their target instructions (not offsets), so passes can freely remove
+instructions. The offsets are recomputed once the passes are done.
+
+"""
+
+from mypl_opcode import *
+from mypl_frame import *
+
+
+class PeepholeCode:
+
+    def __init__(self, instructions):
+        """Creates the (linked) code for a list of instructions, where each
+        jump operand is replaced by the instruction it jumps to.
+
+        Args:
+            instructions -- The instructions of a frame template.
+
+        """
+        # jump target past the last instruction
+        self.end = VMInstr(OpCode.NOP)
+        self.instrs = list(instructions)
+        for instr in self.instrs:
+            if is_jump(instr):
+                offset = jump_target(instr)
+                target = self.instrs[offset] if offset < len(self.instrs) else self.end
+                set_jump_target(instr, target)
+
+
+    def jumps_to(self, target):
+        """Returns the jumps whose target is the given instruction."""
+        return [instr for instr in self.instrs
+                if is_jump(instr) and jump_target(instr) is target]
+
+
+    def remove(self, index):
+        """Removes the instruction at the given index, retargeting any
+        jumps to it to the following instruction.
+
+        """
+        instr = self.instrs.pop(index)
+        succ = self.instrs[index] if index < len(self.instrs) else self.end
+        for jump in self.jumps_to(instr):
+            set_jump_target(jump, succ)
+
+
+    def unlink(self):
+        """Returns the instructions with the jump targets converted back
+        to instruction offsets.
+
+        """
+        offsets = {id(instr): i for i, instr in enumerate(self.instrs)}
+        offsets[id(self.end)] = len(self.instrs)
+        for instr in self.instrs:
+            if is_jump(instr):
+                set_jump_target(instr, offsets[id(jump_target(instr))])
+        return self.instrs
+
+
+#----------------------------------------------------------------------
+# Jump operands (JMPFR holds its offset in the last tuple element)
+#----------------------------------------------------------------------
+
+def is_jump(instr):
+    return instr.opcode in (OpCode.JMP, OpCode.JMPF, OpCode.JMPFR, OpCode.CMPLT_JMPF,
+                            OpCode.CMPLE_JMPF)
+
+def jump_target(instr):
+    if instr.opcode == OpCode.JMPFR:
+        return instr.operand[-1]
+    return instr.operand
+
+def set_jump_target(instr, target):
+    if instr.opcode == OpCode.JMPFR:
+        instr.operand = instr.operand[:-1] + (target,)
+    else:
+        instr.operand = target
+
+
+#----------------------------------------------------------------------
+# Passes
+#----------------------------------------------------------------------
+
+def remove_nops(code):
+    """Removes NOP instructions (used as jump landing pads)."""
+    changed = False
+    i = 0
+    while i < len(code.instrs):
+        if code.instrs[i].opcode == OpCode.NOP:
+            code.remove(i)
+            changed = True
+        else:
+            i += 1
+    return changed
+
+
+# branch -> function returning the instructions it leaves when it jumps
+# to the next instruction
+BRANCH_POPS = {
+    OpCode.JMPF: lambda: [POP()],
+    OpCode.CMPLT_JMPF: lambda: [CMPLT(), POP()],
+    OpCode.CMPLE_JMPF: lambda: [CMPLE(), POP()],
+}
+
+
+def thread_jumps(code):
+    """Retargets jumps to unconditional jumps to the final target, and
+    removes jumps to the next instruction.
+
+    """
+    changed = False
+    for instr in code.instrs:
+        if not is_jump(instr):
+            continue
+        target = jump_target(instr)
+        seen = {id(instr)}
+        while target.opcode == OpCode.JMP and id(target) not in seen:
+            seen.add(id(target))
+            target = jump_target(target)
+        if target is not jump_target(instr):
+            set_jump_target(instr, target)
+            changed = True
+    i = 0
+    while i < len(code.instrs):
+        instr = code.instrs[i]
+        succ = code.instrs[i + 1] if i + 1 < len(code.instrs) else code.end
+        if is_jump(instr) and jump_target(instr) is succ:
+            if instr.opcode in BRANCH_POPS:
+                # still compares (which checks its operands) and pops the
+                # condition
+                code.instrs[i:i + 1] = BRANCH_POPS[instr.opcode]()
+                for jump in code.jumps_to(instr):
+                    set_jump_target(jump, code.instrs[i])
+                i += len(BRANCH_POPS[instr.opcode]())
+            else:
+                code.remove(i)
+            changed = True
+        else:
+            i += 1
+    return changed
+
+
+def remove_dead_code(code):
+    """Removes unreachable instructions following a JMP, RET, or
+    TAILCALL (e.g., the PUSH None; RET after an explicit return).
+
+    """
+    changed = False
+    i = 1
+    while i < len(code.instrs):
+        prev = code.instrs[i - 1].opcode
+        if prev in (OpCode.JMP, OpCode.RET, OpCode.TAILCALL) and not code.jumps_to(code.instrs[i]):
+            code.remove(i)
+            changed = True
+        else:
+            i += 1
+    return changed
+
+
+def fuse_pairs(code):
+    """Rewrites common instruction pairs: STORE n; LOAD n becomes DUP;
+    STORE n, and a PUSH, LOAD, or DUP directly followed by a POP is
+    removed.
+
+    """
+    changed = False
+    i = 0
+    while i + 1 < len(code.instrs):
+        first, second = code.instrs[i], code.instrs[i + 1]
+        if code.jumps_to(second):
+            i += 1
+        elif first.opcode == OpCode.STORE and second.opcode == OpCode.LOAD \
+             and first.operand == second.operand:
+            code.instrs[i:i + 2] = [DUP(), first]
+            for jump in code.jumps_to(first):
+                set_jump_target(jump, code.instrs[i])
+            changed = True
+            i += 2
+        elif first.opcode in (OpCode.PUSH, OpCode.LOAD, OpCode.DUP) \
+             and second.opcode == OpCode.POP:
+            code.remove(i + 1)
+            code.remove(i)
+            changed = True
+        else:
+            i += 1
+    return changed
+
+
+def match_superinstruction(code, i):
+    """Returns the superinstruction replacing the instructions starting at
+    the given index along with the number of instructions it replaces, or
+    None if there is no match.
+
+    """
+    ops = [instr.opcode for instr in code.instrs[i:i + 4]]
+    args = [instr.operand for instr in code.instrs[i:i + 4]]
+    if ops == [OpCode.LOAD, OpCode.PUSH, OpCode.ADD, OpCode.STORE] and args[0] == args[3]:
+        return INCR(args[0], args[1]), 4
+    elif ops[:3] == [OpCode.LOAD, OpCode.LOAD, OpCode.GETI]:
+        return LOAD_GETI(args[0], args[1]), 3
+    elif ops[:2] == [OpCode.LOAD, OpCode.LOAD] and ops[1:4] != [OpCode.LOAD, OpCode.LOAD, OpCode.GETI]:
+        # (leaves the second LOAD to start a LOAD_GETI)
+        return LOADLOAD(args[0], args[1]), 2
+    elif ops[:2] == [OpCode.CMPLT, OpCode.JMPF]:
+        return CMPLT_JMPF(args[1]), 2
+    elif ops[:2] == [OpCode.CMPLE, OpCode.JMPF]:
+        return CMPLE_JMPF(args[1]), 2
+    return None
+
+
+def fuse_superinstructions(code):
+    """Replaces common instruction sequences (within a basic block) by the
+    corresponding superinstructions, which run with a single dispatch.
+
+    """
+    changed = False
+    i = 0
+    while i < len(code.instrs):
+        match = match_superinstruction(code, i)
+        if match != None:
+            fused, length = match
+            inner = code.instrs[i + 1:i + length]
+            if not any(code.jumps_to(instr) for instr in inner):
+                first = code.instrs[i]
+                code.instrs[i:i + length] = [fused]
+                for jump in code.jumps_to(first):
+                    set_jump_target(jump, fused)
+                changed = True
+        i += 1
+    return changed
+
+
+# superinstruction -> function returning the instructions it replaces
+SUPERINSTRUCTIONS = {
+    OpCode.INCR: lambda a: [LOAD(a[0]), PUSH(a[1]), ADD(), STORE(a[0])],
+    OpCode.LOAD_GETI: lambda a: [LOAD(a[0]), LOAD(a[1]), GETI()],
+    OpCode.LOADLOAD: lambda a: [LOAD(a[0]), LOAD(a[1])],
+    OpCode.CMPLT_JMPF: lambda a: [CMPLT(), JMPF(a)],
+    OpCode.CMPLE_JMPF: lambda a: [CMPLE(), JMPF(a)],
+}
+
+
+def expand_superinstructions(instructions):
+    """Returns a copy of the instructions with each superinstruction
+    replaced by the instructions it fuses.
+
+    Args:
+        instructions -- The instructions to expand.
+
+    """
+    expanded = []
+    offsets = []
+    for instr in instructions:
+        offsets.append(len(expanded))
+        if instr.opcode in SUPERINSTRUCTIONS:
+            expanded += SUPERINSTRUCTIONS[instr.opcode](instr.operand)
+        else:
+            expanded.append(VMInstr(instr.opcode, instr.operand, instr.comment))
+    offsets.append(len(expanded))
+    for instr in expanded:
+        if is_jump(instr):
+            set_jump_target(instr, offsets[jump_target(instr)])
+    return expanded
+
+
+DEFAULT_PASSES = [remove_nops, thread_jumps, remove_dead_code, fuse_pairs,
+                  fuse_superinstructions]
+
+
+class PeepholeOptimizer:
+
+    def __init__(self, passes=None):
+        """Creates an optimizer running the given passes.
+
+        Args:
+            passes -- The passes to run, in order (defaults to
+                      DEFAULT_PASSES).
+
+        """
+        self.passes = list(DEFAULT_PASSES if passes is None else passes)
+
+
+    def optimize_template(self, template):
+        """Optimizes the instructions of a frame template (in place).
+
+        Args:
+            template -- The frame template to optimize.
+
+        """
+        code = PeepholeCode(template.instructions)
+        changed = True
+        while changed:
+            changed = False
+            for peephole_pass in self.passes:
+                changed = peephole_pass(code) or changed
+        template.instructions = code.unlink()
+
+
+    def optimize(self, vm):
+        """Optimizes every frame template of the vm, returning the number
+        of instructions before and after optimizing.
+
+        Args:
+            vm -- The vm whose frame templates to optimize.
+
+        """
+        before = after = 0
+        for template in vm.frame_templates.values():
+            before += len(template.instructions)
+            self.optimize_template(template)
+            after += len(template.instructions)
+        return before, after
@@ -0,0 +1,67 @@
+"""Buffered output for MyPL programs.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+The VM (and the fast mode) writes program output to an output sink: any
+object with write(text) and flush() methods. The default sink buffers
+the output and writes it to standard output once the buffer is large
+enough, before reading input (so prompts appear), and when the program
+ends. To capture a program's output in memory, use an io.StringIO (or
+an OutputSink over one) as the sink.
+
+"""
+
+import sys
+
+
+# default number of buffered characters that triggers a flush
+OUTPUT_BUFFER_SIZE = 8192
+
+
+def to_text(x):
+    """Returns the printed form of a MyPL value."""
+    if x is None:
+        return 'null'
+    if x is True:
+        return 'true'
+    if x is False:
+        return 'false'
+    return str(x)
+
+
+class OutputSink:
+
+    def __init__(self, stream=None, buffer_size=OUTPUT_BUFFER_SIZE):
+        """Creates a buffered sink.
+
+        Args:
+            stream -- The stream to write to (standard output, as of
+                      each flush, if None).
+            buffer_size -- The number of buffered characters that
+                           triggers a flush.
+
+        """
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+
+
+    def write(self, text):
+        """Buffers the text, flushing if the buffer is full."""
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+
+    def flush(self):
+        """Writes the buffered text to the stream."""
+        if self.parts:
+            stream = self.stream if self.stream is not None else sys.stdout
+            stream.write(''.join(self.parts))
+            stream.flush()
+            self.parts = []
+            self.size = 0
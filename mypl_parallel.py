@@ -0,0 +1,166 @@
+"""Parallel lexing and parsing of large MyPL programs.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+The top-level struct and function definitions of a program are parsed
+independently of each other, so a large program can be split between
+definitions and its parts lexed and parsed in separate processes. A
+pre-scan of the source finds where each top-level definition ends (the
+closing brace that brings the brace depth back to zero, skipping braces
+in strings and comments) and cuts the program into chunks of whole
+definitions. Each chunk is lexed starting at the line and column it has
+in the program (counting lines as the lexer does, i.e., not the line
+breaks within strings), so the tokens, and the merged Program, are the
+same as those of a sequential parse.
+
+If any chunk fails to lex or parse, the whole program is parsed again
+sequentially, so that the error reported is the first one in the
+program (and exactly the one a sequential parse reports).
+
+The processes are started fresh (not forked), so a script using a
+ParallelParser must run its main code under if __name__ == '__main__'.
+
+"""
+
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from mypl_error import *
+from mypl_iowrapper import StringWrapper
+from mypl_lexer import Lexer
+from mypl_ast_parser import ASTParser
+from mypl_ast import *
+
+
+# strings (to the closing quote, or the end of the program), comments,
+# braces, and line breaks
+BOUNDARY_PATTERN = re.compile(r'"[^"]*"?|//[^\n]*|[{}\n]')
+
+# programs shorter than this (in characters) are parsed sequentially
+# (sending the parsed definitions back from the processes costs over
+# half as much as parsing them, so only large programs gain)
+PARALLEL_MIN_SIZE = 1 << 20
+
+# number of chunks per process (so that uneven chunks balance out)
+CHUNKS_PER_JOB = 4
+
+
+def definition_ends(source, start=0, line=1, line_start=0):
+    """Yields the end of each top-level definition (the offset just
+    after its closing brace), with the line the lexer is on there and
+    the offset that line starts at.
+
+    Args:
+        source -- The program text.
+        start -- The offset to scan from (between definitions).
+        line -- The line the lexer is on at start.
+        line_start -- The offset that line starts at.
+
+    """
+    depth = 0
+    for match in BOUNDARY_PATTERN.finditer(source, start):
+        ch = source[match.start()]
+        if ch == '\n':
+            line += 1
+            line_start = match.end()
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                yield match.end(), line, line_start
+
+
+def split_definitions(source, chunk_size):
+    """Returns the program cut (between top-level definitions) into
+    chunks of at least the given size (except the last one), as tuples
+    of the chunk text and the line and column the lexer is at before
+    its first character.
+
+    Args:
+        source -- The program text.
+        chunk_size -- The minimum number of characters in a chunk.
+
+    """
+    chunks = []
+    start, start_line, start_column = 0, 1, 0
+    for end, line, line_start in definition_ends(source):
+        if end - start >= chunk_size:
+            chunks.append((source[start:end], start_line, start_column))
+            start, start_line, start_column = end, line, end - line_start
+    chunks.append((source[start:], start_line, start_column))
+    return chunks
+
+
+def parse_chunk(chunk):
+    """Parses a chunk of top-level definitions, returning the struct
+    and function definitions, or None if the chunk has an error.
+
+    Args:
+        chunk -- The chunk text, and its starting line and column.
+
+    """
+    text, line, column = chunk
+    lexer = Lexer(StringWrapper(text))
+    lexer.line = line
+    lexer.column = column
+    try:
+        program = ASTParser(lexer).parse()
+    except MyPLError:
+        return None
+    return program.struct_defs, program.fun_defs
+
+
+
+class ParallelParser:
+
+    def __init__(self, in_stream, jobs=None, min_size=PARALLEL_MIN_SIZE):
+        """Creates a parser of the program read from the stream.
+
+        Args:
+            in_stream -- The input stream (with a read_chunk method).
+            jobs -- The number of processes (one per CPU if None).
+            min_size -- The number of characters below which the
+                        program is parsed sequentially.
+
+        """
+        chunks = []
+        chunk = in_stream.read_chunk()
+        while chunk:
+            chunks.append(chunk)
+            chunk = in_stream.read_chunk()
+        self.source = ''.join(chunks)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.min_size = min_size
+
+
+    def parse(self):
+        """Parses the program, returning a Program AST node."""
+        chunk_size = len(self.source) // (self.jobs * CHUNKS_PER_JOB)
+        if len(self.source) >= self.min_size and self.jobs > 1:
+            chunks = split_definitions(self.source, chunk_size)
+        else:
+            chunks = []
+        if len(chunks) < 2:
+            return self.parse_sequential()
+        # (the pool starts its processes from a thread, where forking
+        # is unsafe)
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(min(self.jobs, len(chunks)), context) as executor:
+            results = list(executor.map(parse_chunk, chunks))
+        if None in results:
+            return self.parse_sequential()
+        program_node = Program([], [])
+        for struct_defs, fun_defs in results:
+            program_node.struct_defs += struct_defs
+            program_node.fun_defs += fun_defs
+        return program_node
+
+
+    def parse_sequential(self):
+        """Parses the whole program in this process."""
+        return ASTParser(Lexer(StringWrapper(self.source))).parse()
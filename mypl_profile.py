@@ -0,0 +1,281 @@
+"""Profilers for programs run on the MyPL VM.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+The (function-level) Profiler has its own copy of the VM run loop (see
+VM.run), so the normal loop pays nothing for it. Each function (frame
+template) gets its call count, the instructions it executed (exclusive)
+and that it and its callees executed (inclusive), and the same for wall
+time. The inclusive numbers of a recursive function only count its
+outermost calls. Each opcode gets its execution count.
+
+The SamplingProfiler instead records the VM call stack (function names,
+optionally with their pcs) at regular intervals: of CPU time, using a
+timer signal that interrupts the normal run loop, or of executed
+instructions. The samples are written as collapsed stacks, one
+"main;f;g count" line per distinct stack, as read by flame graph tools
+(e.g., flamegraph.pl).
+
+"""
+
+import collections
+import json
+import signal
+import time
+from dataclasses import dataclass, asdict
+
+from mypl_opcode import OpCode
+from mypl_frame import END_OF_CODE
+
+
+@dataclass
+class FunctionProfile:
+    """Profile of a single function."""
+    calls: int = 0                   # number of calls
+    instructions: int = 0            # instructions executed in the function
+    total_instructions: int = 0      # including those of its callees
+    time: float = 0.0                # seconds spent in the function
+    total_time: float = 0.0          # including its callees
+
+
+class Profiler:
+
+    def __init__(self, vm):
+        """Creates a profiler for the programs run on the given VM.
+
+        Args:
+            vm -- The VM (with the program's frame templates).
+
+        """
+        self.vm = vm
+        # function name -> FunctionProfile
+        self.functions = {}
+        # opcode value -> execution count
+        self.opcode_counts = [0] * len(vm.dispatch)
+        self.instructions = 0
+        self.time = 0.0
+        # running calls: (function name, instructions and time at entry)
+        self.active = []
+        # function name -> number of running calls
+        self.depth = {}
+
+
+    def run(self):
+        """Runs (and profiles) the program."""
+        self.vm.run(profiler=self)
+
+
+    def enter(self, template, now):
+        """Records the start of a call."""
+        name = template.function_name
+        if name not in self.functions:
+            self.functions[name] = FunctionProfile()
+        self.functions[name].calls += 1
+        self.active.append((name, self.instructions, now))
+        self.depth[name] = self.depth.get(name, 0) + 1
+
+
+    def exit(self, now):
+        """Records the end of the most recent call."""
+        name, instructions, start = self.active.pop()
+        self.depth[name] -= 1
+        if self.depth[name] == 0:
+            profile = self.functions[name]
+            profile.total_instructions += self.instructions - instructions
+            profile.total_time += now - start
+
+
+    def run_loop(self, frame):
+        """Runs instructions until the program ends (as VM.run_loop does)
+        while profiling.
+
+        Args:
+            frame -- The frame to start running in.
+
+        """
+        dispatch = self.vm.dispatch
+        counts = self.opcode_counts
+        functions = self.functions
+        clock = time.perf_counter
+        TAILCALL = OpCode.TAILCALL
+        started = clock()
+        self.enter(frame.template, started)
+        while frame is not None:
+            current = frame
+            template = frame.template
+            opcodes = template.opcodes
+            operands = template.operands
+            executed = 0
+            start = clock()
+            while frame is current:
+                pc = frame.pc
+                frame.pc = pc + 1
+                opcode = opcodes[pc]
+                counts[opcode] += 1
+                executed += 1
+                frame = dispatch[opcode](frame, operands[pc])
+                if opcode == TAILCALL and frame is current:
+                    # a recursive tail call keeps running in the frame
+                    functions[template.function_name].calls += 1
+            now = clock()
+            if opcode == END_OF_CODE:
+                # (ran past the last instruction)
+                executed -= 1
+            self.instructions += executed
+            profile = functions[template.function_name]
+            profile.instructions += executed
+            profile.time += now - start
+            # the last instruction switched frames
+            if frame is None:
+                while self.active:
+                    self.exit(now)
+            elif opcode == OpCode.CALL:
+                self.enter(frame.template, now)
+            elif opcode == OpCode.RET:
+                self.exit(now)
+            elif opcode == OpCode.TAILCALL:
+                self.exit(now)
+                self.enter(frame.template, now)
+        self.time += clock() - started
+
+
+    def report(self):
+        """Returns the profile as a (JSON serializable) dictionary."""
+        return {
+            'instructions': self.instructions,
+            'time': self.time,
+            'functions': {name: asdict(profile) for name, profile in self.functions.items()},
+            'opcodes': {OpCode(opcode).name: count
+                        for opcode, count in enumerate(self.opcode_counts)
+                        if count and opcode != END_OF_CODE},
+        }
+
+
+    def write_json(self, file):
+        """Writes the profile report to the file as JSON."""
+        json.dump(self.report(), file, indent=2)
+        file.write('\n')
+
+
+    def print_report(self, file=None):
+        """Prints the profile, with functions sorted by the instructions
+        they executed and opcodes by execution count.
+
+        """
+        total = self.instructions or 1
+        print(f'{"function":<24}{"calls":>10}{"instrs":>14}{"%":>8}'
+              f'{"total instrs":>16}{"time (ms)":>12}{"total (ms)":>12}', file=file)
+        ranked = sorted(self.functions.items(), key=lambda item: -item[1].instructions)
+        for name, profile in ranked:
+            print(f'{name:<24}{profile.calls:>10}{profile.instructions:>14}'
+                  f'{100 * profile.instructions / total:>8.2f}'
+                  f'{profile.total_instructions:>16}{profile.time * 1000:>12.2f}'
+                  f'{profile.total_time * 1000:>12.2f}', file=file)
+        print(file=file)
+        print(f'{"opcode":<24}{"count":>10}{"%":>8}', file=file)
+        opcodes = self.report()['opcodes']
+        for name, count in sorted(opcodes.items(), key=lambda item: -item[1]):
+            print(f'{name:<24}{count:>10}{100 * count / total:>8.2f}', file=file)
+
+
+
+# default sampling interval (seconds of CPU time, or instructions)
+SAMPLE_INTERVAL = 0.001
+SAMPLE_INSTRUCTIONS = 1000
+
+
+class SamplingProfiler:
+
+    def __init__(self, vm, interval=None, instructions=False, pcs=False):
+        """Creates a sampling profiler for the programs run on the VM.
+
+        Args:
+            vm -- The VM (with the program's frame templates).
+            interval -- The time (in seconds of CPU time) or number of
+                        instructions between samples.
+            instructions -- If true (or if timer signals are not
+                            available), samples every interval
+                            instructions instead of by time.
+            pcs -- If true, labels each function in a stack with the pc
+                   of the instruction it is running.
+
+        """
+        self.vm = vm
+        self.instructions = instructions or not hasattr(signal, 'setitimer')
+        if interval is None:
+            interval = SAMPLE_INSTRUCTIONS if self.instructions else SAMPLE_INTERVAL
+        elif self.instructions:
+            interval = max(1, int(interval))
+        self.interval = interval
+        self.pcs = pcs
+        # stack (tuple of frame labels) -> number of samples
+        self.samples = collections.Counter()
+
+
+    def run(self):
+        """Runs (and samples) the program."""
+        self.vm.run(profiler=self)
+
+
+    def sample(self):
+        """Records the current VM call stack."""
+        if self.pcs:
+            stack = tuple(f'{frame.template.function_name}@{frame.pc - 1}'
+                          for frame in self.vm.call_stack)
+        else:
+            stack = tuple(frame.template.function_name for frame in self.vm.call_stack)
+        if stack:
+            self.samples[stack] += 1
+
+
+    def run_loop(self, frame):
+        """Runs instructions until the program ends, taking samples.
+
+        Args:
+            frame -- The frame to start running in.
+
+        """
+        if self.instructions:
+            self.run_counting(frame)
+            return
+        handler = lambda signum, stack: self.sample()
+        previous = signal.signal(signal.SIGPROF, handler)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        try:
+            self.vm.run_loop(frame)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, previous)
+
+
+    def run_counting(self, frame):
+        """Runs instructions until the program ends (as VM.run_loop does),
+        taking a sample every interval instructions.
+
+        Args:
+            frame -- The frame to start running in.
+
+        """
+        dispatch = self.vm.dispatch
+        interval = self.interval
+        countdown = interval
+        while frame is not None:
+            current = frame
+            opcodes = frame.template.opcodes
+            operands = frame.template.operands
+            while frame is current:
+                pc = frame.pc
+                frame.pc = pc + 1
+                countdown -= 1
+                if countdown == 0:
+                    self.sample()
+                    countdown = interval
+                frame = dispatch[opcodes[pc]](frame, operands[pc])
+
+
+    def write_collapsed(self, file):
+        """Writes the samples as collapsed stacks (flame graph input)."""
+        for stack, count in sorted(self.samples.items()):
+            file.write(f'{";".join(stack)} {count}\n')
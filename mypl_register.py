@@ -0,0 +1,206 @@
+"""Lowering of the stack-based MyPL IR into the register-based IR.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+The register IR keeps the stack IR's instruction set but rewrites
+arithmetic, comparisons, and conditional jumps over variables and
+constants into three-address instructions that read and write frame
+variable slots directly (e.g., LOAD 0; PUSH 1; ADD; STORE 0 becomes
+ADDRI(0, 0, 1)). Intermediate results are kept in temporary slots that
+follow the function's variables. Any other instruction still runs on
+the operand stack.
+
+"""
+
+from mypl_opcode import *
+from mypl_frame import *
+
+
+# stack opcode -> (slot-slot form, slot-value form)
+REGISTER_OPS = {
+    OpCode.ADD: (OpCode.ADDRR, OpCode.ADDRI),
+    OpCode.SUB: (OpCode.SUBRR, OpCode.SUBRI),
+    OpCode.MUL: (OpCode.MULRR, OpCode.MULRI),
+    OpCode.DIV: (OpCode.DIVRR, OpCode.DIVRI),
+    OpCode.CMPLT: (OpCode.CMPLTRR, OpCode.CMPLTRI),
+    OpCode.CMPLE: (OpCode.CMPLERR, OpCode.CMPLERI),
+    OpCode.CMPEQ: (OpCode.CMPEQRR, OpCode.CMPEQRI),
+    OpCode.CMPNE: (OpCode.CMPNERR, OpCode.CMPNERI),
+}
+
+# ops whose operands can be swapped (ADD is not, due to strings)
+COMMUTATIVE_OPS = {OpCode.MUL, OpCode.CMPEQ, OpCode.CMPNE}
+
+# register ops whose first operand is the destination slot
+RESULT_OPS = {OpCode.MOV, OpCode.MOVI}.union(*REGISTER_OPS.values())
+
+# ops holding an instruction offset (the last element for tuples)
+JUMP_OPS = {OpCode.JMP, OpCode.JMPF, OpCode.JMPFR}
+
+
+class RegisterLowering:
+
+    def __init__(self, template):
+        """Creates a lowering pass for the given frame template.
+
+        Args:
+            template -- The (stack IR) frame template to rewrite.
+
+        """
+        self.template = template
+        # the lowered instructions
+        self.instructions = []
+        # pending operand stack values not yet pushed: ('slot', i),
+        # ('temp', i), or ('value', v)
+        self.pending = []
+        # next new temporary slot (after the variables) and free ones
+        self.next_temp = max(template.var_count, template.arg_count,
+                             self.variable_count(template.instructions))
+        self.free_temps = []
+
+
+    def variable_count(self, instructions):
+        """Returns the number of variable slots used by the instructions."""
+        slots = [instr.operand for instr in instructions
+                 if instr.opcode in (OpCode.LOAD, OpCode.STORE)]
+        return max(slots, default=-1) + 1
+
+
+    def lower(self):
+        """Rewrites the template's instructions into the register IR and
+        sets its variable count.
+
+        """
+        old = self.template.instructions
+        targets = {instr.operand for instr in old if instr.opcode in JUMP_OPS}
+        offsets = []
+        for i, instr in enumerate(old):
+            if i in targets:
+                self.flush()
+            offsets.append(len(self.instructions))
+            self.lower_instr(instr)
+        self.flush()
+        offsets.append(len(self.instructions))
+        for instr in self.instructions:
+            if instr.opcode == OpCode.JMPFR:
+                src, target = instr.operand
+                instr.operand = (src, offsets[target])
+            elif instr.opcode in JUMP_OPS:
+                instr.operand = offsets[instr.operand]
+        self.template.instructions = self.instructions
+        self.template.var_count = self.next_temp
+
+
+    def lower_instr(self, instr):
+        """Lowers a single stack instruction."""
+        opcode = instr.opcode
+        if opcode == OpCode.LOAD:
+            self.pending.append(('slot', instr.operand))
+        elif opcode == OpCode.PUSH:
+            self.pending.append(('value', instr.operand))
+        elif opcode == OpCode.STORE and self.pending:
+            self.store(instr)
+        elif opcode in REGISTER_OPS and len(self.pending) >= 2:
+            self.binary(instr)
+        elif opcode == OpCode.JMPF and self.pending[-1:] and self.pending[-1][0] != 'value':
+            src = self.slot(self.pending.pop())
+            self.flush()
+            self.emit(JMPFR(src, instr.operand))
+        elif opcode == OpCode.DUP and self.pending and self.pending[-1][0] != 'temp':
+            self.pending.append(self.pending[-1])
+        elif opcode == OpCode.NOP:
+            self.emit(instr)
+        else:
+            self.flush()
+            self.emit(instr)
+
+
+    def store(self, instr):
+        """Lowers a STORE of a pending value into a move, or by writing
+        the value's instruction result directly into the variable.
+
+        """
+        var = instr.operand
+        value = self.pending.pop()
+        if ('slot', var) in self.pending:
+            # keep the variable's old value for the pending reads
+            self.flush()
+        last = self.instructions[-1] if self.instructions else None
+        if value[0] == 'temp' and last and last.opcode in RESULT_OPS \
+           and last.operand[0] == value[1]:
+            last.operand = (var,) + last.operand[1:]
+            self.free_temps.append(value[1])
+        elif value[0] == 'value':
+            self.emit(MOVI(var, value[1]))
+        else:
+            self.emit(MOV(var, self.slot(value)))
+
+
+    def binary(self, instr):
+        """Lowers a binary operation over two pending values."""
+        slot_op, value_op = REGISTER_OPS[instr.opcode]
+        rhs = self.pending.pop()
+        lhs = self.pending.pop()
+        if lhs[0] == 'value' and rhs[0] != 'value' and instr.opcode in COMMUTATIVE_OPS:
+            lhs, rhs = rhs, lhs
+        if lhs[0] == 'value':
+            # the left operand must be in a slot
+            tmp = self.temp()
+            self.emit(MOVI(tmp, lhs[1]))
+            lhs = ('temp', tmp)
+        a = self.slot(lhs)
+        if rhs[0] == 'value':
+            dst = self.temp()
+            self.emit(VMInstr(value_op, (dst, a, rhs[1])))
+        else:
+            b = self.slot(rhs)
+            dst = self.temp()
+            self.emit(VMInstr(slot_op, (dst, a, b)))
+        self.pending.append(('temp', dst))
+
+
+    def slot(self, value):
+        """Returns the slot of a pending slot or temporary value, freeing
+        the temporary for reuse.
+
+        """
+        kind, slot = value
+        if kind == 'temp':
+            self.free_temps.append(slot)
+        return slot
+
+
+    def temp(self):
+        """Returns an unused temporary slot."""
+        if self.free_temps:
+            return self.free_temps.pop()
+        self.next_temp += 1
+        return self.next_temp - 1
+
+
+    def flush(self):
+        """Pushes the pending values onto the operand stack."""
+        for value in self.pending:
+            if value[0] == 'value':
+                self.emit(PUSH(value[1]))
+            else:
+                self.emit(LOAD(self.slot(value)))
+        self.pending = []
+
+
+    def emit(self, instr):
+        """Adds an instruction to the lowered code."""
+        self.instructions.append(instr)
+
+
+
+def lower_to_registers(template):
+    """Rewrites a stack IR frame template into the register IR.
+
+    Args:
+        template -- The frame template to rewrite (in place).
+
+    """
+    RegisterLowering(template).lower()
@@ -15,7 +15,7 @@ from mypl_symbol_table import SymbolTable
 
 BASE_TYPES = ['int', 'double', 'bool', 'string']
 BUILT_INS = ['print', 'input', 'itos', 'itod', 'dtos', 'dtoi', 'stoi', 'stod',
-             'length', 'get']
+             'length', 'get', 'readint', 'readdouble']
 
 class SemanticChecker(Visitor):
     """Visitor implementation to semantically check MyPL programs."""
@@ -232,6 +232,14 @@ class SemanticChecker(Visitor):
                 if not len(call_expr.args) == 0:
                     self.error(f'Passed in {len(call_expr.args)}, expecting 0', call_expr.fun_name)
                 self.curr_type = DataType(False, Token(TokenType.STRING_TYPE, 'string', call_expr.fun_name.line, call_expr.fun_name.line))
+            elif call_expr.fun_name.lexeme in ['readint', 'readdouble']:
+                #the numeric input functions don't take params either
+                if not len(call_expr.args) == 0:
+                    self.error(f'Passed in {len(call_expr.args)}, expecting 0', call_expr.fun_name)
+                if call_expr.fun_name.lexeme == 'readint':
+                    self.curr_type = DataType(False, Token(TokenType.INT_TYPE, 'int', call_expr.fun_name.line, call_expr.fun_name.line))
+                else:
+                    self.curr_type = DataType(False, Token(TokenType.DOUBLE_TYPE, 'double', call_expr.fun_name.line, call_expr.fun_name.line))
             elif call_expr.fun_name.lexeme == 'get':
                 if not len(call_expr.args) == 2:
                     self.error(f'Passed in {len(call_expr.args)}, expecting 2', call_expr.fun_name)
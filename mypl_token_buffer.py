@@ -0,0 +1,148 @@
+"""Columnar buffer of the tokens of a MyPL program.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+A TokenBuffer lexes a whole program up front but keeps its tokens in
+columns instead of as Token objects: the token types in a bytearray (one
+byte each), and the offset and length of each lexeme in the program
+source in arrays of unsigned ints (four bytes each). The line and column
+of a token are found from a separate index of line start offsets, and a
+lexeme is only sliced from the source when its token is asked for, so a
+buffered program takes about nine bytes per token on top of its source
+(a list of Token objects takes well over a hundred). The buffer has the
+lexer's next_token method, so the parsers run on it directly:
+
+    parser = ASTParser(TokenBuffer(in_stream))
+
+A lexer error is raised by next_token when the parser reaches it (as
+with the lexer), after the tokens before it.
+
+"""
+
+from array import array
+from bisect import bisect_right
+
+from mypl_error import *
+from mypl_iowrapper import StringWrapper
+from mypl_lexer import Lexer
+from mypl_token import *
+
+
+# token types by value (the type codes stored in a buffer)
+TOKEN_TYPES = {token_type.value: token_type for token_type in TokenType}
+
+
+class TokenBuffer:
+
+    def __init__(self, in_stream):
+        """Lexes the program read from the stream into the buffer.
+
+        Args:
+            in_stream -- The input stream (with a read_chunk method).
+
+        """
+        chunks = []
+        chunk = in_stream.read_chunk()
+        while chunk:
+            chunks.append(chunk)
+            chunk = in_stream.read_chunk()
+        self.source = ''.join(chunks)
+        # token type codes, and the position of each lexeme in source
+        self.types = bytearray()
+        self.offsets = array('I')
+        self.lengths = array('I')
+        # the lexer's line numbers, and the offsets their lines start at
+        self.line_numbers = array('I')
+        self.line_starts = array('I')
+        # the lexer error following the tokens (if any)
+        self.error = None
+        # the index of the next token returned by next_token
+        self.index = 0
+        self.lex()
+
+
+    def lex(self):
+        """Lexes the source into the token columns."""
+        lexer = Lexer(StringWrapper(self.source))
+        line = None
+        while True:
+            try:
+                token = lexer.next_token()
+            except MyPLError as ex:
+                self.error = ex
+                return
+            token_type = token.token_type
+            length = len(token.lexeme)
+            end = lexer.offset + lexer.pos
+            # the lexeme of a string or comment omits its quotes or //,
+            # and the end of stream has none
+            if token_type == TokenType.STRING_VAL:
+                start = end - length - 2
+                offset = start + 1
+            elif token_type == TokenType.COMMENT:
+                start = end - length - 2
+                offset = start + 2
+            elif token_type == TokenType.EOS:
+                start = offset = end
+                length = 0
+            else:
+                start = offset = end - length
+            if token.line != line:
+                line = token.line
+                self.line_numbers.append(line)
+                self.line_starts.append(start - token.column + 1)
+            self.types.append(token_type.value)
+            self.offsets.append(offset)
+            self.lengths.append(length)
+            if token_type == TokenType.EOS:
+                return
+
+
+    def __len__(self):
+        """Returns the number of tokens (including the end of stream)."""
+        return len(self.types)
+
+
+    def token_type(self, index):
+        """Returns the type of the token at the index."""
+        return TOKEN_TYPES[self.types[index]]
+
+
+    def lexeme(self, index):
+        """Returns the lexeme of the token at the index."""
+        offset = self.offsets[index]
+        return self.source[offset:offset + self.lengths[index]]
+
+
+    def position(self, index):
+        """Returns the line and column of the token at the index."""
+        start = self.offsets[index]
+        token_type = self.types[index]
+        if token_type == TokenType.STRING_VAL.value:
+            start -= 1
+        elif token_type == TokenType.COMMENT.value:
+            start -= 2
+        i = bisect_right(self.line_starts, start) - 1
+        return self.line_numbers[i], start - self.line_starts[i] + 1
+
+
+    def token(self, index):
+        """Returns the token at the index."""
+        line, column = self.position(index)
+        return Token(self.token_type(index), self.lexeme(index), line, column)
+
+
+    def next_token(self):
+        """Returns the next token (the end of stream token repeatedly once
+        all tokens have been returned).
+
+        """
+        if self.index == len(self.types):
+            if self.error is not None:
+                raise self.error
+            self.index -= 1
+        token = self.token(self.index)
+        self.index += 1
+        return token
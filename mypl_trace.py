@@ -0,0 +1,362 @@
+"""Binary execution traces of programs run on the MyPL VM.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+The TraceRecorder runs a program with its own copy of the VM run loop
+(see VM.run) that appends a fixed-size binary record for each executed
+instruction to a file, through a buffer:
+
+    function id (2 bytes), pc (4 bytes), opcode (1 byte), and the
+    call stack depth (4 bytes), little-endian
+
+The function id and call depth together identify the running frame.
+The records follow a header holding the function names (in id order),
+their instructions, and the target of each jump. The TraceAnalyzer reads a trace back (in
+chunks, so traces larger than memory are fine) and reconstructs the hot
+paths (the straight-line runs of instructions between backward jumps
+and frame changes), how often each conditional branch was taken (a
+branch to the next instruction goes there either way, so it is only
+counted as run), and
+the trip counts of each loop (a loop header being the target of a
+backward jump or recursive tail call). To analyze a trace, run
+
+    python3 mypl_trace.py [--top N] FILE
+
+"""
+
+import argparse
+import json
+import struct
+import sys
+from dataclasses import dataclass
+
+from mypl_opcode import OpCode
+from mypl_frame import END_OF_CODE
+
+
+# identifies a trace file (followed by the header length and header)
+TRACE_MAGIC = b'MYPLTRACE3\n'
+
+# function id, pc, opcode, call stack depth (the VM has no recursion
+# limit, so the depth takes 4 bytes)
+TRACE_RECORD = struct.Struct('<HIBI')
+
+# default number of buffered bytes that triggers a write
+TRACE_BUFFER_SIZE = 1 << 20
+
+# opcodes that jump only if their condition is false
+BRANCHES = {OpCode.JMPF, OpCode.JMPFR, OpCode.CMPLT_JMPF, OpCode.CMPLE_JMPF}
+
+# opcodes whose jumps can close a loop (a recursive tail call restarts
+# its frame)
+JUMPS = BRANCHES | {OpCode.JMP, OpCode.TAILCALL}
+
+
+def jump_target(instr):
+    """Returns the offset a jump or branch instruction jumps to (None
+    for other instructions).
+
+    """
+    if instr.opcode == OpCode.JMPFR:
+        return instr.operand[-1]
+    if instr.opcode in BRANCHES or instr.opcode == OpCode.JMP:
+        return instr.operand
+    return None
+
+
+
+class TraceRecorder:
+
+    def __init__(self, vm, file, buffer_size=TRACE_BUFFER_SIZE):
+        """Creates a recorder writing the trace of the programs run on
+        the given VM.
+
+        Args:
+            vm -- The VM (with the program's frame templates).
+            file -- The (binary) file to write the trace to.
+            buffer_size -- The number of buffered bytes that triggers
+                           a write.
+
+        """
+        self.vm = vm
+        self.file = file
+        self.buffer_size = buffer_size
+        self.instructions = 0
+
+
+    def run(self):
+        """Runs (and traces) the program."""
+        self.vm.run(profiler=self)
+
+
+    def write_header(self):
+        """Writes the magic bytes and the function table."""
+        functions = [{'name': name,
+                      'instructions': [str(instr) for instr in template.instructions],
+                      'targets': [jump_target(instr) for instr in template.instructions]}
+                     for name, template in self.vm.frame_templates.items()]
+        header = json.dumps({'functions': functions}).encode('utf-8')
+        self.file.write(TRACE_MAGIC)
+        self.file.write(struct.pack('<I', len(header)))
+        self.file.write(header)
+
+
+    def run_loop(self, frame):
+        """Runs instructions until the program ends (as VM.run_loop does)
+        while recording each one.
+
+        Args:
+            frame -- The frame to start running in.
+
+        """
+        self.write_header()
+        ids = {name: i for i, name in enumerate(self.vm.frame_templates)}
+        dispatch = self.vm.dispatch
+        call_stack = self.vm.call_stack
+        pack = TRACE_RECORD.pack
+        size = TRACE_RECORD.size
+        limit = self.buffer_size
+        write = self.file.write
+        buffer = bytearray()
+        try:
+            while frame is not None:
+                current = frame
+                function_id = ids[frame.template.function_name]
+                depth = len(call_stack)
+                opcodes = frame.template.opcodes
+                operands = frame.template.operands
+                while frame is current:
+                    pc = frame.pc
+                    frame.pc = pc + 1
+                    opcode = opcodes[pc]
+                    buffer += pack(function_id, pc, opcode, depth)
+                    if len(buffer) >= limit:
+                        write(buffer)
+                        self.instructions += len(buffer) // size
+                        buffer.clear()
+                    frame = dispatch[opcode](frame, operands[pc])
+        finally:
+            # keep the records of a failing program
+            write(buffer)
+            self.instructions += len(buffer) // size
+            self.file.flush()
+
+
+
+@dataclass
+class BranchStats:
+    """Outcomes of a conditional branch."""
+    taken: int = 0
+    not_taken: int = 0
+    ambiguous: int = 0               # runs of a branch to the next pc
+
+
+@dataclass
+class LoopStats:
+    """Trip counts of a loop."""
+    entries: int = 0                 # times the loop was entered
+    trips: int = 0                   # iterations (backward jumps) in total
+    max_trips: int = 0               # most iterations of one entry
+
+
+class TraceAnalyzer:
+
+    def __init__(self):
+        """Creates an analyzer. After reading a trace, the statistics
+        are keyed by (function name, pc), or by (function name, tuple
+        of pc ranges) for the hot paths.
+
+        """
+        self.functions = []
+        self.instructions = 0
+        # function id -> execution count of each pc
+        self.counts = []
+        # (function, pc) -> BranchStats
+        self.branches = {}
+        # (function, header pc) -> LoopStats
+        self.loops = {}
+        # (function, pc ranges) -> number of runs
+        self.paths = {}
+
+
+    def read(self, file, chunk_size=TRACE_BUFFER_SIZE):
+        """Reads (and analyzes) a trace from the (binary) file.
+
+        Args:
+            file -- The file to read from.
+            chunk_size -- The (approximate) number of bytes read at a time.
+
+        """
+        if file.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError('not a MyPL trace file')
+        header_size, = struct.unpack('<I', file.read(4))
+        header = json.loads(file.read(header_size).decode('utf-8'))
+        self.functions = header['functions']
+        self.counts = [[0] * len(function['instructions']) for function in self.functions]
+        chunk_size -= chunk_size % TRACE_RECORD.size
+        # the previous record, the start and runs of the current path,
+        # and (function, depth, header pc) -> trips of the running loops
+        previous = None
+        path = []
+        running = {}
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            extra = len(chunk) % TRACE_RECORD.size
+            if extra:
+                # (a truncated trace ends within a record)
+                chunk = chunk[:-extra]
+            for record in TRACE_RECORD.iter_unpack(chunk):
+                if record[2] == END_OF_CODE:
+                    continue
+                self.instructions += 1
+                self.counts[record[0]][record[1]] += 1
+                if previous is not None:
+                    self.follow(previous, record, path, running)
+                else:
+                    path.append([record[1], record[1]])
+                previous = record
+        if path:
+            self.end_path(previous[0], path)
+        for (function_id, depth, pc), trips in running.items():
+            self.end_loop(function_id, pc, trips)
+        # each arrival at a loop header that is not an iteration enters
+        # the loop (including entries that did not iterate)
+        names = [function['name'] for function in self.functions]
+        for (name, pc), loop in self.loops.items():
+            loop.entries = self.counts[names.index(name)][pc] - loop.trips
+
+
+    def follow(self, previous, record, path, running):
+        """Updates the statistics for the transfer of control from the
+        previous record to the next one.
+
+        """
+        function_id, pc, opcode, depth = previous
+        same_frame = record[0] == function_id and record[3] == depth
+        next_pc = record[1]
+        if opcode in BRANCHES:
+            branch = self.branch(function_id, pc)
+            if self.functions[function_id]['targets'][pc] == pc + 1:
+                # (taken or not, the branch goes to the next pc)
+                branch.ambiguous += 1
+            elif same_frame and next_pc == pc + 1:
+                branch.not_taken += 1
+            else:
+                branch.taken += 1
+        backward = same_frame and opcode in JUMPS and next_pc <= pc
+        key = (record[0], record[3], next_pc)
+        if backward:
+            running[key] = running.get(key, 0) + 1
+        elif key in running:
+            # the loop is entered again, so its previous entry is done
+            self.end_loop(record[0], next_pc, running.pop(key))
+        if backward or not same_frame:
+            self.end_path(function_id, path)
+            path.clear()
+            path.append([next_pc, next_pc])
+        elif next_pc == path[-1][1] + 1:
+            path[-1][1] = next_pc
+        else:
+            path.append([next_pc, next_pc])
+
+
+    def branch(self, function_id, pc):
+        """Returns the statistics of the branch at pc of the function."""
+        key = (self.functions[function_id]['name'], pc)
+        if key not in self.branches:
+            self.branches[key] = BranchStats()
+        return self.branches[key]
+
+
+    def end_path(self, function_id, path):
+        """Counts a run of the path (the list of its pc ranges)."""
+        key = (self.functions[function_id]['name'], tuple(tuple(part) for part in path))
+        self.paths[key] = self.paths.get(key, 0) + 1
+
+
+    def end_loop(self, function_id, pc, trips):
+        """Counts the iterations of an entry of the loop with the given
+        header.
+
+        """
+        key = (self.functions[function_id]['name'], pc)
+        if key not in self.loops:
+            self.loops[key] = LoopStats()
+        loop = self.loops[key]
+        loop.trips += trips
+        loop.max_trips = max(loop.max_trips, trips)
+
+
+    def instruction(self, name, pc):
+        """Returns the text of the instruction at pc of the function."""
+        for function in self.functions:
+            if function['name'] == name:
+                return function['instructions'][pc]
+        return '?'
+
+
+    def print_report(self, top=10, file=None):
+        """Prints the hottest paths (by instructions executed), the
+        branches, and the loops.
+
+        Args:
+            top -- The number of paths to list.
+            file -- The stream to print to (standard output if None).
+
+        """
+        total = self.instructions or 1
+        print(f'{self.instructions} instructions', file=file)
+        print(file=file)
+        print(f'{"path":<40}{"runs":>10}{"instrs":>14}{"%":>8}', file=file)
+        def executed(item):
+            (name, ranges), runs = item
+            return runs * sum(end - start + 1 for start, end in ranges)
+        for item in sorted(self.paths.items(), key=lambda item: -executed(item))[:top]:
+            (name, ranges), runs = item
+            pcs = ','.join(f'{start}-{end}' if end > start else f'{start}'
+                           for start, end in ranges)
+            print(f'{name + " " + pcs:<40}{runs:>10}{executed(item):>14}'
+                  f'{100 * executed(item) / total:>8.2f}', file=file)
+        print(file=file)
+        print(f'{"branch":<24}{"taken":>12}{"not taken":>12}{"% taken":>10}  instruction',
+              file=file)
+        for (name, pc), branch in sorted(self.branches.items()):
+            if branch.ambiguous:
+                # (its outcome is unknown)
+                print(f'{name + "@" + str(pc):<24}{"?":>12}{"?":>12}{"?":>10}  '
+                      f'{self.instruction(name, pc)} (to next, run {branch.ambiguous})',
+                      file=file)
+                continue
+            runs = branch.taken + branch.not_taken
+            print(f'{name + "@" + str(pc):<24}{branch.taken:>12}{branch.not_taken:>12}'
+                  f'{100 * branch.taken / runs:>10.2f}  {self.instruction(name, pc)}',
+                  file=file)
+        print(file=file)
+        print(f'{"loop":<24}{"entries":>10}{"trips":>12}{"avg trips":>12}{"max trips":>12}',
+              file=file)
+        for (name, pc), loop in sorted(self.loops.items()):
+            print(f'{name + "@" + str(pc):<24}{loop.entries:>10}{loop.trips:>12}'
+                  f'{loop.trips / loop.entries:>12.2f}{loop.max_trips:>12}', file=file)
+
+
+
+if __name__ == '__main__':
+    about = 'Analyze a trace written by mypl --trace.'
+    argparser = argparse.ArgumentParser(prog='mypl_trace', description=about)
+    help_msg = 'number of hot paths to list'
+    argparser.add_argument('-t', '--top', type=int, default=10, help=help_msg)
+    help_msg = 'trace file to analyze'
+    argparser.add_argument('filename', help=help_msg)
+    args = argparser.parse_args()
+    analyzer = TraceAnalyzer()
+    try:
+        with open(args.filename, 'rb') as trace_file:
+            analyzer.read(trace_file)
+    except (OSError, ValueError) as ex:
+        print(f'ERROR: {ex}')
+        sys.exit(1)
+    analyzer.print_report(args.top)
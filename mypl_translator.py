@@ -237,6 +237,12 @@ class Translator (Visitor):
             self.output('print!("{}", result)')
         elif fun_name == 'input':
             self.output('io::stdin().read_line(&mut input).expect("Failed to read input").to_string()')
+        elif fun_name == 'readint':
+            self.output('{ let mut line = String::new(); io::stdin().read_line(&mut line).expect("Failed to read input"); '
+                        'line.trim().parse::<i32>().expect("Failed to make int") }')
+        elif fun_name == 'readdouble':
+            self.output('{ let mut line = String::new(); io::stdin().read_line(&mut line).expect("Failed to read input"); '
+                        'line.trim().parse::<f64>().expect("Failed to make double") }')
         elif fun_name == 'itos':
             self.output('Some(')
             for arg in call_expr.args:
@@ -13,6 +13,8 @@ class VarTable:
         """Create an empty var table"""
         self.environments = []
         self.total_vars = 0
+        # var name -> data type, for each environment
+        self.types = []
         
         
     def __len__(self):
@@ -28,6 +30,7 @@ class VarTable:
     def push_environment(self):
         """Add a new environment to the symbol table."""
         self.environments.append([])
+        self.types.append({})
 
         
     def pop_environment(self):
@@ -37,17 +40,20 @@ class VarTable:
         if self.environments:
             self.total_vars -= len(self.environments[-1])
             self.environments.pop()
+            self.types.pop()
 
             
-    def add(self, var_name):
+    def add(self, var_name, data_type=None):
         """Add a variable to the table in the current environment.
         
         Args: 
             var_name -- The variable name to add.
+            data_type -- The declared type (DataType) of the variable.
 
         """
         if self.environments:
             self.environments[-1].append(var_name)
+            self.types[-1][var_name] = data_type
             self.total_vars += 1
             
             
@@ -66,4 +72,16 @@ class VarTable:
                 return num_remaining + self.environments[-i].index(var_name)
         return None
 
-    
+
+    def get_type(self, var_name):
+        """Returns the declared type of the variable if it is in the table.
+        Returns None if the variable name is not in the table.
+
+        Args:
+            var_name -- The variable to lookup in the table.
+
+        """
+        for types in reversed(self.types):
+            if var_name in types:
+                return types[var_name]
+        return None
@@ -9,17 +9,36 @@ CLASS: CPSC 326
 from mypl_error import *
 from mypl_opcode import *
 from mypl_frame import *
+from mypl_gc import GarbageCollector
+from mypl_array import new_array
+from mypl_output import OutputSink, to_text
+from mypl_input import InputSource
 
 
 class VM:
 
-    def __init__(self):
-        """Creates a VM."""
-        self.struct_heap = {}        # id -> dict
-        self.array_heap = {}         # id -> list
+    def __init__(self, gc_threshold=10000, output=None, input_source=None):
+        """Creates a VM.
+
+        Args:
+            gc_threshold -- The (minimum) number of allocations between
+                            garbage collections (0 to never collect).
+            output -- The sink (see mypl_output) the program output is
+                      written to, by default buffered standard output.
+            input_source -- The InputSource (see mypl_input) the program
+                            input is read from, by default standard input.
+
+        """
+        self.struct_heap = {}        # id -> list of field values
+        self.array_heap = {}         # id -> list (or TypedArray)
         self.next_obj_id = 2024      # next available object id (int)
         self.frame_templates = {}    # function name -> VMFrameTemplate
         self.call_stack = []         # function call stack
+        self.frame_pool = []         # returned frames (for reuse)
+        self.gc = GarbageCollector(self, gc_threshold)
+        self.output = output if output is not None else OutputSink()
+        self.input = input_source if input_source is not None else InputSource()
+        self.dispatch = self.build_dispatch_table()
 
     
     def __repr__(self):
@@ -27,7 +46,7 @@ class VM:
         s = ''
         for name, template in self.frame_templates.items():
             s += f'\nFrame {name}\n'
-            for instr in template.instructions:
+            for i, instr in enumerate(template.instructions):
                 s += f'  {i}: {instr}\n'
         return s
 
@@ -52,299 +71,804 @@ class VM:
         msg += f' (in {name} at {pc}: {instr})'
         raise VMError(msg)
 
+
+    def finalize(self):
+        """Lowers every frame template into its packed (executable) form
+        and links the calls between them.
+
+        """
+        for template in self.frame_templates.values():
+            template.finalize()
+        self.link()
+
+
+    def link(self):
+        """Replaces the function name operand of each CALL (and TAILCALL)
+        in the packed code by the called function's frame template, so
+        calls do not look up the function by name.
+
+        """
+        for template in self.frame_templates.values():
+            operands = template.operands
+            for pc, opcode in enumerate(template.opcodes):
+                if opcode == OpCode.CALL or opcode == OpCode.TAILCALL:
+                    fun_name = operands[pc]
+                    if fun_name not in self.frame_templates:
+                        self.error(f'Function "{fun_name}" not found')
+                    operands[pc] = self.frame_templates[fun_name]
+
+
+    def build_dispatch_table(self):
+        """Returns a table mapping each opcode directly to its handler.
+
+        The table is a list indexed by opcode value. Every handler takes
+        the current frame and the instruction operand, and returns the
+        frame to continue executing in (which only differs from the
+        given frame for calls and returns), or None to stop the VM.
+
+        """
+        table = [self.op_unsupported] * (max(OpCode) + 1)
+        table[END_OF_CODE] = self.op_end
+        handlers = {
+            OpCode.PUSH: self.op_push,
+            OpCode.POP: self.op_pop,
+            OpCode.STORE: self.op_store,
+            OpCode.LOAD: self.op_load,
+            OpCode.ADD: self.op_add,
+            OpCode.SUB: self.op_sub,
+            OpCode.MUL: self.op_mul,
+            OpCode.DIV: self.op_div,
+            OpCode.CMPLT: self.op_cmplt,
+            OpCode.CMPLE: self.op_cmple,
+            OpCode.CMPEQ: self.op_cmpeq,
+            OpCode.CMPNE: self.op_cmpne,
+            OpCode.AND: self.op_and,
+            OpCode.OR: self.op_or,
+            OpCode.NOT: self.op_not,
+            OpCode.JMP: self.op_jmp,
+            OpCode.JMPF: self.op_jmpf,
+            OpCode.CALL: self.op_call,
+            OpCode.RET: self.op_ret,
+            OpCode.TAILCALL: self.op_tailcall,
+            OpCode.WRITE: self.op_write,
+            OpCode.READ: self.op_read,
+            OpCode.READINT: self.op_readint,
+            OpCode.READDBL: self.op_readdbl,
+            OpCode.LEN: self.op_len,
+            OpCode.GETC: self.op_getc,
+            OpCode.TOINT: self.op_toint,
+            OpCode.TODBL: self.op_todbl,
+            OpCode.TOSTR: self.op_tostr,
+            OpCode.ALLOCS: self.op_allocs,
+            OpCode.SETF: self.op_setf,
+            OpCode.GETF: self.op_getf,
+            OpCode.ALLOCA: self.op_alloca,
+            OpCode.SETI: self.op_seti,
+            OpCode.GETI: self.op_geti,
+            OpCode.DUP: self.op_dup,
+            OpCode.NOP: self.op_nop,
+            OpCode.MOV: self.op_mov,
+            OpCode.MOVI: self.op_movi,
+            OpCode.ADDRR: self.op_addrr,
+            OpCode.ADDRI: self.op_addri,
+            OpCode.SUBRR: self.op_subrr,
+            OpCode.SUBRI: self.op_subri,
+            OpCode.MULRR: self.op_mulrr,
+            OpCode.MULRI: self.op_mulri,
+            OpCode.DIVRR: self.op_divrr,
+            OpCode.DIVRI: self.op_divri,
+            OpCode.CMPLTRR: self.op_cmpltrr,
+            OpCode.CMPLTRI: self.op_cmpltri,
+            OpCode.CMPLERR: self.op_cmplerr,
+            OpCode.CMPLERI: self.op_cmpleri,
+            OpCode.CMPEQRR: self.op_cmpeqrr,
+            OpCode.CMPEQRI: self.op_cmpeqri,
+            OpCode.CMPNERR: self.op_cmpnerr,
+            OpCode.CMPNERI: self.op_cmpneri,
+            OpCode.JMPFR: self.op_jmpfr,
+            OpCode.INCR: self.op_incr,
+            OpCode.LOAD_GETI: self.op_load_geti,
+            OpCode.LOADLOAD: self.op_loadload,
+            OpCode.CMPLT_JMPF: self.op_cmplt_jmpf,
+            OpCode.CMPLE_JMPF: self.op_cmple_jmpf,
+        }
+        for opcode, handler in handlers.items():
+            table[opcode] = handler
+        return table
+
     
     #----------------------------------------------------------------------
     # RUN FUNCTION
     #----------------------------------------------------------------------
     
-    def run(self, debug=False):
-        """Run the virtual machine."""
+    def run(self, debug=False, profiler=None):
+        """Run the virtual machine.
+
+        Args:
+            debug -- If true, prints each instruction as it runs.
+            profiler -- The Profiler (see mypl_profile) to run the
+                        program with, if any.
+
+        """
 
         # grab the "main" function frame and instantiate it
         if not 'main' in self.frame_templates:
             self.error('No "main" functrion')
-        frame = VMFrame(self.frame_templates['main'])
+        self.finalize()
+        template = self.frame_templates['main']
+        frame = VMFrame(template, variables=[None] * template.var_count)
         self.call_stack.append(frame)
+        try:
+            if debug:
+                self.run_debug(frame)
+            elif profiler is not None:
+                profiler.run_loop(frame)
+            else:
+                self.run_loop(frame)
+        finally:
+            # write out any buffered output (also when the program fails)
+            self.output.flush()
+
+
+    def run_loop(self, frame):
+        """Runs instructions until the program ends.
+
+        Args:
+            frame -- The frame to start running in.
+
+        """
+        dispatch = self.dispatch
 
         # run loop (continue until run out of call frames or instructions)
-        while self.call_stack and frame.pc < len(frame.template.instructions):
-            # get the next instruction
-            instr = frame.template.instructions[frame.pc]
-            # increment the program count (pc)
-            frame.pc += 1
-            # for debugging:
-            if debug:
+        while frame is not None:
+            # cache the packed code of the current frame
+            current = frame
+            opcodes = frame.template.opcodes
+            operands = frame.template.operands
+            while frame is current:
+                # fetch and increment the program count (pc)
+                pc = frame.pc
+                frame.pc = pc + 1
+                # execute the instruction via its handler
+                frame = dispatch[opcodes[pc]](frame, operands[pc])
+
+
+    def run_debug(self, frame):
+        """Run loop that prints each instruction as it is executed.
+
+        Args:
+            frame -- The frame to start running in.
+
+        """
+        dispatch = self.dispatch
+        while frame is not None:
+            pc = frame.pc
+            opcode = frame.template.opcodes[pc]
+            frame.pc = pc + 1
+            if opcode != END_OF_CODE:
+                # keep the program output in order with the trace
+                self.output.flush()
                 print('\n')
                 print('\t FRAME.........:', frame.template.function_name)
                 print('\t PC............:', frame.pc)
-                print('\t INSTRUCTION...:', instr)
+                print('\t INSTRUCTION...:', frame.template.instructions[pc])
                 val = None if not frame.operand_stack else frame.operand_stack[-1]
                 print('\t NEXT OPERAND..:', val)
                 cs = self.call_stack
                 fun = cs[-1].template.function_name if cs else None
                 print('\t NEXT FUNCTION..:', fun)
+            frame = dispatch[opcode](frame, frame.template.operands[pc])
 
-            #------------------------------------------------------------
-            # Literals and Variables
-            #------------------------------------------------------------
-
-            if instr.opcode == OpCode.PUSH:
-                frame.operand_stack.append(instr.operand)
-
-            elif instr.opcode == OpCode.POP:
-                frame.operand_stack.pop()
-                
-            elif instr.opcode == OpCode.STORE:
-                tmp = frame.operand_stack.pop()
-                if len(frame.variables) <= instr.operand:
-                    frame.variables.append(tmp)
-                else:
-                    frame.variables[instr.operand] = tmp
-            elif instr.opcode == OpCode.LOAD:
-                tmp = frame.variables[instr.operand]
-                frame.operand_stack.append(tmp)
-            # TODO: Fill in rest of ops
-
-            
-            #------------------------------------------------------------
-            # Operations
-            #------------------------------------------------------------
-
-            # TODO: Fill in rest of ops
-            elif instr.opcode == OpCode.ADD:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                if x == None or y == None:
-                    self.error(f'Invalid addition between a null-type and non-null type')
-                frame.operand_stack.append(y + x)
-            elif instr.opcode == OpCode.SUB:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                if x == None or y == None:
-                    self.error(f'Invalid subtraction between a null-type and non-null type')
-                frame.operand_stack.append(y - x)
-            elif instr.opcode == OpCode.MUL:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                if x == None or y == None:
-                    self.error(f'Invalid multiplication between a null-type and non-null type')
-                frame.operand_stack.append(y * x)
-            elif instr.opcode == OpCode.DIV:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                if x == None or y == None:
-                    self.error(f'Invalid division between a null-type and non-null type')
-                if x == 0:
-                    self.error(f'Invalid division by zero')
-                if isinstance(x, int):
-                    frame.operand_stack.append(y//x)
-                else:
-                    frame.operand_stack.append(y/x)
-            elif instr.opcode == OpCode.CMPLT:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                if x == None or y == None:
-                    self.error(f'Invalid comparison between a null-type and non-null type')
-                frame.operand_stack.append(y < x)
-            elif instr.opcode == OpCode.CMPLE:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                if x == None or y == None:
-                    self.error(f'Invalid comparison between a null-type and non-null type')
-                frame.operand_stack.append(y <= x)
-            elif instr.opcode == OpCode.CMPEQ:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                frame.operand_stack.append(y == x)
-            elif instr.opcode == OpCode.CMPNE:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                frame.operand_stack.append(y != x)
-            elif instr.opcode == OpCode.AND:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                if x == None or y == None:
-                    self.error(f'Invalid comparison between a null-type and non-null type')
-                frame.operand_stack.append(y and x)
-            elif instr.opcode == OpCode.OR:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                if x == None or y == None:
-                    self.error(f'Invalid comparison between a null-type and non-null type')
-                frame.operand_stack.append(y or x)
-            elif instr.opcode == OpCode.NOT:
-                x = frame.operand_stack.pop()
-                if x == None:
-                    self.error(f'Invalid comparison between a null-type and non-null type')
-                frame.operand_stack.append(not x)
-
-            #------------------------------------------------------------
-            # Branching
-            #------------------------------------------------------------
-            elif instr.opcode == OpCode.JMP:
-                frame.pc = instr.operand
-            elif instr.opcode == OpCode.JMPF:
-                x = frame.operand_stack.pop()
-                if x == False:
-                    frame.pc = instr.operand
-
-            # TODO: Fill in rest of ops
-            
-                    
-            #------------------------------------------------------------
-            # Functions
-            #------------------------------------------------------------
-            elif instr.opcode == OpCode.CALL:
-                fun_name = instr.operand
-                new_frame_template = self.frame_templates[fun_name]
-                new_frame = VMFrame(new_frame_template)
-                self.call_stack.append(new_frame)
-                for i in range(0, new_frame_template.arg_count):
-                    arg = frame.operand_stack.pop()
-                    new_frame.operand_stack.append(arg)
-                frame = new_frame
-            elif instr.opcode == OpCode.RET:
-                return_val = frame.operand_stack.pop()
-                self.call_stack.pop()
-                if not frame.template.function_name == 'main':
-                    frame = self.call_stack[-1]
-                frame.operand_stack.append(return_val)
-
-            # TODO: Fill in rest of ops
-
-            
-            #------------------------------------------------------------
-            # Built-In Functions
-            #------------------------------------------------------------
-
-            # TODO: Fill in rest of ops
-            elif instr.opcode == OpCode.WRITE:
-                x = frame.operand_stack.pop()
-                if x == None:
-                    print('null', end='')
-                elif isinstance(x, bool):
-                    if x == True:
-                        print('true', end='')
-                    else:
-                        print('false', end='')
-                else:
-                    print(x, end='')
-            elif instr.opcode == OpCode.READ:
-                x = input()
-                frame.operand_stack.append(x)
-            elif instr.opcode == OpCode.LEN:
-                x = frame.operand_stack.pop()
-                if x == None:
-                    self.error(f'Null value')
-                if isinstance(x, str):
-                    frame.operand_stack.append(len(x))
-                else:
-                    frame.operand_stack.append(len(self.array_heap[x]))
-            elif instr.opcode == OpCode.GETC:
-                x = frame.operand_stack.pop()
-                if x == None:
-                    self.error(f'Must be a valid string')
-                y = frame.operand_stack.pop()
-                if y == None:
-                    self.error(f'Index must be of type int')
-                if y >= len(x) or y < 0:
-                    self.error(f'Invalid index for string')
-                frame.operand_stack.append(x[y])
-            elif instr.opcode == OpCode.TOINT:
-                x = frame.operand_stack.pop()
-                if x == None:
-                    self.error(f'NoneType cannot be converted to int type')
-                if type(x) == str:
-                    if not x.isnumeric():
-                        self.error(f'Item must be a valid number')
-                frame.operand_stack.append(int(x))
-            elif instr.opcode == OpCode.TODBL:
-                x = frame.operand_stack.pop()
-                if x == None:
-                    self.error(f'NoneType cannot be converted to double type')
-                if type(x) == str:
-                    for ch in x:
-                        if ch.isalpha():
-                            self.error(f'Must be a valid number')
-                if type(x) == int:
-                    frame.operand_stack.append(x/1.0)
-                else:
-                    frame.operand_stack.append(float(x))
-            elif instr.opcode == OpCode.TOSTR:
-                x = frame.operand_stack.pop()
-                if x == None:
-                    self.error(f'NoneType cannot be converted to string type')
-                frame.operand_stack.append(str(x))
-            
-            #------------------------------------------------------------
-            # Heap
-            #------------------------------------------------------------
-
-
-            # TODO: Fill in rest of ops
-            elif instr.opcode == OpCode.ALLOCS:
-                oid = self.next_obj_id
-                self.next_obj_id += 1
-                frame.operand_stack.append(oid)
-                self.struct_heap[oid] = {}
-            elif instr.opcode == OpCode.SETF:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                if not y in self.struct_heap:
-                    self.error(f'Object not found')
-                self.struct_heap[y][instr.operand] = x
-            elif instr.opcode == OpCode.GETF:
-                x = frame.operand_stack.pop()
-                if not x in self.struct_heap:
-                    self.error(f'Object not found')
-                frame.operand_stack.append(self.struct_heap[x][instr.operand])
-            elif instr.opcode == OpCode.ALLOCA:
-                oid = self.next_obj_id
-                self.next_obj_id += 1
-                x = frame.operand_stack.pop()
-                frame.operand_stack.append(oid)
-                if x == None:
-                    self.error(f'Size of array must be of int-type')
-                if x < 0:
-                    self.error(f'Size of array must be zero or greater')
-                self.array_heap[oid] = []
-                if x > 0:
-                    for i in range(0, x):
-                        self.array_heap[oid].append(None)
-            elif instr.opcode == OpCode.SETI:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                z = frame.operand_stack.pop()
-                if not z in self.array_heap:
-                    self.error(f'Array object not found')
-                if y == None:
-                    self.error(f'Array index must be of int-type')    
-                if y < 0 or y >= len(self.array_heap[z]):
-                    self.error(f'Cannot reach index {y}')
-                self.array_heap[z][y] = x
-            elif instr.opcode == OpCode.GETI:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                if not y in self.array_heap:
-                    self.error(f'Array object not found')
-                if x == None:
-                    self.error(f'Array index must be of int-type')
-                if x < 0 or x >= len(self.array_heap[y]):
-                    self.error(f'Cannot reach index {x}')
-                frame.operand_stack.append(self.array_heap[y][x])
-            
-            #------------------------------------------------------------
-            # Special 
-            #------------------------------------------------------------
-
-            elif instr.opcode == OpCode.DUP:
-                x = frame.operand_stack.pop()
-                frame.operand_stack.append(x)
-                frame.operand_stack.append(x)
-
-            elif instr.opcode == OpCode.NOP:
-                # do nothing
-                pass
 
-            else:
-                self.error(f'unsupported operation {instr}')
+    #----------------------------------------------------------------------
+    # Literals and Variables
+    #----------------------------------------------------------------------
+
+    def op_push(self, frame, operand):
+        frame.operand_stack.append(operand)
+        return frame
+
+    def op_pop(self, frame, operand):
+        frame.operand_stack.pop()
+        return frame
+
+    def op_store(self, frame, operand):
+        tmp = frame.operand_stack.pop()
+        if len(frame.variables) <= operand:
+            frame.variables.append(tmp)
+        else:
+            frame.variables[operand] = tmp
+        return frame
+
+    def op_load(self, frame, operand):
+        frame.operand_stack.append(frame.variables[operand])
+        return frame
+
+
+    #----------------------------------------------------------------------
+    # Operations
+    #----------------------------------------------------------------------
+
+    def op_add(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x == None or y == None:
+            self.error(f'Invalid addition between a null-type and non-null type')
+        frame.operand_stack.append(y + x)
+        return frame
+
+    def op_sub(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x == None or y == None:
+            self.error(f'Invalid subtraction between a null-type and non-null type')
+        frame.operand_stack.append(y - x)
+        return frame
+
+    def op_mul(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x == None or y == None:
+            self.error(f'Invalid multiplication between a null-type and non-null type')
+        frame.operand_stack.append(y * x)
+        return frame
+
+    def op_div(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x == None or y == None:
+            self.error(f'Invalid division between a null-type and non-null type')
+        if x == 0:
+            self.error(f'Invalid division by zero')
+        if isinstance(x, int):
+            frame.operand_stack.append(y//x)
+        else:
+            frame.operand_stack.append(y/x)
+        return frame
+
+    def op_cmplt(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x == None or y == None:
+            self.error(f'Invalid comparison between a null-type and non-null type')
+        frame.operand_stack.append(y < x)
+        return frame
+
+    def op_cmple(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x == None or y == None:
+            self.error(f'Invalid comparison between a null-type and non-null type')
+        frame.operand_stack.append(y <= x)
+        return frame
+
+    def op_cmpeq(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        frame.operand_stack.append(y == x)
+        return frame
+
+    def op_cmpne(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        frame.operand_stack.append(y != x)
+        return frame
+
+    def op_and(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x == None or y == None:
+            self.error(f'Invalid comparison between a null-type and non-null type')
+        frame.operand_stack.append(y and x)
+        return frame
+
+    def op_or(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x == None or y == None:
+            self.error(f'Invalid comparison between a null-type and non-null type')
+        frame.operand_stack.append(y or x)
+        return frame
+
+    def op_not(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if x == None:
+            self.error(f'Invalid comparison between a null-type and non-null type')
+        frame.operand_stack.append(not x)
+        return frame
+
+
+    #----------------------------------------------------------------------
+    # Branching
+    #----------------------------------------------------------------------
+
+    def op_jmp(self, frame, operand):
+        frame.pc = operand
+        return frame
+
+    def op_jmpf(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if x == False:
+            frame.pc = operand
+        return frame
+
+
+    #----------------------------------------------------------------------
+    # Functions
+    #----------------------------------------------------------------------
+
+    def op_call(self, frame, operand):
+        # the operand is the (linked) frame template of the function
+        stack = frame.operand_stack
+        split = len(stack) - operand.arg_count
+        # the arguments become the first variables of the new frame
+        variables = stack[split:]
+        del stack[split:]
+        memo = None
+        if operand.memo is not None:
+            key = operand.memo.key(variables)
+            value = operand.memo.lookup(key)
+            if value is not MISSING:
+                stack.append(value)
+                return frame
+            memo = (operand.memo, key)
+        variables += operand.local_slots
+        if self.frame_pool:
+            new_frame = self.frame_pool.pop()
+            new_frame.template = operand
+            new_frame.pc = 0
+            new_frame.variables = variables
+            new_frame.memo = memo
+        else:
+            new_frame = VMFrame(operand, 0, variables, memo=memo)
+        self.call_stack.append(new_frame)
+        return new_frame
+
+    def op_tailcall(self, frame, operand):
+        stack = frame.operand_stack
+        split = len(stack) - operand.arg_count
+        variables = stack[split:]
+        variables += operand.local_slots
+        stack.clear()
+        if operand is frame.template:
+            # a recursive call restarts the current frame (a memoized
+            # call's result is still stored when the restarted one returns)
+            frame.pc = 0
+            frame.variables = variables
+            return frame
+        # the run loop only switches code on a frame change, so the call
+        # runs in a pooled frame that replaces the current one
+        if self.frame_pool:
+            new_frame = self.frame_pool.pop()
+            new_frame.template = operand
+            new_frame.pc = 0
+            new_frame.variables = variables
+            new_frame.memo = frame.memo
+        else:
+            new_frame = VMFrame(operand, 0, variables, memo=frame.memo)
+        self.call_stack[-1] = new_frame
+        frame.variables = None
+        frame.memo = None
+        self.frame_pool.append(frame)
+        return new_frame
+
+    def op_ret(self, frame, operand):
+        return_val = frame.operand_stack.pop()
+        if frame.memo is not None:
+            cache, key = frame.memo
+            cache.store(key, return_val)
+            frame.memo = None
+        call_stack = self.call_stack
+        call_stack.pop()
+        if not call_stack:
+            # returning from main ends the program
+            frame.operand_stack.append(return_val)
+            return None
+        # the returning frame is reused by a later call
+        frame.operand_stack.clear()
+        frame.variables = None
+        self.frame_pool.append(frame)
+        frame = call_stack[-1]
+        frame.operand_stack.append(return_val)
+        return frame
+
+
+    #----------------------------------------------------------------------
+    # Built-In Functions
+    #----------------------------------------------------------------------
+
+    def op_write(self, frame, operand):
+        self.output.write(to_text(frame.operand_stack.pop()))
+        return frame
+
+    def op_read(self, frame, operand):
+        # show any prompt before waiting for input
+        self.output.flush()
+        frame.operand_stack.append(self.input.readline())
+        return frame
+
+    def op_readint(self, frame, operand):
+        self.output.flush()
+        line = self.input.readline()
+        try:
+            frame.operand_stack.append(None if line == None else int(line))
+        except ValueError:
+            self.error(f'Item must be a valid number')
+        return frame
+
+    def op_readdbl(self, frame, operand):
+        self.output.flush()
+        line = self.input.readline()
+        try:
+            frame.operand_stack.append(None if line == None else float(line))
+        except ValueError:
+            self.error(f'Item must be a valid number')
+        return frame
+
+    def op_len(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if x == None:
+            self.error(f'Null value')
+        if isinstance(x, str):
+            frame.operand_stack.append(len(x))
+        else:
+            frame.operand_stack.append(len(self.array_heap[x]))
+        return frame
+
+    def op_getc(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if x == None:
+            self.error(f'Must be a valid string')
+        y = frame.operand_stack.pop()
+        if y == None:
+            self.error(f'Index must be of type int')
+        if y >= len(x) or y < 0:
+            self.error(f'Invalid index for string')
+        frame.operand_stack.append(x[y])
+        return frame
+
+    def op_toint(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if x == None:
+            self.error(f'NoneType cannot be converted to int type')
+        if type(x) == str:
+            if not x.isnumeric():
+                self.error(f'Item must be a valid number')
+        frame.operand_stack.append(int(x))
+        return frame
+
+    def op_todbl(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if x == None:
+            self.error(f'NoneType cannot be converted to double type')
+        if type(x) == str:
+            for ch in x:
+                if ch.isalpha():
+                    self.error(f'Must be a valid number')
+        if type(x) == int:
+            frame.operand_stack.append(x/1.0)
+        else:
+            frame.operand_stack.append(float(x))
+        return frame
+
+    def op_tostr(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if x == None:
+            self.error(f'NoneType cannot be converted to string type')
+        frame.operand_stack.append(str(x))
+        return frame
+
+
+    #----------------------------------------------------------------------
+    # Heap
+    #----------------------------------------------------------------------
+
+    def op_allocs(self, frame, operand):
+        self.gc.allocated()
+        oid = self.next_obj_id
+        self.next_obj_id += 1
+        frame.operand_stack.append(oid)
+        self.struct_heap[oid] = [None] * operand
+        return frame
+
+    def op_setf(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if not y in self.struct_heap:
+            self.error(f'Object not found')
+        self.struct_heap[y][operand] = x
+        return frame
+
+    def op_getf(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if not x in self.struct_heap:
+            self.error(f'Object not found')
+        frame.operand_stack.append(self.struct_heap[x][operand])
+        return frame
+
+    def op_alloca(self, frame, operand):
+        self.gc.allocated()
+        oid = self.next_obj_id
+        self.next_obj_id += 1
+        x = frame.operand_stack.pop()
+        frame.operand_stack.append(oid)
+        if x == None:
+            self.error(f'Size of array must be of int-type')
+        if x < 0:
+            self.error(f'Size of array must be zero or greater')
+        self.array_heap[oid] = new_array(operand, x)
+        return frame
+
+    def op_seti(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        z = frame.operand_stack.pop()
+        if not z in self.array_heap:
+            self.error(f'Array object not found')
+        if y == None:
+            self.error(f'Array index must be of int-type')    
+        if y < 0 or y >= len(self.array_heap[z]):
+            self.error(f'Cannot reach index {y}')
+        self.array_heap[z][y] = x
+        return frame
+
+    def op_geti(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if not y in self.array_heap:
+            self.error(f'Array object not found')
+        if x == None:
+            self.error(f'Array index must be of int-type')
+        if x < 0 or x >= len(self.array_heap[y]):
+            self.error(f'Cannot reach index {x}')
+        frame.operand_stack.append(self.array_heap[y][x])
+        return frame
+
+
+    #----------------------------------------------------------------------
+    # Register operations (operands are variable slots, see mypl_register)
+    #----------------------------------------------------------------------
+
+    def op_mov(self, frame, operand):
+        dst, src = operand
+        frame.variables[dst] = frame.variables[src]
+        return frame
+
+    def op_movi(self, frame, operand):
+        dst, value = operand
+        frame.variables[dst] = value
+        return frame
+
+    def op_addrr(self, frame, operand):
+        dst, a, b = operand
+        variables = frame.variables
+        y = variables[a]
+        x = variables[b]
+        if x == None or y == None:
+            self.error(f'Invalid addition between a null-type and non-null type')
+        variables[dst] = y + x
+        return frame
+
+    def op_addri(self, frame, operand):
+        dst, a, x = operand
+        variables = frame.variables
+        y = variables[a]
+        if x == None or y == None:
+            self.error(f'Invalid addition between a null-type and non-null type')
+        variables[dst] = y + x
+        return frame
+
+    def op_subrr(self, frame, operand):
+        dst, a, b = operand
+        variables = frame.variables
+        y = variables[a]
+        x = variables[b]
+        if x == None or y == None:
+            self.error(f'Invalid subtraction between a null-type and non-null type')
+        variables[dst] = y - x
+        return frame
+
+    def op_subri(self, frame, operand):
+        dst, a, x = operand
+        variables = frame.variables
+        y = variables[a]
+        if x == None or y == None:
+            self.error(f'Invalid subtraction between a null-type and non-null type')
+        variables[dst] = y - x
+        return frame
+
+    def op_mulrr(self, frame, operand):
+        dst, a, b = operand
+        variables = frame.variables
+        y = variables[a]
+        x = variables[b]
+        if x == None or y == None:
+            self.error(f'Invalid multiplication between a null-type and non-null type')
+        variables[dst] = y * x
+        return frame
+
+    def op_mulri(self, frame, operand):
+        dst, a, x = operand
+        variables = frame.variables
+        y = variables[a]
+        if x == None or y == None:
+            self.error(f'Invalid multiplication between a null-type and non-null type')
+        variables[dst] = y * x
+        return frame
+
+    def op_divrr(self, frame, operand):
+        dst, a, b = operand
+        variables = frame.variables
+        y = variables[a]
+        x = variables[b]
+        if x == None or y == None:
+            self.error(f'Invalid division between a null-type and non-null type')
+        if x == 0:
+            self.error(f'Invalid division by zero')
+        if isinstance(x, int):
+            variables[dst] = y // x
+        else:
+            variables[dst] = y / x
+        return frame
+
+    def op_divri(self, frame, operand):
+        dst, a, x = operand
+        variables = frame.variables
+        y = variables[a]
+        if x == None or y == None:
+            self.error(f'Invalid division between a null-type and non-null type')
+        if x == 0:
+            self.error(f'Invalid division by zero')
+        if isinstance(x, int):
+            variables[dst] = y // x
+        else:
+            variables[dst] = y / x
+        return frame
+
+    def op_cmpltrr(self, frame, operand):
+        dst, a, b = operand
+        variables = frame.variables
+        y = variables[a]
+        x = variables[b]
+        if x == None or y == None:
+            self.error(f'Invalid comparison between a null-type and non-null type')
+        variables[dst] = y < x
+        return frame
+
+    def op_cmpltri(self, frame, operand):
+        dst, a, x = operand
+        variables = frame.variables
+        y = variables[a]
+        if x == None or y == None:
+            self.error(f'Invalid comparison between a null-type and non-null type')
+        variables[dst] = y < x
+        return frame
+
+    def op_cmplerr(self, frame, operand):
+        dst, a, b = operand
+        variables = frame.variables
+        y = variables[a]
+        x = variables[b]
+        if x == None or y == None:
+            self.error(f'Invalid comparison between a null-type and non-null type')
+        variables[dst] = y <= x
+        return frame
+
+    def op_cmpleri(self, frame, operand):
+        dst, a, x = operand
+        variables = frame.variables
+        y = variables[a]
+        if x == None or y == None:
+            self.error(f'Invalid comparison between a null-type and non-null type')
+        variables[dst] = y <= x
+        return frame
+
+    def op_cmpeqrr(self, frame, operand):
+        dst, a, b = operand
+        variables = frame.variables
+        y = variables[a]
+        x = variables[b]
+        variables[dst] = y == x
+        return frame
+
+    def op_cmpeqri(self, frame, operand):
+        dst, a, x = operand
+        variables = frame.variables
+        y = variables[a]
+        variables[dst] = y == x
+        return frame
+
+    def op_cmpnerr(self, frame, operand):
+        dst, a, b = operand
+        variables = frame.variables
+        y = variables[a]
+        x = variables[b]
+        variables[dst] = y != x
+        return frame
+
+    def op_cmpneri(self, frame, operand):
+        dst, a, x = operand
+        variables = frame.variables
+        y = variables[a]
+        variables[dst] = y != x
+        return frame
+
+    def op_jmpfr(self, frame, operand):
+        src, offset = operand
+        if frame.variables[src] == False:
+            frame.pc = offset
+        return frame
+
+
+    #----------------------------------------------------------------------
+    # Superinstructions (same semantics as the fused instructions)
+    #----------------------------------------------------------------------
+
+    def op_incr(self, frame, operand):
+        index, x = operand
+        y = frame.variables[index]
+        if x == None or y == None:
+            self.error(f'Invalid addition between a null-type and non-null type')
+        frame.variables[index] = y + x
+        return frame
+
+    def op_load_geti(self, frame, operand):
+        array_index, index = operand
+        y = frame.variables[array_index]
+        x = frame.variables[index]
+        if not y in self.array_heap:
+            self.error(f'Array object not found')
+        if x == None:
+            self.error(f'Array index must be of int-type')
+        if x < 0 or x >= len(self.array_heap[y]):
+            self.error(f'Cannot reach index {x}')
+        frame.operand_stack.append(self.array_heap[y][x])
+        return frame
+
+    def op_loadload(self, frame, operand):
+        first_index, second_index = operand
+        frame.operand_stack.append(frame.variables[first_index])
+        frame.operand_stack.append(frame.variables[second_index])
+        return frame
+
+    def op_cmplt_jmpf(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x == None or y == None:
+            self.error(f'Invalid comparison between a null-type and non-null type')
+        if not y < x:
+            frame.pc = operand
+        return frame
+
+    def op_cmple_jmpf(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x == None or y == None:
+            self.error(f'Invalid comparison between a null-type and non-null type')
+        if not y <= x:
+            frame.pc = operand
+        return frame
+
+
+    #----------------------------------------------------------------------
+    # Special 
+    #----------------------------------------------------------------------
+
+    def op_dup(self, frame, operand):
+        x = frame.operand_stack.pop()
+        frame.operand_stack.append(x)
+        frame.operand_stack.append(x)
+        return frame
+
+    def op_nop(self, frame, operand):
+        # do nothing
+        return frame
+
+    def op_end(self, frame, operand):
+        # ran past the last instruction of the frame
+        frame.pc -= 1
+        return None
+
+    def op_unsupported(self, frame, operand):
+        instr = frame.template.instructions[frame.pc - 1]
+        self.error(f'unsupported operation {instr}')
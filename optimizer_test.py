@@ -0,0 +1,262 @@
+"""Unit tests for the MyPL optimizations (constant folding and the
+peephole optimizer).
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import pytest
+import io
+
+from mypl_error import *
+from mypl_iowrapper import *
+from mypl_opcode import *
+from mypl_frame import *
+from mypl_lexer import *
+from mypl_ast_parser import *
+from mypl_semantic_checker import *
+from mypl_code_gen import *
+from mypl_vm import *
+from mypl_optimizer import *
+from mypl_const_folder import *
+from mypl_memo import *
+from mypl_compiler import *
+
+
+def build(program, fold=False, memo=False):
+    in_stream = FileWrapper(io.StringIO(program))
+    vm = VM()
+    ast = ASTParser(Lexer(in_stream)).parse()
+    ast.accept(SemanticChecker())
+    if fold:
+        ast.accept(ConstantFolder())
+    ast.accept(CodeGenerator(vm))
+    if memo:
+        memoize(vm, ast)
+    return vm
+
+
+def instructions(vm, name='main'):
+    return [str(instr) for instr in vm.frame_templates[name].instructions]
+
+
+#----------------------------------------------------------------------
+# Constant folding
+#----------------------------------------------------------------------
+
+def test_constant_expressions_folded():
+    program = 'void main() { print(2 * 60 * 60); print("a" + "b"); print(not (1.5 < 2.0)); }'
+    assert instructions(build(program, True)) == [
+        'OpCode.PUSH(7200)', 'OpCode.WRITE()', 'OpCode.PUSH(ab)', 'OpCode.WRITE()',
+        'OpCode.PUSH(False)', 'OpCode.WRITE()', 'OpCode.PUSH()', 'OpCode.RET()']
+
+
+def test_division_by_zero_not_folded():
+    program = 'void main() { print(1 / 0); }'
+    with pytest.raises(MyPLError) as e:
+        build(program, True).run()
+    assert str(e.value) == 'VM Error: Invalid division by zero'
+
+
+def test_constant_locals_and_branches(capsys):
+    program = (
+        'void main() { \n'
+        '  int n = 4; \n'
+        '  int m = 1; \n'
+        '  bool debug = false; \n'
+        '  m = m + n; \n'
+        '  if (debug) { print("debug"); } \n'
+        '  elseif (n > 3) { int k = n * n; print(k + m); } \n'
+        '  else { print("small"); } \n'
+        '  while (debug) { print("loop"); } \n'
+        '} \n'
+    )
+    build(program).run()
+    expected = capsys.readouterr().out
+    vm = build(program, True)
+    # only m is left as a variable
+    assert instructions(vm) == [
+        'OpCode.PUSH(1)', 'OpCode.STORE(0)', 'OpCode.LOAD(0)', 'OpCode.PUSH(4)',
+        'OpCode.ADD()', 'OpCode.STORE(0)', 'OpCode.PUSH(16)', 'OpCode.LOAD(0)',
+        'OpCode.ADD()', 'OpCode.WRITE()', 'OpCode.PUSH()', 'OpCode.RET()']
+    vm.run()
+    assert capsys.readouterr().out == expected == '21'
+
+
+#----------------------------------------------------------------------
+# Peephole optimizer
+#----------------------------------------------------------------------
+
+def optimize(instructions, passes=None):
+    template = VMFrameTemplate('main', 0, instructions)
+    PeepholeOptimizer(passes).optimize_template(template)
+    return [str(instr) for instr in template.instructions]
+
+
+def test_nops_removed_and_jumps_retargeted():
+    code = [PUSH(True), JMPF(4), PUSH('a'), WRITE(), NOP(), NOP(), PUSH(None), RET()]
+    assert optimize(code, [remove_nops]) == [
+        'OpCode.PUSH(True)', 'OpCode.JMPF(4)', 'OpCode.PUSH(a)', 'OpCode.WRITE()',
+        'OpCode.PUSH()', 'OpCode.RET()']
+
+
+def test_jump_chains_threaded():
+    code = [JMP(2), NOP(), JMP(4), NOP(), PUSH(1), WRITE()]
+    assert optimize(code) == ['OpCode.PUSH(1)', 'OpCode.WRITE()']
+
+
+def test_dead_return_and_pairs():
+    code = [STORE(0), LOAD(0), PUSH(2), POP(), RET(), PUSH(None), RET()]
+    assert optimize(code) == ['OpCode.DUP()', 'OpCode.STORE(0)', 'OpCode.RET()']
+
+
+def test_optimized_program_output(capsys):
+    program = (
+        'int f(int n) { \n'
+        '  int s = 0; \n'
+        '  while (n > 0) { \n'
+        '    if (n == 3) { s = s + 10; } elseif (n == 2) { s = s + 1; } \n'
+        '    else { s = s + 100; } \n'
+        '    n = n - 1; \n'
+        '  } \n'
+        '  return s; \n'
+        '} \n'
+        'void main() { print(f(4)); } \n'
+    )
+    build(program).run()
+    expected = capsys.readouterr().out
+    vm = build(program)
+    before, after = PeepholeOptimizer().optimize(vm)
+    assert after < before
+    vm.run()
+    assert capsys.readouterr().out == expected
+
+
+#----------------------------------------------------------------------
+# Superinstructions
+#----------------------------------------------------------------------
+
+def test_superinstructions_fused():
+    code = [PUSH(0), STORE(0), LOAD(0), PUSH(3), CMPLT(), JMPF(15), LOAD(1),
+            LOAD(0), GETI(), WRITE(), LOAD(0), PUSH(1), ADD(), STORE(0), JMP(2), NOP()]
+    assert optimize(code, [remove_nops, fuse_superinstructions]) == [
+        'OpCode.PUSH(0)', 'OpCode.STORE(0)', 'OpCode.LOAD(0)', 'OpCode.PUSH(3)',
+        'OpCode.CMPLT_JMPF(9)', 'OpCode.LOAD_GETI(1, 0)', 'OpCode.WRITE()',
+        'OpCode.INCR(0, 1)', 'OpCode.JMP(2)']
+
+
+def test_superinstructions_not_fused_across_jump_targets():
+    code = [LOAD(0), JMP(3), LOAD(1), LOAD(2), ADD(), WRITE()]
+    assert optimize(code, [fuse_superinstructions]) == [str(instr) for instr in code]
+
+
+def test_superinstructions_expanded():
+    code = [INCR(0, 1), CMPLT_JMPF(3), LOADLOAD(0, 1), JMP(1)]
+    assert [str(instr) for instr in expand_superinstructions(code)] == [
+        'OpCode.LOAD(0)', 'OpCode.PUSH(1)', 'OpCode.ADD()', 'OpCode.STORE(0)',
+        'OpCode.CMPLT()', 'OpCode.JMPF(8)', 'OpCode.LOAD(0)', 'OpCode.LOAD(1)',
+        'OpCode.JMP(4)']
+
+
+def test_superinstructions_program_output(capsys):
+    program = (
+        'void main() { \n'
+        '  array int xs = new int[6]; \n'
+        '  for (int i = 0; i < 6; i = i + 1) { xs[i] = i * i; } \n'
+        '  int s = 0; \n'
+        '  for (int j = 0; j < 6; j = j + 1) { s = s + xs[j]; } \n'
+        '  print(s); \n'
+        '} \n'
+    )
+    vm = build(program)
+    PeepholeOptimizer().optimize(vm)
+    opcodes = {instr.opcode for instr in vm.frame_templates['main'].instructions}
+    assert {OpCode.INCR, OpCode.LOAD_GETI, OpCode.CMPLT_JMPF} <= opcodes
+    vm.run()
+    assert capsys.readouterr().out == '55'
+
+
+def test_empty_comparison_branches_still_compare():
+    code = [LOAD(0), PUSH(3), CMPLT_JMPF(3), LOAD(0), PUSH(3), CMPLE_JMPF(6), PUSH(1), WRITE()]
+    assert optimize(code, [thread_jumps]) == [
+        'OpCode.LOAD(0)', 'OpCode.PUSH(3)', 'OpCode.CMPLT()', 'OpCode.POP()',
+        'OpCode.LOAD(0)', 'OpCode.PUSH(3)', 'OpCode.CMPLE()', 'OpCode.POP()',
+        'OpCode.PUSH(1)', 'OpCode.WRITE()']
+    for op in ['<', '<=']:
+        program = 'void main() { int x = null; if (x %s 3) { } print("after"); }' % op
+        vm = build(program)
+        PeepholeOptimizer().optimize(vm)
+        with pytest.raises(MyPLError) as e:
+            vm.run()
+        assert 'Invalid comparison' in str(e.value)
+    # (the operands are popped, so a loop does not grow the stack)
+    vm = build('void main() { for (int i = 0; i < 3; i = i + 1) { if (i <= 1) { } } }')
+    PeepholeOptimizer().optimize(vm)
+    code = instructions(vm)
+    i = code.index('OpCode.CMPLE()')
+    assert code[i - 2:i + 2] == ['OpCode.LOAD(0)', 'OpCode.PUSH(1)', 'OpCode.CMPLE()', 'OpCode.POP()']
+
+
+#----------------------------------------------------------------------
+# Memoization
+#----------------------------------------------------------------------
+
+MEMO_PROGRAM = (
+    'struct P { int x; } \n'
+    'int fib(int n) { if (n <= 1) { return n; } return fib(n - 2) + fib(n - 1); } \n'
+    'int twice(int n) { int t = fib(n); return t + t; } \n'
+    'int shout(int n) { print("!"); return n; } \n'
+    'int calls_shout(int n) { return shout(n); } \n'
+    'int px(P p) { return p.x; } \n'
+    'void main() { print(twice(30)); print(" "); print(calls_shout(1)); } \n'
+)
+
+
+def test_pure_functions_inferred():
+    in_stream = FileWrapper(io.StringIO(MEMO_PROGRAM))
+    ast = ASTParser(Lexer(in_stream)).parse()
+    ast.accept(SemanticChecker())
+    checker = PurityChecker()
+    ast.accept(checker)
+    assert checker.pure_functions == {'fib', 'twice'}
+
+
+def test_memoized_calls(capsys):
+    vm = build(MEMO_PROGRAM, memo=True)
+    vm.run()
+    assert capsys.readouterr().out == '1664080 !1'
+    cache = vm.frame_templates['fib'].memo
+    assert (cache.hits, cache.misses) == (28, 31)
+    FrameCompiler(build(MEMO_PROGRAM, memo=True)).run()
+    assert capsys.readouterr().out == '1664080 !1'
+
+
+def test_memo_cache_evicts_least_recently_used():
+    cache = MemoCache('f', max_size=2)
+    cache.store((1,), 'a')
+    cache.store((2,), None)
+    assert cache.lookup((1,)) == 'a' and cache.lookup((2,)) is None
+    cache.lookup((1,))
+    cache.store((3,), 'c')
+    assert cache.lookup((2,)) is MISSING
+    assert list(cache.entries) == [(1,), (3,)]
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_memo_keys_keep_sign_of_zero(capsys):
+    program = (
+        'string f(double x) { return dtos(x); } \n'
+        'void main() { print(f(0.0)); print(" "); print(f(0.0 * (0.0 - 1.0))); } \n'
+    )
+    build(program).run()
+    expected = capsys.readouterr().out
+    assert expected == '0.0 -0.0'
+    build(program, memo=True).run()
+    assert capsys.readouterr().out == expected
+    FrameCompiler(build(program, memo=True)).run()
+    assert capsys.readouterr().out == expected
+    cache = MemoCache('f')
+    assert cache.key([1, 2.5]) == (1, 2.5)
+    assert cache.key([0.0]) != cache.key([-0.0])
@@ -0,0 +1,752 @@
+"""Unit tests for the MyPL VM.
+
+NAME: Connor Jones
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import pytest
+import io
+import json
+import signal
+
+from mypl_error import *
+from mypl_iowrapper import *
+from mypl_opcode import *
+from mypl_frame import *
+from mypl_lexer import *
+from mypl_ast_parser import *
+from mypl_semantic_checker import *
+from mypl_code_gen import *
+from mypl_vm import *
+from mypl_register import *
+from mypl_array import *
+from mypl_compiler import *
+from mypl_output import *
+from mypl_input import *
+from mypl_profile import *
+from mypl_trace import *
+from mypl_cache import *
+from mypl_token_buffer import *
+from mypl_parallel import *
+from mypl_incremental import *
+
+
+def build(program, registers=False, gc_threshold=10000):
+    in_stream = FileWrapper(io.StringIO(program))
+    vm = VM(gc_threshold)
+    ast = ASTParser(Lexer(in_stream)).parse()
+    ast.accept(SemanticChecker())
+    ast.accept(CodeGenerator(vm, registers))
+    return vm
+
+
+#----------------------------------------------------------------------
+# Dispatch
+#----------------------------------------------------------------------
+
+def test_every_opcode_has_a_handler():
+    vm = VM()
+    for opcode in OpCode:
+        assert vm.dispatch[opcode] != vm.op_unsupported
+
+
+def test_unsupported_opcode_is_vm_error():
+    vm = VM()
+    main = VMFrameTemplate('main', 0)
+    main.instructions.append(VMInstr(OpCode.NOP))
+    vm.add_frame_template(main)
+    vm.dispatch[OpCode.NOP] = vm.op_unsupported
+    with pytest.raises(MyPLError):
+        vm.run()
+
+
+def test_finalize_packs_opcodes_and_operands():
+    template = VMFrameTemplate('main', 0)
+    template.instructions += [PUSH(3), STORE(0), LOAD(0), WRITE()]
+    template.finalize()
+    assert list(template.opcodes) == [OpCode.PUSH, OpCode.STORE, OpCode.LOAD,
+                                      OpCode.WRITE, END_OF_CODE]
+    assert template.operands == [3, 0, 0, None, None]
+
+
+def test_running_past_last_instruction_stops(capsys):
+    vm = VM()
+    main = VMFrameTemplate('main', 0)
+    main.instructions += [PUSH('ok'), WRITE()]
+    vm.add_frame_template(main)
+    vm.run()
+    captured = capsys.readouterr()
+    assert captured.out == 'ok'
+
+
+def test_recursive_and_array_program(capsys):
+    program = (
+        'int fib(int n) { \n'
+        '  if (n <= 1) { return n; } \n'
+        '  return fib(n - 2) + fib(n - 1); \n'
+        '} \n'
+        'void main() { \n'
+        '  array int xs = new int[5]; \n'
+        '  for (int i = 0; i < 5; i = i + 1) { xs[i] = fib(i + 5); } \n'
+        '  print(xs[0]); print(" "); print(xs[4]); \n'
+        '} \n'
+    )
+    build(program).run()
+    captured = capsys.readouterr()
+    assert captured.out == '5 34'
+
+
+#----------------------------------------------------------------------
+# Output
+#----------------------------------------------------------------------
+
+def test_output_sink_buffers_until_full():
+    stream = io.StringIO()
+    sink = OutputSink(stream, buffer_size=4)
+    sink.write('ab')
+    assert stream.getvalue() == ''
+    sink.write('cd')
+    sink.write('e')
+    assert stream.getvalue() == 'abcd'
+    sink.flush()
+    assert stream.getvalue() == 'abcde'
+
+
+def test_output_captured_in_memory(capsys):
+    program = 'void main() { print(1); print(null); print(true); print(2.5); }'
+    output = io.StringIO()
+    vm = VM(output=output)
+    vm.frame_templates = build(program).frame_templates
+    vm.run()
+    assert output.getvalue() == '1nulltrue2.5'
+    FrameCompiler(vm).run()
+    assert output.getvalue() == '1nulltrue2.5' * 2
+    assert capsys.readouterr().out == ''
+
+
+def test_output_flushed_before_input():
+    stream = io.StringIO()
+
+    class Echo:
+        # reads a line consisting of the output so far
+        def readline(self):
+            return stream.getvalue() + '!'
+
+    vm = build('void main() { print("name? "); string s = input(); print(s); }')
+    vm.output = OutputSink(stream)
+    vm.input = Echo()
+    vm.run()
+    assert stream.getvalue() == 'name? name? !'
+
+
+#----------------------------------------------------------------------
+# Input
+#----------------------------------------------------------------------
+
+def test_input_source_splits_chunks_into_lines():
+    source = InputSource(io.StringIO('ab\r\ncd\n\nlast'), chunk_size=3)
+    lines = [source.readline() for _ in range(5)]
+    assert lines == ['ab', 'cd', '', 'last', None]
+
+
+def test_numeric_input_builtins(capsys):
+    program = (
+        'void main() { \n'
+        '  int n = readint(); \n'
+        '  double s = 0.0; \n'
+        '  for (int i = 0; i < n; i = i + 1) { s = s + readdouble(); } \n'
+        '  print(s); print(" "); print(input()); print(readint()); \n'
+        '} \n'
+    )
+    text = '3\n1.5\n -2 \n4\nend\n'
+    output = io.StringIO()
+    vm = VM(output=output, input_source=InputSource(io.StringIO(text)))
+    vm.frame_templates = build(program).frame_templates
+    vm.run()
+    vm.input = InputSource(io.StringIO(text))
+    FrameCompiler(vm).run()
+    assert output.getvalue() == '3.5 endnull' * 2
+    vm.input = InputSource(io.StringIO('x\n'))
+    with pytest.raises(MyPLError) as e:
+        vm.run()
+    assert str(e.value).startswith('VM Error: Item must be a valid number')
+
+
+#----------------------------------------------------------------------
+# Calls
+#----------------------------------------------------------------------
+
+CALL_PROGRAM = (
+    'int add(int x, int y) { int s = x + y; return s; } \n'
+    'void main() { print(add(add(1, 2), 10)); } \n'
+)
+
+def test_arguments_copied_into_variables(capsys):
+    vm = build(CALL_PROGRAM)
+    add = vm.frame_templates['add']
+    assert [str(instr) for instr in add.instructions[:4]] == [
+        'OpCode.LOAD(0)', 'OpCode.LOAD(1)', 'OpCode.ADD()', 'OpCode.STORE(2)']
+    assert add.var_count == 3
+    vm.run()
+    assert capsys.readouterr().out == '13'
+
+
+def test_calls_linked_and_frames_reused():
+    vm = build(CALL_PROGRAM)
+    vm.run()
+    main = vm.frame_templates['main']
+    calls = [pc for pc, opcode in enumerate(main.opcodes) if opcode == OpCode.CALL]
+    assert all(main.operands[pc] is vm.frame_templates['add'] for pc in calls)
+    # both calls ran in the same frame object
+    assert len(vm.frame_pool) == 1
+
+
+TAIL_CALL_PROGRAM = (
+    'int sum(int n, int acc) { \n'
+    '  if (n == 0) { return acc; } \n'
+    '  return sum(n - 1, acc + n); \n'
+    '} \n'
+    'bool even(int n) { if (n == 0) { return true; } return odd(n - 1); } \n'
+    'bool odd(int n) { if (n == 0) { return false; } return even(n - 1); } \n'
+    'void main() { print(sum(100000, 0)); print(" "); print(even(10001)); } \n'
+)
+
+def test_tail_calls_generated():
+    vm = build(TAIL_CALL_PROGRAM)
+    code = [str(instr) for instr in vm.frame_templates['sum'].instructions]
+    assert 'OpCode.TAILCALL(sum)' in code and 'OpCode.CALL(sum)' not in code
+    # a returned call to a built-in is not a tail call
+    vm = build('string f(int x) { return itos(x); } void main() { print(f(1)); }')
+    code = [str(instr) for instr in vm.frame_templates['f'].instructions]
+    assert 'OpCode.TOSTR()' in code and 'OpCode.RET()' in code
+
+
+def test_tail_calls_run_in_constant_frames(capsys):
+    vm = build(TAIL_CALL_PROGRAM)
+    vm.run()
+    assert capsys.readouterr().out == '5000050000 false'
+    assert len(vm.frame_pool) <= 2
+
+
+def test_call_to_missing_function():
+    vm = VM()
+    main = VMFrameTemplate('main', 0)
+    main.instructions += [CALL('f'), RET()]
+    vm.add_frame_template(main)
+    with pytest.raises(MyPLError) as e:
+        vm.run()
+    assert str(e.value) == 'VM Error: Function "f" not found'
+
+
+#----------------------------------------------------------------------
+# Code cache
+#----------------------------------------------------------------------
+
+def test_cache_round_trip(tmp_path, capsys):
+    filename = tmp_path / 'prog.mypl'
+    filename.write_text(STRUCT_PROGRAM)
+    vm = build(STRUCT_PROGRAM, registers=True)
+    CodeCache(filename, registers=True).store(vm, ['f'])
+    assert (tmp_path / CACHE_DIR / 'prog.reg.myplc').exists()
+    cached = VM()
+    assert CodeCache(filename, registers=True).load(cached) == ['f']
+    assert repr(cached) == repr(vm)
+    cached.run()
+    vm.run()
+    out = capsys.readouterr().out
+    assert out[:len(out) // 2] == out[len(out) // 2:]
+
+
+def test_cache_invalidated(tmp_path):
+    filename = tmp_path / 'prog.mypl'
+    filename.write_text(CALL_PROGRAM)
+    CodeCache(filename).store(build(CALL_PROGRAM), [])
+    # the options and source are part of the key
+    assert CodeCache(filename, optimize=True).load(VM()) is None
+    filename.write_text(CALL_PROGRAM + ' ')
+    assert CodeCache(filename).load(VM()) is None
+    # as is the content of the cache file
+    filename.write_text(CALL_PROGRAM)
+    cache = CodeCache(filename)
+    assert cache.load(VM()) == []
+    with open(cache.path, 'r+b') as cache_file:
+        cache_file.truncate(200)
+    vm = VM()
+    assert cache.load(vm) is None and vm.frame_templates == {}
+
+
+#----------------------------------------------------------------------
+# Token buffer
+#----------------------------------------------------------------------
+
+def test_token_buffer_matches_lexer():
+    program = ('// sum\nvoid main() {\n  string s = "a\nb"; int x = 42;\n'
+               '  double y = 1.5; // ok\n\tprint(s + itos(x));\n}\n')
+    lexer = Lexer(FileWrapper(io.StringIO(program)))
+    buffer = TokenBuffer(FileWrapper(io.StringIO(program), 5))
+    tokens = []
+    while not tokens or tokens[-1].token_type != TokenType.EOS:
+        tokens.append(lexer.next_token())
+    assert len(buffer) == len(tokens)
+    assert [buffer.next_token() for _ in tokens] == tokens
+    assert buffer.next_token() == tokens[-1]
+
+
+def test_token_buffer_parses_program(capsys):
+    in_stream = FileWrapper(io.StringIO(STRUCT_PROGRAM))
+    vm = VM()
+    ast = ASTParser(TokenBuffer(in_stream)).parse()
+    ast.accept(SemanticChecker())
+    ast.accept(CodeGenerator(vm))
+    assert repr(vm) == repr(build(STRUCT_PROGRAM))
+    # a lexer error is raised when the parser reaches it
+    program = 'void main() { int x = 1 }\n int y = #;'
+    with pytest.raises(MyPLError) as e:
+        ASTParser(TokenBuffer(FileWrapper(io.StringIO(program)))).parse()
+    assert str(e.value).startswith('Parser Error')
+
+
+#----------------------------------------------------------------------
+# Parallel parsing
+#----------------------------------------------------------------------
+
+PARALLEL_PROGRAM = (
+    'struct P { int x; }\n'
+    'string f() { return "}\n{"; } // }\n'
+    'void g() { P p = new P(); p.x = 1; } int h() { return 2; }\n'
+    'void main() { print(f()); g(); print(h()); }\n'
+)
+
+def test_split_definitions_skips_strings_and_comments():
+    chunks = split_definitions(PARALLEL_PROGRAM, 1)
+    # (the line break within the string is not counted as a line)
+    assert [(line, column) for text, line, column in chunks] == [
+        (1, 0), (1, 19), (2, 28), (3, 36), (3, 58), (4, 44)]
+    assert ''.join(text for text, line, column in chunks) == PARALLEL_PROGRAM
+
+
+def test_parallel_parse_matches_sequential():
+    program = PARALLEL_PROGRAM * 3
+    sequential = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    parser = ParallelParser(FileWrapper(io.StringIO(program)), 2, min_size=0)
+    assert parser.parse() == sequential
+    # an error is the first one in the program (as in a sequential parse)
+    program = program.replace('return 2;', 'return 2') + 'void k() { # }'
+    with pytest.raises(MyPLError) as e:
+        ParallelParser(FileWrapper(io.StringIO(program)), 2, min_size=0).parse()
+    assert str(e.value) == 'Parser Error: Semicolon expected found "}" at line 3, column 57'
+
+
+#----------------------------------------------------------------------
+# Incremental parsing
+#----------------------------------------------------------------------
+
+def parse_text(program):
+    return ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+
+
+def test_text_edit():
+    assert text_edit('int x = 1;', 'int x = 21;') == (8, 8, '2')
+    assert text_edit('abcabc', 'abc') == (3, 6, '')
+    assert text_edit('', 'a') == (0, 0, 'a')
+
+
+def test_incremental_edit_reuses_definitions():
+    parser = IncrementalParser(PARALLEL_PROGRAM)
+    f, g, h, main = parser.parse().fun_defs
+    # an edit within g leaves the other definitions (on other lines) as is
+    start = PARALLEL_PROGRAM.index('p.x = 1')
+    parser.edit(start + 6, start + 7, '42')
+    program = parser.parse()
+    assert program == parse_text(parser.source)
+    assert program.fun_defs[0] is f and program.fun_defs[3] is main
+    assert program.fun_defs[1] is not g
+    # new lines move the definitions after them
+    parser.edit(0, 0, '\n\n')
+    program = parser.parse()
+    assert program == parse_text(parser.source)
+    assert program.fun_defs[3] is main and main.fun_name.line == 6
+
+
+def test_incremental_errors_and_types():
+    program = 'void main() { array int xs = new int[2]; int y = xs[0]; print(y); }\n'
+    parser = IncrementalParser(program)
+    parser.parse().accept(SemanticChecker())
+    # (the checker changes the array type of xs)
+    assert parser.parse() == parse_text(program)
+    parser.edit(len(program), len(program), 'void f() { int x = 1 }\nvoid g() { # }\n')
+    with pytest.raises(MyPLError) as e:
+        parser.parse()
+    assert str(e.value) == 'Parser Error: Semicolon expected found "}" at line 2, column 22'
+    parser.edit(len(program) + 20, len(program) + 20, ';')
+    with pytest.raises(MyPLError) as e:
+        parser.parse()
+    assert str(e.value) == 'Lexer Error: Unexpected symbol {ch} found at line 3, column 12'
+
+
+def test_incremental_recheck_after_edit():
+    program = (
+        'struct P { int x; } \n'
+        'void main() { int x = 0; bool b = not x; bool c = not new P(1); } \n'
+        'void other() { int y = 1; } \n'
+    )
+    parser = IncrementalParser(program)
+    parser.parse().accept(SemanticChecker())
+    # (the checker changes the types of x and P to bool)
+    start = program.index('y = 1')
+    parser.edit(start + 4, start + 5, '2')
+    program_node = parser.parse()
+    assert program_node == parse_text(parser.source)
+    program_node.accept(SemanticChecker())
+
+
+#----------------------------------------------------------------------
+# Profiling
+#----------------------------------------------------------------------
+
+def test_profile_counts_calls_and_instructions(capsys):
+    vm = build(CALL_PROGRAM)
+    profiler = Profiler(vm)
+    profiler.run()
+    assert capsys.readouterr().out == '13'
+    add = profiler.functions['add']
+    main = profiler.functions['main']
+    assert (add.calls, add.instructions, add.total_instructions) == (2, 12, 12)
+    assert (main.calls, main.instructions, main.total_instructions) == (1, 8, 20)
+    report = profiler.report()
+    assert report['instructions'] == 20
+    assert report['opcodes']['CALL'] == 2 and report['opcodes']['RET'] == 3
+
+
+def test_profile_tail_calls(capsys):
+    vm = build(TAIL_CALL_PROGRAM)
+    profiler = Profiler(vm)
+    profiler.run()
+    capsys.readouterr()
+    functions = profiler.functions
+    assert functions['sum'].calls == 100001
+    assert functions['even'].calls + functions['odd'].calls == 10002
+    assert functions['main'].total_instructions == profiler.instructions
+    output = io.StringIO()
+    profiler.write_json(output)
+    assert json.loads(output.getvalue())['functions']['sum']['calls'] == 100001
+
+
+def test_sampling_by_instruction_count(capsys):
+    sampler = SamplingProfiler(build(CALL_PROGRAM), 1, instructions=True)
+    sampler.run()
+    assert sampler.samples == {('main',): 8, ('main', 'add'): 12}
+    sampler = SamplingProfiler(build(CALL_PROGRAM), 6, instructions=True, pcs=True)
+    sampler.run()
+    output = io.StringIO()
+    sampler.write_collapsed(output)
+    assert output.getvalue() == 'main@2;add@2 1\nmain@4;add@0 1\nmain@5 1\n'
+
+
+@pytest.mark.skipif(not hasattr(signal, 'setitimer'), reason='no timer signals')
+def test_sampling_by_time(capsys):
+    program = (
+        'void main() { \n'
+        '  int s = 0; \n'
+        '  for (int i = 0; i < 200000; i = i + 1) { s = s + i; } \n'
+        '  print(s); \n'
+        '} \n'
+    )
+    sampler = SamplingProfiler(build(program), 0.001)
+    sampler.run()
+    assert capsys.readouterr().out == '19999900000'
+    assert set(sampler.samples) == {('main',)}
+
+
+def trace(vm, buffer_size=TRACE_BUFFER_SIZE):
+    """Runs the program on the VM, returning the analyzed trace."""
+    trace_file = io.BytesIO()
+    recorder = TraceRecorder(vm, trace_file, buffer_size)
+    recorder.run()
+    trace_file.seek(0)
+    analyzer = TraceAnalyzer()
+    analyzer.read(trace_file, chunk_size=100)
+    assert analyzer.instructions == recorder.instructions
+    return analyzer
+
+
+def test_trace_records_each_instruction(capsys):
+    analyzer = trace(build(CALL_PROGRAM), buffer_size=10)
+    assert capsys.readouterr().out == '13'
+    assert analyzer.instructions == 20
+    assert [function['name'] for function in analyzer.functions] == ['add', 'main']
+    assert analyzer.counts == [[2] * 6 + [0] * 2, [1] * 8]
+    # calls and returns split main's path
+    assert analyzer.paths == {('main', ((0, 2),)): 1, ('main', ((3, 4),)): 1,
+                              ('main', ((5, 7),)): 1, ('add', ((0, 5),)): 2}
+
+
+def test_trace_branches_and_loops(capsys):
+    program = (
+        'void main() { \n'
+        '  for (int i = 0; i < 3; i = i + 1) { \n'
+        '    int j = 0; \n'
+        '    while (j < i) { j = j + 1; } \n'
+        '  } \n'
+        '} \n'
+    )
+    analyzer = trace(build(program))
+    loops = sorted(analyzer.loops.values(), key=lambda loop: loop.entries)
+    assert loops == [LoopStats(1, 3, 3), LoopStats(3, 3, 2)]
+    branches = sorted(analyzer.branches.values(), key=lambda branch: branch.taken)
+    assert branches == [BranchStats(1, 3), BranchStats(3, 3)]
+    output = io.StringIO()
+    analyzer.print_report(file=output)
+    assert output.getvalue().startswith(f'{analyzer.instructions} instructions')
+
+
+def test_trace_branch_to_next_instruction(capsys):
+    vm = VM()
+    main = VMFrameTemplate('main', 0)
+    # (the first branch is taken, the second is not)
+    main.instructions += [PUSH(False), JMPF(2), PUSH(True), JMPF(4), PUSH('ok'), WRITE(),
+                          PUSH(None), RET()]
+    vm.add_frame_template(main)
+    analyzer = trace(vm)
+    assert capsys.readouterr().out == 'ok'
+    assert analyzer.branches == {('main', 1): BranchStats(0, 0, 1),
+                                 ('main', 3): BranchStats(0, 0, 1)}
+    output = io.StringIO()
+    analyzer.print_report(file=output)
+    assert 'OpCode.JMPF(2) (to next, run 1)' in output.getvalue()
+
+
+def test_trace_deep_recursion(capsys):
+    program = (
+        'int down(int n) { if (n == 0) { return 0; } return 1 + down(n - 1); } \n'
+        'void main() { print(down(70000)); } \n'
+    )
+    analyzer = trace(build(program))
+    assert capsys.readouterr().out == '70000'
+    assert analyzer.counts[0][0] == 70001
+
+
+#----------------------------------------------------------------------
+# Typed arrays
+#----------------------------------------------------------------------
+
+def test_typed_array_elements_start_null():
+    xs = new_array('int', 3)
+    assert isinstance(xs, TypedArray)
+    assert list(xs) == [None, None, None]
+    xs[1] = 5
+    xs[2] = -7
+    xs[2] = None
+    assert list(xs) == [None, 5, None] and len(xs) == 3
+    bs = new_array('bool', 2)
+    bs[0] = False
+    assert list(bs) == [False, None]
+    assert new_array('string', 2) == [None, None]
+    assert new_array(None, 0) == []
+
+
+def test_typed_array_falls_back_to_list():
+    xs = new_array('int', 2)
+    xs[0] = 1
+    xs[1] = 2 ** 70
+    assert list(xs) == [1, 2 ** 70]
+    ds = new_array('double', 2)
+    ds[0] = 1
+    assert list(ds) == [1, None] and type(ds[0]) == int
+
+
+def test_typed_array_program(capsys):
+    program = (
+        'void main() { \n'
+        '  array int xs = new int[4]; \n'
+        '  array double ds = new double[2]; \n'
+        '  array string ss = new string[2]; \n'
+        '  for (int i = 1; i < 4; i = i + 1) { xs[i] = xs[i - 1] + i; } \n'
+        '  ds[1] = 0.5; ss[0] = "s"; \n'
+        '  print(xs[3]); print(ds[0]); print(ds[1]); print(ss[0]); \n'
+        '} \n'
+    )
+    with pytest.raises(MyPLError):
+        # xs[0] is null
+        build(program).run()
+    program = program.replace('new int[4];', 'new int[4]; xs[0] = 0;')
+    build(program).run()
+    assert capsys.readouterr().out == '6null0.5s'
+
+
+#----------------------------------------------------------------------
+# Struct layout
+#----------------------------------------------------------------------
+
+STRUCT_PROGRAM = (
+    'struct Node { int val; Node next; } \n'
+    'struct List { array Node nodes; Node head; } \n'
+    'void main() { \n'
+    '  List l = new List(new Node[2], null); \n'
+    '  l.head = new Node(1, new Node(2, null)); \n'
+    '  l.nodes[1] = l.head.next; \n'
+    '  l.nodes[1].val = l.nodes[1].val + 40; \n'
+    '  print(l.head.val); print(l.head.next.val); \n'
+    '} \n'
+)
+
+def test_struct_fields_use_offsets():
+    vm = build(STRUCT_PROGRAM)
+    code = [str(instr) for instr in vm.frame_templates['main'].instructions]
+    assert code[:6] == [
+        'OpCode.ALLOCS(2)  // List', 'OpCode.DUP()', 'OpCode.PUSH(2)',
+        'OpCode.ALLOCA()', 'OpCode.SETF(0)  // nodes', 'OpCode.DUP()']
+    assert 'OpCode.GETF(1)  // next' in code
+
+
+def test_struct_program(capsys):
+    vm = build(STRUCT_PROGRAM)
+    vm.run()
+    assert capsys.readouterr().out == '142'
+    assert [len(obj) for obj in vm.struct_heap.values()] == [2, 2, 2]
+
+
+#----------------------------------------------------------------------
+# Garbage collection
+#----------------------------------------------------------------------
+
+GC_PROGRAM = (
+    'struct Node { int val; Node next; array Node kids; } \n'
+    'void main() { \n'
+    '  Node keep = new Node(1, new Node(2, null, null), new Node[2]); \n'
+    '  keep.kids[1] = new Node(3, null, null); \n'
+    '  for (int i = 0; i < 50; i = i + 1) { Node tmp = new Node(i, null, new Node[3]); } \n'
+    '  print(keep.val + keep.next.val + keep.kids[1].val); \n'
+    '} \n'
+)
+
+
+def test_gc_frees_unreachable_objects(capsys):
+    vm = build(GC_PROGRAM, gc_threshold=10)
+    vm.run()
+    # keep (and the objects it refers to) survived the collections
+    assert capsys.readouterr().out == '6'
+    assert vm.gc.stats.collections == 10
+    assert vm.gc.stats.allocated == 104
+    assert len(vm.struct_heap) + len(vm.array_heap) == 104 - vm.gc.stats.freed
+    assert vm.gc.stats.freed >= 90
+    # nothing is reachable once main returns
+    vm.gc.collect()
+    assert vm.struct_heap == {} and vm.array_heap == {}
+
+
+def test_gc_disabled():
+    vm = build(GC_PROGRAM, gc_threshold=0)
+    vm.run()
+    assert vm.gc.stats.collections == 0
+    assert len(vm.struct_heap) + len(vm.array_heap) == 104
+
+
+#----------------------------------------------------------------------
+# Register IR
+#----------------------------------------------------------------------
+
+def test_register_ir_lowers_arithmetic_and_jumps():
+    template = VMFrameTemplate('main', 0)
+    template.instructions += [PUSH(0), STORE(0), LOAD(0), PUSH(10), CMPLT(),
+                              JMPF(12), LOAD(0), PUSH(1), ADD(), STORE(0),
+                              JMP(2), NOP(), NOP(), LOAD(0), WRITE()]
+    lower_to_registers(template)
+    assert [str(instr) for instr in template.instructions] == [
+        'OpCode.MOVI(0, 0)', 'OpCode.CMPLTRI(1, 0, 10)', 'OpCode.JMPFR(1, 6)',
+        'OpCode.ADDRI(0, 0, 1)', 'OpCode.JMP(1)', 'OpCode.NOP()',
+        'OpCode.NOP()', 'OpCode.LOAD(0)', 'OpCode.WRITE()']
+    assert template.var_count == 2
+
+
+def test_register_ir_keeps_pending_reads_of_stored_variable(capsys):
+    # the first LOAD(0) must read x before the second STORE(0)
+    vm = VM()
+    main = VMFrameTemplate('main', 0)
+    main.instructions += [PUSH(2), STORE(0), LOAD(0), PUSH(5), STORE(0),
+                          LOAD(0), SUB(), WRITE()]
+    lower_to_registers(main)
+    vm.add_frame_template(main)
+    assert OpCode.SUBRR not in [instr.opcode for instr in main.instructions]
+    vm.run()
+    captured = capsys.readouterr()
+    assert captured.out == '-3'
+
+
+def test_register_ir_matches_stack_ir(capsys):
+    build(FAST_PROGRAM).run()
+    expected = capsys.readouterr().out
+    build(FAST_PROGRAM, registers=True).run()
+    captured = capsys.readouterr()
+    assert captured.out == expected
+
+
+def test_register_ir_runtime_error():
+    program = 'void main() { int x = 0; int y = 3 / x; }'
+    with pytest.raises(MyPLError) as e:
+        build(program, registers=True).run()
+    assert str(e.value) == 'VM Error: Invalid division by zero'
+
+
+#----------------------------------------------------------------------
+# Fast (compiled) mode
+#----------------------------------------------------------------------
+
+FAST_PROGRAM = (
+    'struct Node { int val; Node next; } \n'
+    'int count(Node n) { \n'
+    '  int c = 0; \n'
+    '  while (n != null) { c = c + n.val; n = n.next; } \n'
+    '  return c; \n'
+    '} \n'
+    'void main() { \n'
+    '  Node head = null; \n'
+    '  array int xs = new int[10]; \n'
+    '  for (int i = 0; i < 10; i = i + 1) { \n'
+    '    head = new Node(i, head); \n'
+    '    xs[i] = i * i; \n'
+    '  } \n'
+    '  if (count(head) == 45) { print("ok "); } \n'
+    '  elseif (false) { print("bad "); } \n'
+    '  else { print("no "); } \n'
+    '  print(xs[9] / 2); print(" "); print(itos(7) + "!"); \n'
+    '} \n'
+)
+
+
+def test_fast_mode_matches_vm(capsys):
+    build(FAST_PROGRAM).run()
+    expected = capsys.readouterr().out
+    FrameCompiler(build(FAST_PROGRAM)).run()
+    captured = capsys.readouterr()
+    assert captured.out == expected == 'ok 40 7!'
+
+
+def test_fast_mode_recursive_tail_calls(capsys):
+    # sum recurses far past the python recursion limit
+    FrameCompiler(build(TAIL_CALL_PROGRAM)).run()
+    assert capsys.readouterr().out == '5000050000 false'
+
+
+def test_fast_mode_unstructured_jumps(capsys):
+    # jumps into the middle of a "then" part cannot be structured, so
+    # the compiler falls back to dispatching on basic blocks
+    vm = VM()
+    main = VMFrameTemplate('main', 0)
+    main.instructions += [JMP(4), PUSH(True), JMPF(6), PUSH('x'),
+                          PUSH('a'), WRITE(), PUSH(None), RET()]
+    vm.add_frame_template(main)
+    compiler = FrameCompiler(vm)
+    compiler.run()
+    assert 'pc = 0' in compiler.source
+    captured = capsys.readouterr()
+    assert captured.out == 'a'
+
+
+def test_fast_mode_runtime_error(capsys):
+    program = 'void main() { array int xs = new int[2]; xs[2] = 1; }'
+    with pytest.raises(MyPLError) as e:
+        FrameCompiler(build(program)).run()
+    assert str(e.value) == 'VM Error: Cannot reach index 2'